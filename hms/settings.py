@@ -49,9 +49,11 @@ MIDDLEWARE = [
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
+    "hmsapp.credentials.PendingLoginMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "hmsapp.routers.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "hms.urls"
@@ -77,6 +79,7 @@ TEMPLATES = [
                 "hmsapp.context_processors.hms_stats",
                 "hmsapp.context_processors.doctor_session",
                 'hmsapp.context_processors.user_type_check',
+                "hmsapp.caching.cache_generations",
             ],
         },
     },
@@ -92,6 +95,11 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Take the write lock at BEGIN so read-then-write transactions
+            # wait on busy_timeout instead of failing with "database is locked"
+            "transaction_mode": "IMMEDIATE",
+        },
     }
     # For PostgreSQL (production):
     # "default": {
@@ -105,6 +113,61 @@ DATABASES = {
 }
 
 
+# SQLite pragma profile applied to each new connection (hmsapp/sqlite.py):
+# 'legacy' (rollback journal), 'production' (WAL + NORMAL) or 'durable' (WAL + FULL)
+HMS_SQLITE_PROFILE = "production"
+HMS_SQLITE_PRAGMAS = {}            # per-pragma overrides, e.g. {"busy_timeout": 10000}
+
+
+# Read replicas for GET requests (hmsapp/routers.py). A local SQLite replica:
+#   DATABASES["replica"] = {
+#       "ENGINE": "django.db.backends.sqlite3",
+#       "NAME": BASE_DIR / "db-replica.sqlite3",
+#       "TEST": {"MIRROR": "default"},
+#   }
+#   HMS_READ_REPLICAS = ["replica"]
+# refreshed by `python manage.py hms_sync_replica --interval 5`
+HMS_READ_REPLICAS = []
+HMS_REPLICA_STICKY_SECONDS = 10    # writers read from the primary this long (> replica lag)
+
+
+# Optional per-hospital sharding (hmsapp/sharding.py): cases, appointments and
+# home care requests of the listed hospital ids live in that alias, e.g.
+#   DATABASES["shard1"] = {"ENGINE": "django.db.backends.sqlite3",
+#                          "NAME": BASE_DIR / "db-shard1.sqlite3"}
+#   HMS_SHARDS = {"shard1": [1, 2]}
+# then run `python manage.py hms_shards`. Append new shards at the end:
+# a shard's position fixes its id block.
+DATABASE_ROUTERS = ["hmsapp.sharding.ShardRouter", "hmsapp.routers.ReplicaRouter"]
+HMS_SHARDS = {}
+HMS_SHARD_ID_BLOCK = 10**12        # ids of shard n start at n * block
+HMS_SHARD_FANOUT_WORKERS = 8       # threads for cross-shard queries
+
+
+# Completed/Cancelled cases older than this move to the archive table
+# (`python manage.py hms_archive`, hmsapp/archive.py)
+HMS_ARCHIVE_AFTER_DAYS = 30
+
+
+# ===============================
+# CACHE CONFIGURATION
+# ===============================
+# Use a shared backend (Redis/Memcached) when running several processes
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "hms-default",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    }
+}
+
+HMS_PAGE_CACHE_ENABLED = True
+HMS_PAGE_CACHE_TIMEOUT = 60        # seconds a public page stays cached
+HMS_FRAGMENT_CACHE_TIMEOUT = 600   # hospital cards / queue rows
+HMS_STATS_CACHE_TIMEOUT = 300      # footer statistics (hms_stats)
+HMS_CACHE_LOCK_TIMEOUT = 10        # max wait for another process' render
+
+
 # ===============================
 # PASSWORD VALIDATION
 # ===============================
@@ -124,6 +187,64 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Auto-created patient accounts store a pending marker instead of running
+# PBKDF2 in the request; see hmsapp/credentials.py
+HMS_DEFERRED_PASSWORD_HASHING = True
+HMS_PASSWORD_HASH_WORKER = True    # hash in a background thread after commit
+
+
+# Doctor activity log entries are buffered in memory and written in batches
+# by a background thread (hmsapp/activity.py); False writes each one inline
+HMS_ACTIVITY_LOG_BUFFERED = True
+HMS_ACTIVITY_LOG_FLUSH_SIZE = 200       # entries that trigger an early flush
+HMS_ACTIVITY_LOG_FLUSH_INTERVAL = 2.0   # seconds between flushes
+HMS_ACTIVITY_LOG_SPOOL = BASE_DIR / "activity-spool.jsonl"   # batches the database refused
+HMS_ACTIVITY_LOG_RETENTION_DAYS = 90   # older rows go to gzip JSONL files (hms_log_retention)
+HMS_ACTIVITY_LOG_ARCHIVE_DIR = BASE_DIR / "archive" / "activity"
+
+
+# Appointment availability (hmsapp/availability.py): bookable start times
+# are offered every HMS_SLOT_STEP_MINUTES within each doctor's work hours
+HMS_SLOT_STEP_MINUTES = 15
+HMS_SLOT_SEARCH_DAYS = 14       # how far ahead /api/slots/next/ looks
+HMS_SLOT_CACHE_TIMEOUT = 3600   # seconds a doctor-day bitmap stays cached
+HMS_SLOT_HOLDS = True           # selecting a time holds it for other patients
+HMS_SLOT_HOLD_SECONDS = 120
+
+
+# Doctor dashboard agenda (hmsapp/agenda.py), patched in place on every
+# case/appointment change; the timeout is only a safety net
+HMS_AGENDA_CACHE_TIMEOUT = 600
+
+
+# Home visit dispatch (hmsapp/geo.py): nearest available doctor from an
+# in-memory grid of positions; ETA = distance * road factor at city speed
+HMS_GEO_CELL_DEGREES = 0.01         # grid cell, about 1.1 km
+HMS_ROAD_FACTOR = 1.4               # road km per straight-line km
+HMS_DISPATCH_SPEED_KMH = 25
+HMS_DISPATCH_HANDOFF_MINUTES = 3    # added to every ETA
+HMS_DISPATCH_SPECIALIST_KM = 3      # extra distance accepted for the right specialization
+HMS_DISPATCH_RADIUS_KM = 50         # farther doctors are not searched (no home visit by position)
+
+# Doctor location pings (POST /api/location/) are kept in memory; positions
+# that changed are written to Doctor in one UPDATE per interval (hmsapp/locations.py)
+HMS_LOCATION_FLUSH_INTERVAL = 5.0   # seconds
+HMS_GEO_INDEX_REFRESH_SECONDS = 15  # re-read positions other processes wrote
+
+# Offline geocoding of typed locations/addresses (hmsapp/geocoder.py)
+HMS_GAZETTEER = BASE_DIR / "hmsapp" / "data" / "gazetteer.csv"   # city / locality / PIN centroids
+HMS_GEOCODE_CACHE_SIZE = 4096       # texts kept per process; all are memoized in GeocodeMemo
+HMS_GEOCODE_MIN_SCORE = 0.85        # similarity needed for a misspelt name to match
+
+# Admin changelists count at most this many rows; past it an unfiltered list
+# shows the table's sqlite_stat1 estimate (refreshed by hms_dbmaint) instead
+HMS_ADMIN_COUNT_LIMIT = 10000
+
+# Doctor/hospital pickers on the booking form (hmsapp/autocomplete.py): prefix
+# tries per process, rebuilt when a name, specialization or bookability changes
+HMS_AUTOCOMPLETE_REFRESH_SECONDS = 10   # how often other processes' changes are checked for
+
+
 # ===============================
 # INTERNATIONALIZATION
 # ===============================
@@ -165,6 +286,9 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # SESSION CONFIGURATION
 # ===============================
 SESSION_COOKIE_AGE = 86400  # 24 hours in seconds
+# Sessions are read from the cache (each request, e.g. every location ping,
+# would otherwise SELECT django_session) and written through to the database
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
 
@@ -36,7 +36,9 @@ urlpatterns = [
     path('doctor/login/', views.doctor, name='doctor-login'),
     path('doctor/logout/', views.doctor_logout, name='doctor-logout'),
     path('doctor/dashboard/', views.doctor_dashboard, name='doctor-dashboard'),
+    path('doctor/history/', views.doctor_history, name='doctor-history'),
     path('doctor/case/<int:case_id>/update/', views.update_case_status, name='update-case'),
+    path('doctor/cases/bulk-update/', views.bulk_update_cases, name='bulk-update-cases'),
     
     # ===============================
     # APPOINTMENT URLs
@@ -61,6 +63,15 @@ urlpatterns = [
     path('api/emergency-cases/', views.api_emergency_cases, name='api-emergency-cases'),
     path('api/doctor-cases/', views.api_doctor_cases, name='api-doctor-cases'),
     path('api/hospitals/', views.api_hospitals, name='api-hospitals'),
+    path('api/bootstrap/', views.api_bootstrap, name='api-bootstrap'),
+    path('api/slots/', views.api_slots, name='api-slots'),
+    path('api/slots/next/', views.api_next_slot, name='api-next-slot'),
+    path('api/slots/hold/', views.api_hold_slot, name='api-hold-slot'),
+    path('api/location/', views.api_location, name='api-location'),
+    path('api/tracking/', views.api_tracking, name='api-tracking'),
+    path('api/search/', views.api_search, name='api-search'),
+    path('api/autocomplete/', views.api_autocomplete, name='api-autocomplete'),
+    path('api/export/<str:kind>/', views.api_export, name='api-export'),
     
     # ===============================
     # ADMIN DASHBOARD
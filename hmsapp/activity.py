@@ -0,0 +1,225 @@
+"""
+Write-behind buffer for DoctorActivityLog
+
+log_activity() / log_activities() are how views record doctor activity. With
+HMS_ACTIVITY_LOG_BUFFERED the entry is appended to an in-memory buffer and
+the request moves on; a background thread writes the buffer with one
+bulk_create every HMS_ACTIVITY_LOG_FLUSH_INTERVAL seconds, or sooner once
+HMS_ACTIVITY_LOG_FLUSH_SIZE entries are waiting. Entries keep the time they
+were logged, not the time they were flushed.
+
+Nothing is dropped on purpose: the buffer is flushed at interpreter exit,
+and a batch the database refuses is appended to HMS_ACTIVITY_LOG_SPOOL
+(JSON lines) and replayed by the next flush or `manage.py hms_flush_activity`.
+A flush renames the spool to a private file and deletes it only once its
+entries are committed, so a flush that fails or dies leaves them for the
+next one; an OS file lock keeps the processes of a server off each other.
+A hard kill can still lose up to one interval of buffered entries.
+Without HMS_ACTIVITY_LOG_BUFFERED (tests) every entry is written inline.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Doctor, DoctorActivityLog
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process _flush_lock
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_flush_lock = threading.Lock()  # one flush (and spool writer) per process at a time
+_wakeup = threading.Event()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def buffering_enabled():
+    return getattr(settings, 'HMS_ACTIVITY_LOG_BUFFERED', False)
+
+
+def spool_path():
+    return str(getattr(settings, 'HMS_ACTIVITY_LOG_SPOOL',
+                       os.path.join(settings.BASE_DIR, 'activity-spool.jsonl')))
+
+
+def log_activity(doctor_id, action, description=''):
+    """Record a DoctorActivityLog entry (buffered unless disabled)"""
+    log_activities(doctor_id, action, [description])
+
+
+def log_activities(doctor_id, action, descriptions):
+    """Record several entries at once (one bulk_create when written inline)"""
+    now = timezone.now()
+    entries = [
+        {'doctor_id': doctor_id, 'action': action, 'description': description, 'timestamp': now}
+        for description in descriptions
+    ]
+    if not entries:
+        return
+    if not buffering_enabled():
+        _save(entries)
+        return
+    with _buffer_lock:
+        _buffer.extend(entries)
+        full = len(_buffer) >= getattr(settings, 'HMS_ACTIVITY_LOG_FLUSH_SIZE', 200)
+    _ensure_flusher()
+    if full:
+        _wakeup.set()
+
+
+def pending_count():
+    with _buffer_lock:
+        return len(_buffer)
+
+
+# ===============================
+# WRITING
+# ===============================
+def _save(entries):
+    """bulk_create the entries; drop those whose doctor has been deleted since"""
+    try:
+        with transaction.atomic():
+            DoctorActivityLog.objects.bulk_create(
+                [DoctorActivityLog(**entry) for entry in entries], batch_size=500
+            )
+    except IntegrityError:
+        # CASCADE would have removed these rows together with the doctor
+        existing = set(Doctor.objects.filter(
+            pk__in={entry['doctor_id'] for entry in entries}
+        ).values_list('pk', flat=True))
+        kept = [entry for entry in entries if entry['doctor_id'] in existing]
+        if len(kept) == len(entries):
+            raise
+        with transaction.atomic():
+            DoctorActivityLog.objects.bulk_create(
+                [DoctorActivityLog(**entry) for entry in kept], batch_size=500
+            )
+
+
+def flush():
+    """Write buffered (and spooled) entries now; return how many were written"""
+    with _flush_lock:
+        with _buffer_lock:
+            entries = _buffer[:]
+            _buffer.clear()
+        spooled, claimed = _take_spool()
+        try:
+            if not spooled and not entries:
+                return 0
+            try:
+                _save(spooled + entries)
+            except DatabaseError:
+                logger.exception('Could not write %d activity log entries; spooling them',
+                                 len(spooled) + len(entries))
+                _spool(entries)  # spooled ones stay in their claimed files
+                return 0
+            for f in claimed:
+                os.remove(f.name)  # committed
+            return len(spooled) + len(entries)
+        finally:
+            for f in claimed:
+                f.close()  # releases the claim; a file still there is retried
+
+
+# ===============================
+# SPOOL FILE
+# ===============================
+def _lock(f, blocking=True):
+    """Exclusive flock() on `f`; False if another process holds it and not `blocking`"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+
+@contextmanager
+def _spool_lock():
+    """Serialize appending to and claiming the spool across processes"""
+    with open(spool_path() + '.lock', 'a') as f:
+        _lock(f)
+        yield  # closing the file releases the lock
+
+
+def _spool(entries):
+    with _spool_lock(), open(spool_path(), 'a', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps({**entry, 'timestamp': entry['timestamp'].isoformat()}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _take_spool():
+    """
+    Claim the spool, and batches left by flushes that failed or died: each
+    is a private '<spool>.<id>.taken' file, held locked (open) until the
+    caller deletes it once committed. Returns (entries, open claimed files).
+    """
+    path = spool_path()
+    with _spool_lock():
+        if os.path.exists(path):
+            os.replace(path, f'{path}.{uuid.uuid4().hex}.taken')
+    entries, claimed = [], []
+    for taken in sorted(glob.glob(glob.escape(path) + '.*.taken')):
+        try:
+            f = open(taken, encoding='utf-8')
+        except FileNotFoundError:
+            continue  # committed by the process that claimed it
+        if not _lock(f, blocking=False) or not _same_file(f, taken):
+            f.close()  # being flushed elsewhere, or just committed
+            continue
+        claimed.append(f)
+        entries.extend(json.loads(line) for line in f if line.strip())
+    for entry in entries:
+        entry['timestamp'] = parse_datetime(entry['timestamp'])
+    return entries, claimed
+
+
+def _same_file(f, path):
+    try:
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+# ===============================
+# BACKGROUND FLUSHER
+# ===============================
+def _run_flusher():
+    while True:
+        _wakeup.wait(getattr(settings, 'HMS_ACTIVITY_LOG_FLUSH_INTERVAL', 2.0))
+        _wakeup.clear()
+        try:
+            if flush():
+                close_old_connections()
+        except Exception:
+            logger.exception('Activity log flush failed')
+
+
+def _ensure_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            if _flusher is None:
+                atexit.register(flush)
+            _flusher = threading.Thread(target=_run_flusher, name='hms-activity-log', daemon=True)
+            _flusher.start()
@@ -1,8 +1,54 @@
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 from .models import (
     Doctor, Patient, EmergencyCase, Appointment,
-    Hospital, HomeCareRequest, DoctorActivityLog
+    Hospital, HomeCareRequest, DoctorActivityLog, ArchivedEmergencyCase
 )
+from .search import filter_queryset
+from .sqlite import row_estimate
+
+
+# ===============================
+# LARGE TABLES
+# ===============================
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts at most HMS_ADMIN_COUNT_LIMIT rows. Past that, an unfiltered list
+    reports the table's row estimate and a filtered one stops at the limit,
+    so no changelist page counts a whole table.
+    """
+    
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'HMS_ADMIN_COUNT_LIMIT', 10000)
+        queryset = self.object_list
+        counted = queryset.order_by()[:limit + 1].count()
+        if counted <= limit:
+            return counted
+        if queryset.query.has_filters():
+            return limit
+        estimate = row_estimate(connections[queryset.db], queryset.model._meta.db_table)
+        return max(estimate or 0, limit)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow without bound"""
+    
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False         # no second, unfiltered COUNT(*)
+    show_facets = admin.ShowFacets.NEVER   # a COUNT per filter choice
+    
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index where the model has one (search.py), else LIKE
+        matched = filter_queryset(queryset, search_term) if search_term else None
+        if matched is None:
+            return super().get_search_results(request, queryset, search_term)
+        return matched, False
 
 
 # ===============================
@@ -15,6 +61,7 @@ class DoctorAdmin(admin.ModelAdmin):
     search_fields = ['name', 'doctor_id', 'email', 'phone']
     list_editable = ['status']
     ordering = ['name']
+    autocomplete_fields = ['user']
     
     fieldsets = (
         ('Basic Information', {
@@ -34,26 +81,55 @@ class DoctorAdmin(admin.ModelAdmin):
 # PATIENT ADMIN
 # ===============================
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(LargeTableAdmin):
     list_display = ['name', 'patient_id', 'phone', 'age', 'gender', 'created_at']
     list_filter = ['gender', 'created_at']
     search_fields = ['name', 'patient_id', 'phone', 'email']
     ordering = ['-created_at']
+    autocomplete_fields = ['user']
 
 
 # ===============================
 # EMERGENCY CASE ADMIN
 # ===============================
+class VersionInput(forms.HiddenInput):
+    """Hidden version field that also shows the number (changelist column)"""
+    
+    def render(self, name, value, attrs=None, renderer=None):
+        return format_html('{}v{}', super().render(name, value, attrs, renderer), value)
+
+
+class EmergencyCaseAdminForm(forms.ModelForm):
+    """Posts back the version the admin loaded; a stale one fails validation"""
+    
+    class Meta:
+        model = EmergencyCase
+        fields = '__all__'
+        widgets = {'version': VersionInput}
+    
+    def clean_version(self):
+        version = self.cleaned_data['version']
+        if self.instance.pk and version != self.instance.version:
+            raise forms.ValidationError(
+                f'Case changed by someone else since this page was loaded '
+                f'(now {self.instance.status}, version {self.instance.version}). Reload and try again.'
+            )
+        return version
+
+
 @admin.register(EmergencyCase)
-class EmergencyCaseAdmin(admin.ModelAdmin):
+class EmergencyCaseAdmin(LargeTableAdmin):
+    form = EmergencyCaseAdminForm
     list_display = [
         'token', 'patient_name', 'symptom', 'priority', 
-        'assigned_doctor', 'status', 'mode', 'created_at'
+        'assigned_doctor', 'status', 'version', 'mode', 'created_at'
     ]
     list_filter = ['priority', 'status', 'symptom', 'mode', 'created_at']
-    search_fields = ['token', 'patient_name', 'symptom_description']
-    list_editable = ['status']
-    ordering = ['score', 'created_at']
+    search_fields = ['token', 'patient_name', 'patient_phone', 'symptom_description']
+    list_editable = ['status', 'version']
+    list_select_related = ['assigned_doctor']
+    ordering = ['score', 'created_at', 'pk']  # total order: walks hmsapp_case_order_idx
+    autocomplete_fields = ['patient', 'assigned_doctor']
     
     fieldsets = (
         ('Patient Information', {
@@ -66,21 +142,46 @@ class EmergencyCaseAdmin(admin.ModelAdmin):
             'fields': ('assigned_doctor', 'status', 'mode')
         }),
         ('Tracking', {
-            'fields': ('token', 'eta')
+            'fields': ('token', 'eta', 'version')
         }),
     )
     
-    # Color coding by priority
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.select_related('patient', 'assigned_doctor')
+    def get_changelist_form(self, request, **kwargs):
+        return super().get_changelist_form(request, form=EmergencyCaseAdminForm, **kwargs)
+    
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Conditional UPDATE of the edited columns only
+        changes = {name: getattr(obj, name) for name in form.changed_data if name != 'version'}
+        if changes and not obj.save_if_current(form.cleaned_data['version'], **changes):
+            messages.error(request, f'{obj.token} was not saved: someone else changed it meanwhile.')
+
+
+@admin.register(ArchivedEmergencyCase)
+class ArchivedEmergencyCaseAdmin(LargeTableAdmin):
+    list_display = [
+        'token', 'patient_name', 'symptom', 'priority',
+        'assigned_doctor', 'status', 'created_at', 'archived_at'
+    ]
+    list_filter = ['status', 'priority', 'archived_at']
+    search_fields = ['token', 'patient_name', 'patient_phone']
+    list_select_related = ['assigned_doctor']
+    ordering = ['-created_at']
+    
+    # History is read-only; rows only arrive through hms_archive
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 # ===============================
 # APPOINTMENT ADMIN
 # ===============================
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(LargeTableAdmin):
     list_display = [
         'patient_name', 'doctor', 'appointment_date', 
         'appointment_time', 'status', 'created_at'
@@ -88,8 +189,11 @@ class AppointmentAdmin(admin.ModelAdmin):
     list_filter = ['status', 'appointment_date', 'created_at']
     search_fields = ['patient_name', 'reason']
     list_editable = ['status']
-    ordering = ['appointment_date', 'appointment_time']
-    date_hierarchy = 'appointment_date'
+    list_select_related = ['doctor']
+    ordering = ['appointment_date', 'appointment_time', 'pk']  # walks hmsapp_appt_day_idx
+    # No date_hierarchy: its year/month links are a DISTINCT over the whole
+    # table; the appointment_date filter gives index range scans instead
+    autocomplete_fields = ['patient', 'doctor', 'hospital']
 
 
 # ===============================
@@ -110,7 +214,7 @@ class HospitalAdmin(admin.ModelAdmin):
 # HOME CARE REQUEST ADMIN
 # ===============================
 @admin.register(HomeCareRequest)
-class HomeCareRequestAdmin(admin.ModelAdmin):
+class HomeCareRequestAdmin(LargeTableAdmin):
     list_display = [
         'token', 'patient_name', 'issue', 'mode', 
         'assigned_doctor', 'status', 'created_at'
@@ -118,16 +222,19 @@ class HomeCareRequestAdmin(admin.ModelAdmin):
     list_filter = ['issue', 'mode', 'status', 'created_at']
     search_fields = ['token', 'patient_name', 'phone', 'address']
     list_editable = ['status']
+    list_select_related = ['assigned_doctor']
     ordering = ['-created_at']
+    autocomplete_fields = ['assigned_doctor', 'hospital']
 
 
 # ===============================
 # DOCTOR ACTIVITY LOG ADMIN
 # ===============================
 @admin.register(DoctorActivityLog)
-class DoctorActivityLogAdmin(admin.ModelAdmin):
+class DoctorActivityLogAdmin(LargeTableAdmin):
     list_display = ['doctor', 'action', 'description', 'timestamp']
     list_filter = ['action', 'timestamp']
     search_fields = ['doctor__name', 'description']
+    list_select_related = ['doctor']
     ordering = ['-timestamp']
     readonly_fields = ['doctor', 'action', 'description', 'timestamp']
@@ -0,0 +1,185 @@
+"""
+Doctor-day agenda for doctor_dashboard
+
+agenda_for() returns one view model per doctor and day: the doctor's open
+cases (not Completed/Cancelled) and today's appointments, merged into one
+timeline, plus the counts the dashboard header shows. Both queries only
+touch what is open today (indexes on (assigned_doctor, status) and
+(doctor, appointment_date)), so the cost does not grow with the doctor's
+history; closed cases are paged separately by archive.case_history_page().
+
+The agenda is built once and cached per doctor and day. signals.py patches
+single entries after every committed save/delete of an EmergencyCase or
+Appointment (case_changed / appointment_changed); bulk_set_status() patches
+statuses with cases_updated(). With nothing cached to patch, the doctor's
+'agenda:<doctor id>' generation is bumped instead, so a build that read the
+database before the change is never served.
+"""
+
+import threading
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import sharding
+from .caching import bump_generation, get_generations, single_flight
+from .models import Appointment, EmergencyCase
+
+
+OPEN_CASE_STATUSES = ('Waiting', 'Doctor Assigned', 'In Progress', 'Doctor En Route')
+
+_LOCK_STRIPES = [threading.Lock() for _ in range(16)]  # one patcher per doctor at a time
+
+
+def cache_timeout():
+    return getattr(settings, 'HMS_AGENDA_CACHE_TIMEOUT', 600)
+
+
+def _key(doctor_id, day):
+    generation = get_generations([f'agenda:{doctor_id}'])[0]
+    return f'hms:agenda:{doctor_id}:{day.isoformat()}:{generation}'
+
+
+# ===============================
+# ENTRIES
+# ===============================
+def case_entry(case):
+    return {
+        'kind': 'case',
+        'id': case.pk,
+        'token': case.token,
+        'patient_name': case.patient_name,
+        'symptom': case.get_symptom_display(),
+        'mode': case.mode,
+        'priority': case.priority,
+        'score': case.score,
+        'status': case.status,
+        'version': case.version,
+        'created_at': case.created_at,
+    }
+
+
+def appointment_entry(appointment):
+    return {
+        'kind': 'appointment',
+        'id': appointment.pk,
+        'patient_name': appointment.patient_name,
+        'reason': appointment.reason,
+        'status': appointment.status,
+        'time': appointment.appointment_time,
+        'duration': appointment.duration_minutes,
+    }
+
+
+def _sort_cases(entries):
+    entries.sort(key=lambda entry: (entry['score'], entry['created_at']))
+
+
+def _sort_appointments(entries):
+    entries.sort(key=lambda entry: entry['time'])
+
+
+def _build(doctor_id, day):
+    cases = sharding.collect(EmergencyCase.objects.filter(
+        assigned_doctor_id=doctor_id, status__in=OPEN_CASE_STATUSES
+    ).order_by('score', 'created_at'))
+    appointments = sharding.collect(Appointment.objects.filter(
+        doctor_id=doctor_id, appointment_date=day
+    ).order_by('appointment_time'))
+    return {
+        'cases': [case_entry(case) for case in cases],
+        'appointments': [appointment_entry(appointment) for appointment in appointments],
+    }
+
+
+def _timeline(data, day):
+    """Cases by arrival (those from earlier days first), appointments by time"""
+    items = []
+    for entry in data['cases']:
+        arrived = timezone.localtime(entry['created_at'])
+        items.append(((arrived.date() >= day, arrived.time()), {**entry, 'time': arrived.time(),
+                                                                 'carried_over': arrived.date() < day}))
+    for entry in data['appointments']:
+        items.append(((True, entry['time']), entry))
+    return [entry for _, entry in sorted(items, key=lambda item: item[0])]
+
+
+def agenda_for(doctor_id, day=None):
+    """The doctor's agenda for `day` (today): cases, appointments, timeline and counts"""
+    day = day or timezone.localdate()
+    data = single_flight(_key(doctor_id, day), lambda: _build(doctor_id, day), cache_timeout())
+    return {
+        'day': day,
+        'cases': data['cases'],
+        'appointments': data['appointments'],
+        'timeline': _timeline(data, day),
+        'open_cases': len(data['cases']),
+        'waiting_cases': sum(1 for entry in data['cases'] if entry['status'] == 'Waiting'),
+    }
+
+
+# ===============================
+# INCREMENTAL UPDATES
+# ===============================
+def _patch(doctor_id, change, day=None):
+    """Apply change(data) to the doctor's cached agenda, or invalidate it"""
+    day = day or timezone.localdate()
+    with _LOCK_STRIPES[zlib.crc32(str(doctor_id).encode()) % len(_LOCK_STRIPES)]:
+        key = _key(doctor_id, day)
+        data = cache.get(key)
+        if data is None:
+            bump_generation(f'agenda:{doctor_id}')  # a build in flight may predate the change
+            return
+        change(data)
+        cache.set(key, data, cache_timeout())
+
+
+def case_changed(case_id, doctor_ids, entry=None):
+    """
+    Re-file one case: drop it from the agendas of `doctor_ids` (its old and
+    new doctor) and add `entry` (None for a closed or deleted case) to the
+    agenda of the doctor it is assigned to now.
+    """
+    def change(data, doctor_id):
+        data['cases'] = [item for item in data['cases'] if item['id'] != case_id]
+        if entry is not None and entry['doctor_id'] == doctor_id:
+            data['cases'].append({key: value for key, value in entry.items() if key != 'doctor_id'})
+            _sort_cases(data['cases'])
+
+    for doctor_id in doctor_ids:
+        _patch(doctor_id, lambda data: change(data, doctor_id))
+
+
+def appointment_changed(appointment_id, doctor_ids, entry=None):
+    """Like case_changed(); `entry` carries 'doctor_id' and 'date' and is only kept for today"""
+    today = timezone.localdate()
+
+    def change(data, doctor_id):
+        data['appointments'] = [item for item in data['appointments'] if item['id'] != appointment_id]
+        if entry is not None and entry['doctor_id'] == doctor_id and entry['date'] == today:
+            data['appointments'].append({key: value for key, value in entry.items()
+                                         if key not in ('doctor_id', 'date')})
+            _sort_appointments(data['appointments'])
+
+    for doctor_id in doctor_ids:
+        _patch(doctor_id, lambda data: change(data, doctor_id), day=today)
+
+
+def cases_updated(doctor_id, updates):
+    """New status and version for several of the doctor's cases ({id, status, version} dicts)"""
+    updates = {update['id']: update for update in updates}
+
+    def change(data):
+        kept = []
+        for item in data['cases']:
+            update = updates.get(item['id'])
+            if update is not None:
+                if update['status'] not in OPEN_CASE_STATUSES:
+                    continue
+                item = {**item, 'status': update['status'], 'version': update['version']}
+            kept.append(item)
+        data['cases'] = kept
+
+    _patch(doctor_id, change)
@@ -7,5 +7,5 @@ class HmsappConfig(AppConfig):
     verbose_name = 'Health Management System'
     
     def ready(self):
-        """Called when the app is ready - can be used for signals"""
-        pass
+        """Called when the app is ready - connects signal handlers"""
+        from . import signals  # noqa: F401
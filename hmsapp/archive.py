@@ -0,0 +1,122 @@
+"""
+Hot/cold partitioning of emergency cases
+
+Completed and Cancelled cases older than settings.HMS_ARCHIVE_AFTER_DAYS are
+moved from EmergencyCase to ArchivedEmergencyCase (same id, same columns).
+The live table then only holds the active queue and recent history.
+Rows move in small batches, each one short transaction
+(INSERT ... SELECT + DELETE), so writers only wait for one batch at a
+time. Run it from cron with `manage.py hms_archive`.
+
+History reads (patient_dashboard, doctor_history) use case_history() or
+case_history_page(), which merge both tables. The active queue never needs
+the archive.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import sharding
+from .caching import bump_generation
+from .models import EmergencyCase, ArchivedEmergencyCase
+
+
+TERMINAL_STATUSES = ('Completed', 'Cancelled')
+
+
+def archive_cutoff(days=None):
+    days = getattr(settings, 'HMS_ARCHIVE_AFTER_DAYS', 30) if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable(alias, cutoff):
+    """Terminal cases on `alias` last updated before `cutoff`"""
+    return EmergencyCase.objects.using(alias).filter(
+        status__in=TERMINAL_STATUSES, updated_at__lt=cutoff
+    )
+
+
+def _move_batch(alias, ids):
+    columns = ', '.join(
+        connections[alias].ops.quote_name(field.column)
+        for field in EmergencyCase._meta.concrete_fields
+    )
+    live = EmergencyCase._meta.db_table
+    archive = ArchivedEmergencyCase._meta.db_table
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {archive} ({columns}, archived_at) '
+            f'SELECT {columns}, %s FROM {live} WHERE id IN ({placeholders})',
+            [timezone.now(), *ids],
+        )
+        cursor.execute(f'DELETE FROM {live} WHERE id IN ({placeholders})', ids)
+
+
+def archive_cases(days=None, batch_size=500, pause=0.05, aliases=None):
+    """
+    Move archivable cases on every shard, `batch_size` rows per transaction
+    with `pause` seconds between batches. Returns a stats dict.
+    """
+    cutoff = archive_cutoff(days)
+    stats = {'moved': 0, 'batches': 0, 'longest_batch': 0.0, 'seconds': 0.0}
+    started = time.perf_counter()
+    for alias in aliases or sharding.shards():
+        while True:
+            batch_started = time.perf_counter()
+            with transaction.atomic(using=alias):
+                ids = list(archivable(alias, cutoff).order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if ids:
+                    _move_batch(alias, ids)
+            if not ids:
+                break
+            stats['moved'] += len(ids)
+            stats['batches'] += 1
+            stats['longest_batch'] = max(stats['longest_batch'], time.perf_counter() - batch_started)
+            if len(ids) < batch_size:
+                break
+            time.sleep(pause)
+    stats['seconds'] = time.perf_counter() - started
+    if stats['moved']:
+        # Raw SQL skips post_delete; cached pages may still list moved cases
+        bump_generation('emergencycase')
+    return stats
+
+
+def case_history(**filters):
+    """
+    Live and archived cases matching `filters`, newest first (from every
+    shard), e.g. case_history(patient=patient). Archived rows are
+    ArchivedEmergencyCase instances with the same fields.
+    """
+    live = sharding.collect(
+        EmergencyCase.objects.filter(**filters)
+        .select_related('assigned_doctor', 'assigned_hospital').order_by('-created_at')
+    )
+    archived = sharding.collect(
+        ArchivedEmergencyCase.objects.filter(**filters)
+        .select_related('assigned_doctor', 'assigned_hospital').order_by('-created_at')
+    )
+    return sorted(live + archived, key=lambda case: case.created_at, reverse=True)
+
+
+def case_history_page(page=1, per_page=20, **filters):
+    """
+    One page of case_history(), newest first. Each table (and shard) returns
+    at most page * per_page + 1 rows, so early pages stay cheap however long
+    the history is. Returns (cases, has_next).
+    """
+    limit = page * per_page + 1
+    rows = []
+    for model in (EmergencyCase, ArchivedEmergencyCase):
+        rows += sharding.collect(
+            model.objects.filter(**filters)
+            .select_related('assigned_doctor', 'assigned_hospital').order_by('-created_at')[:limit]
+        )
+    rows.sort(key=lambda case: case.created_at, reverse=True)
+    start = (page - 1) * per_page
+    return rows[start:start + per_page], len(rows) > start + per_page
@@ -0,0 +1,201 @@
+"""
+Doctor and hospital autocomplete for the booking form (GET /api/autocomplete/)
+
+Each kind of entry has a PrefixTrie over the words of its labels (doctor
+name and specialization, hospital name). Entries are added best first, so
+every trie node lists the entries under it already ranked: the top k for a
+typed prefix are the first k of one node, a walk of len(prefix) dict
+lookups however many doctors there are.
+
+The tries are built from the database on first use. A committed Doctor or
+Hospital change that alters what is listed (see signals.py) drops the trie
+and bumps its cache generation; other processes check the generation every
+HMS_AUTOCOMPLETE_REFRESH_SECONDS. Doctors going available/busy, the
+frequent change, list the same and rebuild nothing.
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .availability import BOOKABLE_DOCTOR_STATUSES
+from .caching import bump_generation, get_generations
+from .models import Doctor, Hospital
+
+
+WORD_RE = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD_RE.findall(text.casefold())
+
+
+# ===============================
+# PREFIX TRIE
+# ===============================
+class _Node:
+    __slots__ = ('children', 'keys')
+
+    def __init__(self):
+        self.children = {}
+        self.keys = []  # entries with a word starting here, in insertion order
+
+
+class PrefixTrie:
+    """
+    Word-prefix index of entries 0..n-1, added in rank order. Not
+    thread-safe while being filled; read-only afterwards.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, entry_words):
+        """Add the next entry (key len(self)) under each of `entry_words`"""
+        key = self._size
+        self._size += 1
+        for word in entry_words:
+            node = self._root
+            for char in word:
+                node = node.children.setdefault(char, _Node())
+                if not node.keys or node.keys[-1] != key:  # two words may share a prefix
+                    node.keys.append(key)
+        return key
+
+    def _keys(self, prefix):
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.keys
+
+    def top(self, query, k):
+        """Keys of the first `k` entries with a word starting with each query word"""
+        terms = words(query)
+        if not terms:
+            return list(range(min(k, self._size)))
+        lists = sorted((self._keys(term) for term in set(terms)), key=len)
+        found = []
+        # Walk the rarest term's entries; the others are sorted, so bisect
+        for key in lists[0]:
+            if all(_contains(keys, key) for keys in lists[1:]):
+                found.append(key)
+                if len(found) == k:
+                    break
+        return found
+
+
+def _contains(keys, key):
+    index = bisect_left(keys, key)
+    return index < len(keys) and keys[index] == key
+
+
+class Autocomplete:
+    """A PrefixTrie and the JSON-ready entries it indexes"""
+
+    def __init__(self, entries):
+        # entries: (pk, listing, words, result dict), best first
+        self.trie = PrefixTrie()
+        self.results = []
+        self.listed = {}  # pk -> listing
+        for pk, listing, entry_words, result in entries:
+            self.trie.add(entry_words)
+            self.results.append(result)
+            self.listed[pk] = listing
+
+    def complete(self, query, k=10):
+        """Up to `k` result dicts (shared: do not modify), best first"""
+        return [self.results[key] for key in self.trie.top(query, k)]
+
+
+# ===============================
+# DOCTORS & HOSPITALS
+# ===============================
+def _doctor_listing(doctor):
+    """What the form shows of `doctor`, None if not bookable"""
+    if doctor.status not in BOOKABLE_DOCTOR_STATUSES:
+        return None
+    return doctor.name, doctor.specialization
+
+
+def _doctor_entries():
+    specializations = dict(Doctor.SPECIALIZATION_CHOICES)
+    rows = (Doctor.objects.filter(status__in=BOOKABLE_DOCTOR_STATUSES)
+            .values_list('pk', 'name', 'specialization'))
+    for pk, name, specialization in sorted(rows, key=lambda row: (row[1].casefold(), row[0])):
+        label = specializations.get(specialization, specialization)
+        yield (pk, (name, specialization), words(name) + words(label) + words(specialization),
+               {'id': pk, 'name': name, 'specialization': label})
+
+
+def _hospital_listing(hospital):
+    return hospital.name if hospital.is_active else None
+
+
+def _hospital_entries():
+    rows = Hospital.objects.filter(is_active=True).values_list('pk', 'name')
+    for pk, name in sorted(rows, key=lambda row: (row[1].casefold(), row[0])):
+        yield pk, name, words(name), {'id': pk, 'name': name}
+
+
+KINDS = {
+    # ?kind=: listing of an instance, entries in rank order
+    'doctors': (_doctor_listing, _doctor_entries),
+    'hospitals': (_hospital_listing, _hospital_entries),
+}
+
+_built = {}  # kind -> (Autocomplete, generation, monotonic time of the last check)
+_lock = threading.Lock()
+
+
+def generation_name(kind):
+    return f'autocomplete:{kind}'
+
+
+def autocomplete(kind):
+    """The process-wide Autocomplete of `kind`, (re)built when its listings changed"""
+    refresh = getattr(settings, 'HMS_AUTOCOMPLETE_REFRESH_SECONDS', 10)
+    built = _built.get(kind)
+    now = time.monotonic()
+    if built is not None and now - built[2] < refresh:
+        return built[0]
+    with _lock:
+        built = _built.get(kind)
+        if built is not None and now - built[2] < refresh:
+            return built[0]
+        (generation,) = get_generations([generation_name(kind)])
+        if built is None or built[1] != generation:
+            built = (Autocomplete(KINDS[kind][1]()), generation, now)
+        _built[kind] = (built[0], generation, now)
+        return built[0]
+
+
+def complete(kind, query, k=10):
+    return autocomplete(kind).complete(query, k)
+
+
+def changed(kind, instance, deleted=False):
+    """A committed save/delete: rebuild `kind`, here and elsewhere, if the listing changed"""
+    built = _built.get(kind)
+    listing = None if deleted else KINDS[kind][0](instance)
+    if built is not None and built[0].listed.get(instance.pk) == listing:
+        return
+    reset(kind)
+    bump_generation(generation_name(kind))
+
+
+def reset(kind=None):
+    """Drop the built tries (or one kind's); the next lookup rebuilds them"""
+    with _lock:
+        if kind is None:
+            _built.clear()
+        else:
+            _built.pop(kind, None)
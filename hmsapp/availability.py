@@ -0,0 +1,310 @@
+"""
+Appointment slot availability for HMS
+
+A doctor's day is kept as two bitmaps of UNIT_MINUTES units (one Python
+int each): the working hours (Doctor.work_start..work_end) and the booked
+intervals (appointment_time + duration_minutes of every appointment that
+is not Cancelled). A slot of n units starting at unit s is free when those
+n bits are all set in `working & ~booked`, so overlap checks, free-slot
+lists and "next free slot" searches are a few integer operations.
+
+Day bitmaps are cached per (doctor, day) under a per-doctor generation
+('slots:<doctor id>'), bumped by signals.py whenever one of the doctor's
+appointments or the doctor's hours change.
+
+ensure_free() is the authoritative check: it reads the day from the
+database, inside the booking transaction (which holds SQLite's write lock),
+so overlapping visits are rejected before anything is written.
+
+Holds: selecting a time reserves its units in the cache for
+HMS_SLOT_HOLD_SECONDS (one cache.add() per 5-minute unit, so overlapping
+holds conflict too). Other clients are refused that time at once, without
+opening a database transaction; booking releases the hold. Each owner (a
+browser, see HOLD_COOKIE) has at most one hold at a time. Holds are only
+as shared as the cache: with LocMemCache they cover one process.
+"""
+
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import sharding
+from .caching import get_generations
+from .models import Appointment, Doctor
+
+
+UNIT_MINUTES = 5
+UNITS_PER_DAY = 24 * 60 // UNIT_MINUTES
+DURATIONS = (15, 30, 45, 60)
+
+BOOKABLE_DOCTOR_STATUSES = ('available', 'busy')
+
+HOLD_COOKIE = 'hms_slot_hold'
+
+
+class SlotUnavailable(Exception):
+    """The requested interval is outside working hours or overlaps a booking"""
+
+
+class SlotHeld(SlotUnavailable):
+    """Another client is holding (part of) the requested interval"""
+
+
+def step_minutes():
+    return getattr(settings, 'HMS_SLOT_STEP_MINUTES', 15)
+
+
+def _unit(value):
+    return (value.hour * 60 + value.minute) // UNIT_MINUTES
+
+
+def _length(duration):
+    return -(-duration // UNIT_MINUTES)  # round up to whole units
+
+
+def _interval(start_unit, length):
+    return ((1 << length) - 1) << start_unit
+
+
+def _time(unit):
+    return time(*divmod(unit * UNIT_MINUTES, 60))
+
+
+# ===============================
+# DAY BITMAPS
+# ===============================
+def working_mask(doctor):
+    start, end = _unit(doctor.work_start), _unit(doctor.work_end)
+    return _interval(start, end - start) if end > start else 0
+
+
+def booked_mask(rows):
+    """Bitmap of (appointment_time, duration_minutes) rows"""
+    mask = 0
+    for start, duration in rows:
+        mask |= _interval(_unit(start), _length(duration))
+    return mask & _interval(0, UNITS_PER_DAY)
+
+
+def _booked_rows(doctor_id, day):
+    return Appointment.objects.filter(
+        doctor_id=doctor_id, appointment_date=day
+    ).exclude(status='Cancelled').values_list('appointment_time', 'duration_minutes')
+
+
+def _day_keys(doctor_ids, day):
+    generations = get_generations([f'slots:{doctor_id}' for doctor_id in doctor_ids])
+    return {
+        doctor_id: f'hms:slots:{doctor_id}:{day.isoformat()}:{generation}'
+        for doctor_id, generation in zip(doctor_ids, generations)
+    }
+
+
+def day_masks(doctors, day):
+    """{doctor id: (working, booked)} for `day`, from the cache where possible"""
+    doctors = {doctor.pk: doctor for doctor in doctors}
+    keys = _day_keys(list(doctors), day)
+    found = cache.get_many(keys.values())
+    masks, missing = {}, {}
+    for doctor_id, key in keys.items():
+        if key in found:
+            masks[doctor_id] = found[key]
+        else:
+            doctor = doctors[doctor_id]
+            booked = booked_mask(row for rows in sharding.fan_out(
+                lambda alias: list(_booked_rows(doctor_id, day).using(alias))
+            ) for row in rows)
+            masks[doctor_id] = missing[key] = (working_mask(doctor), booked)
+    if missing:
+        cache.set_many(missing, getattr(settings, 'HMS_SLOT_CACHE_TIMEOUT', 3600))
+    return masks
+
+
+def _earliest_unit(day, now=None):
+    """First bookable unit of `day` (now, rounded up, for today)"""
+    now = timezone.localtime(now or timezone.now())
+    if day > now.date():
+        return 0
+    if day < now.date():
+        return UNITS_PER_DAY
+    return -(-(now.hour * 60 + now.minute + 1) // UNIT_MINUTES)
+
+
+@lru_cache(maxsize=None)
+def _grid(step):
+    """Bitmap of the units a visit may start on (every `step` units)"""
+    return sum(1 << unit for unit in range(0, UNITS_PER_DAY, step))
+
+
+def _fits(working, booked, duration, earliest=0):
+    """Bitmap of the start units (on the step grid, from `earliest`) with `duration` minutes free"""
+    free = working & ~booked
+    fits = free
+    for shift in range(1, _length(duration)):
+        fits &= free >> shift
+    step = max(1, step_minutes() // UNIT_MINUTES)
+    return fits & _grid(step) & ~((1 << earliest) - 1)
+
+
+def _units(mask):
+    units = []
+    while mask:
+        low = mask & -mask
+        units.append(low.bit_length() - 1)
+        mask ^= low
+    return units
+
+
+# ===============================
+# QUERIES
+# ===============================
+def free_slots(doctor, day, duration=15):
+    """Start times on `day` where a `duration`-minute visit with `doctor` fits"""
+    working, booked = day_masks([doctor], day)[doctor.pk]
+    return [_time(unit) for unit in _units(_fits(working, booked, duration, _earliest_unit(day)))]
+
+
+def next_free_slot(specialization, duration=15, start=None, days=None):
+    """
+    Earliest (doctor, date, time) for a `duration`-minute visit with any
+    bookable doctor of `specialization`, searching HMS_SLOT_SEARCH_DAYS
+    days from `start` (today). None when nothing is free.
+    """
+    doctors = _bookable_doctors(specialization)
+    if not doctors:
+        return None
+    start = start or timezone.localdate()
+    days = days or getattr(settings, 'HMS_SLOT_SEARCH_DAYS', 14)
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        masks = day_masks(doctors, day)
+        earliest = _earliest_unit(day)
+        best = None
+        for doctor in doctors:
+            fits = _fits(*masks[doctor.pk], duration, earliest)
+            first = (fits & -fits).bit_length() - 1  # lowest set bit, -1 when none
+            if first >= 0 and (best is None or first < best[1]):
+                best = (doctor, first)
+        if best:
+            return best[0], day, _time(best[1])
+    return None
+
+
+def _bookable_doctors(specialization):
+    """Doctors of a specialization, cached until any Doctor changes"""
+    key = f'hms:slot-doctors:{specialization}:{get_generations(["doctor"])[0]}'
+    doctors = cache.get(key)
+    if doctors is None:
+        doctors = list(Doctor.objects.filter(
+            specialization=specialization, status__in=BOOKABLE_DOCTOR_STATUSES
+        ))
+        cache.set(key, doctors, getattr(settings, 'HMS_SLOT_CACHE_TIMEOUT', 3600))
+    return doctors
+
+
+def check_slot(doctor, day, start, duration=15):
+    """Raise SlotUnavailable unless the (cached) day has room; no writes"""
+    working, booked = day_masks([doctor], day)[doctor.pk]
+    _check(working, booked, day, start, duration)
+
+
+def ensure_free(doctor, day, start, duration=15, using=None):
+    """check_slot() against the database itself, for use inside the booking transaction"""
+    rows = _booked_rows(doctor.pk, day)
+    _check(working_mask(doctor), booked_mask(rows.using(using) if using else rows), day, start, duration)
+
+
+def _check(working, booked, day, start, duration):
+    if duration not in DURATIONS:
+        raise SlotUnavailable(f'Visits last {", ".join(map(str, DURATIONS))} minutes')
+    if datetime.combine(day, start) < datetime.combine(*_now_parts()):
+        raise SlotUnavailable('That time has already passed')
+    interval = _interval(_unit(start), _length(duration))
+    if start.minute % UNIT_MINUTES or interval & ~working:
+        raise SlotUnavailable('That time is outside the doctor\'s working hours')
+    if interval & booked:
+        raise SlotUnavailable('That time overlaps another appointment')
+
+
+def _now_parts():
+    now = timezone.localtime()
+    return now.date(), now.time().replace(second=0, microsecond=0)
+
+
+# ===============================
+# HOLDS
+# ===============================
+def holds_enabled():
+    return getattr(settings, 'HMS_SLOT_HOLDS', True)
+
+
+def hold_seconds():
+    return getattr(settings, 'HMS_SLOT_HOLD_SECONDS', 120)
+
+
+def _hold_key(doctor_id, day, unit):
+    return f'hms:hold:{doctor_id}:{day.isoformat()}:{unit}'
+
+
+def _hold_keys(doctor_id, day, start, duration):
+    first = _unit(start)
+    return [_hold_key(doctor_id, day, unit) for unit in range(first, first + _length(duration))]
+
+
+def hold_slot(doctor, day, start, duration, owner):
+    """
+    Hold the interval for `owner` (replacing the owner's previous hold).
+    Raises SlotHeld, leaving nothing held, if another owner has part of it.
+    """
+    if duration not in DURATIONS:
+        # Before any key is written: there is one per 5-minute unit
+        raise SlotUnavailable(f'Visits last {", ".join(map(str, DURATIONS))} minutes')
+    timeout = hold_seconds()
+    added = []
+    for key in _hold_keys(doctor.pk, day, start, duration):
+        if cache.add(key, owner, timeout):
+            added.append(key)
+        elif cache.get(key) == owner:
+            cache.touch(key, timeout)
+        else:
+            cache.delete_many(added)
+            raise SlotHeld('Someone else is booking that time right now')
+
+    current = (doctor.pk, day, start, duration)
+    previous = cache.get(f'hms:hold-owner:{owner}')
+    if previous and tuple(previous) != current:
+        release_hold(*previous, owner, keep=current)
+    cache.set(f'hms:hold-owner:{owner}', current, timeout)
+
+
+def release_hold(doctor_id, day, start, duration, owner, keep=None):
+    """Drop the owner's hold on the interval (units also in `keep` stay held)"""
+    kept = set(_hold_keys(*keep)) if keep else set()
+    keys = [key for key in _hold_keys(doctor_id, day, start, duration) if key not in kept]
+    mine = [key for key, value in cache.get_many(keys).items() if value == owner]
+    cache.delete_many(mine)
+    if not keep:
+        cache.delete(f'hms:hold-owner:{owner}')
+
+
+def held_mask(doctor, day, working, owner=None):
+    """Units of the working day held by anyone but `owner`"""
+    keys = {_hold_key(doctor.pk, day, unit): unit for unit in _units(working)}
+    mask = 0
+    for key, value in cache.get_many(keys).items():
+        if value != owner:
+            mask |= 1 << keys[key]
+    return mask
+
+
+def slot_board(doctor, day, duration=15, owner=None):
+    """(free, held): bookable start times, and those only blocked by someone's hold"""
+    working, booked = day_masks([doctor], day)[doctor.pk]
+    earliest = _earliest_unit(day)
+    fits = _fits(working, booked, duration, earliest)
+    held = held_mask(doctor, day, working, owner) if holds_enabled() and fits else 0
+    free = _fits(working, booked | held, duration, earliest)
+    return [_time(unit) for unit in _units(free)], [_time(unit) for unit in _units(fits & ~free)]
@@ -0,0 +1,183 @@
+"""
+Page and fragment caching helpers for HMS
+
+Cached entries embed per-model generation counters in their keys, so a
+model change (see signals.py) invalidates every dependent page by bumping
+a counter instead of hunting down keys.
+"""
+
+import re
+import threading
+import time
+import zlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.functional import SimpleLazyObject
+
+from .routers import use_primary
+
+
+CSRF_SENTINEL = '__hms_csrf_token__'
+CSRF_INPUT_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+# Striped in-process locks: one render per key per process, bounded memory.
+# Reentrant: a page render nests single_flight() calls (context processors),
+# and two keys may share a stripe
+_LOCK_STRIPES = [threading.RLock() for _ in range(64)]
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# ===============================
+# GENERATION COUNTERS
+# ===============================
+def generation_key(name):
+    return f'hms:gen:{name}'
+
+
+def get_generations(names):
+    """Return the current generation of each name, creating missing ones"""
+    keys = [generation_key(name) for name in names]
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return tuple(found[key] for key in keys)
+
+
+def bump_generation(name):
+    """Invalidate every cache entry that depends on `name`"""
+    key = generation_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter evicted: restart from a value no old entry can carry
+        cache.set(key, time.time_ns(), None)
+
+
+def cache_generations(request):
+    """Context processor exposing generations for {% cache %} fragment keys"""
+    names = ['hospital', 'doctor', 'emergencycase', 'appointment']
+    return {
+        'hms_cache_gen': SimpleLazyObject(
+            lambda: dict(zip(names, get_generations(names)))
+        ),
+        'hms_fragment_timeout': _setting('HMS_FRAGMENT_CACHE_TIMEOUT', 600),
+    }
+
+
+# ===============================
+# SINGLE-FLIGHT COMPUTATION
+# ===============================
+def single_flight(key, compute, timeout):
+    """
+    Return the cached value for `key`, computing it at most once.
+
+    Threads of one process queue on a striped lock; other processes see the
+    cache-level lock and poll for the leader's result. `compute` may return
+    None to signal an uncacheable result.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_timeout = _setting('HMS_CACHE_LOCK_TIMEOUT', 10)
+    with _LOCK_STRIPES[zlib.crc32(key.encode()) % len(_LOCK_STRIPES)]:
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f'{key}:lock'
+        deadline = time.monotonic() + lock_timeout
+        while not cache.add(lock_key, 1, lock_timeout):
+            time.sleep(0.01)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if time.monotonic() > deadline:
+                break
+
+        try:
+            # Render from the primary so a lagging replica never gets cached
+            with use_primary():
+                value = compute()
+            if value is not None:
+                cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock_key)
+    return value
+
+
+# ===============================
+# FULL-PAGE CACHE
+# ===============================
+def session_role(request):
+    """Role used to vary cached pages (the navbar differs per role)"""
+    if request.session.get('doctor_id'):
+        return 'doctor'
+    if request.session.get('patient_id'):
+        return 'patient'
+    return 'anonymous'
+
+
+def _response_from_payload(request, payload, state):
+    content = payload['content']
+    if CSRF_SENTINEL.encode() in content:
+        content = content.replace(CSRF_SENTINEL.encode(), get_token(request).encode())
+    response = HttpResponse(content, content_type=payload['content_type'])
+    response['X-HMS-Cache'] = state
+    return response
+
+
+def cache_page_by_role(*depends_on):
+    """
+    Cache GET responses of a public page per session role.
+
+    `depends_on` lists model names (e.g. 'hospital') whose changes must
+    invalidate the page. Requests carrying flash messages bypass the cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method != 'GET'
+                    or not _setting('HMS_PAGE_CACHE_ENABLED', True)
+                    or len(get_messages(request))):
+                return view(request, *args, **kwargs)
+
+            generations = '.'.join(str(gen) for gen in get_generations(depends_on))
+            key = f'hms:page:{session_role(request)}:{generations}:{request.get_full_path()}'
+
+            rendered = {}
+
+            def render_page():
+                response = view(request, *args, **kwargs)
+                rendered['response'] = response
+                if response.status_code != 200 or response.streaming:
+                    return None
+                content = CSRF_INPUT_RE.sub(
+                    rf'\g<1>{CSRF_SENTINEL}\g<2>', response.content.decode()
+                )
+                return {
+                    'content': content.encode(),
+                    'content_type': response['Content-Type'],
+                }
+
+            payload = single_flight(
+                key, render_page, _setting('HMS_PAGE_CACHE_TIMEOUT', 60)
+            )
+            if 'response' in rendered:
+                rendered['response']['X-HMS-Cache'] = 'miss'
+                return rendered['response']
+            if payload is None:
+                return view(request, *args, **kwargs)
+            return _response_from_payload(request, payload, 'hit')
+        return wrapper
+    return decorator
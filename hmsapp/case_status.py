@@ -0,0 +1,123 @@
+"""
+Bulk status changes for a doctor's emergency cases
+
+bulk_set_status() applies a list of (case id, new status[, version]) pairs
+in a handful of statements, whatever the list length: one SELECT per shard
+to validate, one conditional UPDATE per (shard, target status), one
+activity log bulk_create. Each UPDATE is guarded by every case's id and
+version, so a case changed by someone else between the check and the write
+is reported as a conflict instead of being overwritten.
+"""
+
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import sharding
+from .activity import log_activities
+from .agenda import cases_updated
+from .caching import bump_generation
+from .models import EmergencyCase
+
+
+MAX_BULK_UPDATES = 200
+
+STATUSES = {code for code, _ in EmergencyCase.STATUS_CHOICES}
+
+
+class BulkUpdateError(ValueError):
+    """The request itself is malformed (nothing was applied)"""
+
+
+def _parse(updates):
+    if not isinstance(updates, list) or not updates:
+        raise BulkUpdateError('updates must be a non-empty list')
+    if len(updates) > MAX_BULK_UPDATES:
+        raise BulkUpdateError(f'at most {MAX_BULK_UPDATES} updates per request')
+    parsed = []
+    for item in updates:
+        try:
+            case_id = int(item['id'])
+            version = None if item.get('version') is None else int(item['version'])
+            status = item['status']
+        except (TypeError, KeyError, ValueError):
+            raise BulkUpdateError('each update needs an integer "id" and a "status"')
+        parsed.append((case_id, status, version))
+    return parsed
+
+
+def bulk_set_status(doctor_id, updates):
+    """
+    Apply status changes to cases assigned to `doctor_id`. Returns
+    {'updated': [{id, token, status, version}], 'rejected': [{id, reason}]}.
+    Raises BulkUpdateError for a malformed list.
+    """
+    rejected = []
+    wanted = {}
+    for case_id, status, version in _parse(updates):
+        if case_id in wanted:
+            rejected.append({'id': case_id, 'reason': 'listed more than once'})
+        elif status not in STATUSES:
+            rejected.append({'id': case_id, 'reason': f'unknown status {status!r}'})
+        else:
+            wanted[case_id] = (status, version)
+
+    by_shard = defaultdict(list)
+    for case_id in wanted:
+        by_shard[sharding.shard_for_pk(case_id)].append(case_id)
+
+    current = {}
+    for alias, ids in by_shard.items():
+        for row in EmergencyCase.objects.using(alias).filter(
+            pk__in=ids, assigned_doctor_id=doctor_id
+        ).values('pk', 'token', 'status', 'version'):
+            current[row['pk']] = row
+
+    # (shard, target status) -> [(id, expected version)]
+    plan = defaultdict(list)
+    for case_id, (status, version) in wanted.items():
+        row = current.get(case_id)
+        if row is None:
+            reason = 'no such case assigned to you'
+        elif version is not None and version != row['version']:
+            reason = f'changed by someone else (now {row["status"]}, version {row["version"]})'
+        elif status == row['status']:
+            reason = f'already {status}'
+        elif status not in EmergencyCase.STATUS_TRANSITIONS[row['status']]:
+            reason = f'cannot change from {row["status"]} to {status}'
+        else:
+            plan[sharding.shard_for_pk(case_id), status].append((case_id, row['version']))
+            continue
+        rejected.append({'id': case_id, 'reason': reason})
+
+    now = timezone.now()
+    updated = []
+    for (alias, status), cases in plan.items():
+        guard = reduce(or_, (Q(pk=case_id, version=version) for case_id, version in cases))
+        count = EmergencyCase.objects.using(alias).filter(guard, assigned_doctor_id=doctor_id).update(
+            status=status, version=F('version') + 1, updated_at=now
+        )
+        applied = {case_id for case_id, _ in cases}
+        if count < len(cases):
+            # Lost a race for some rows: keep the ones that now carry our write
+            ours = reduce(or_, (Q(pk=case_id, version=version + 1) for case_id, version in cases))
+            applied = set(EmergencyCase.objects.using(alias).filter(
+                ours, status=status, updated_at=now
+            ).values_list('pk', flat=True))
+        for case_id, version in cases:
+            if case_id in applied:
+                updated.append({'id': case_id, 'token': current[case_id]['token'],
+                                'status': status, 'version': version + 1})
+            else:
+                rejected.append({'id': case_id, 'reason': 'changed by someone else'})
+
+    if updated:
+        bump_generation('emergencycase')  # update() sends no post_save
+        cases_updated(doctor_id, updated)
+        log_activities(doctor_id, 'case_updated', [
+            f'Updated case {case["token"]} to {case["status"]}' for case in updated
+        ])
+    return {'updated': updated, 'rejected': rejected}
@@ -3,20 +3,32 @@ Custom context processors for HMS
 Add these to TEMPLATES['OPTIONS']['context_processors'] in settings.py
 """
 
+from django.conf import settings
+
+from . import sharding
+from .caching import get_generations, single_flight
 from .models import EmergencyCase, Doctor, Hospital
 
 
+def _compute_hms_stats():
+    return {
+        'total_cases': sharding.count(EmergencyCase.objects.all()),
+        'active_cases': sharding.count(EmergencyCase.objects.filter(
+            status__in=['Waiting', 'Doctor Assigned']
+        )),
+        'available_doctors': Doctor.objects.filter(status='available').count(),
+        'hospitals_count': Hospital.objects.filter(is_active=True).count(),
+    }
+
+
 def hms_stats(request):
-    """Add HMS statistics to all templates"""
+    """Add HMS statistics to all templates (cached until a counted model changes)"""
+    generations = get_generations(['emergencycase', 'doctor', 'hospital'])
+    key = 'hms:stats:' + '.'.join(str(gen) for gen in generations)
     return {
-        'hms_stats': {
-            'total_cases': EmergencyCase.objects.count(),
-            'active_cases': EmergencyCase.objects.filter(
-                status__in=['Waiting', 'Doctor Assigned']
-            ).count(),
-            'available_doctors': Doctor.objects.filter(status='available').count(),
-            'hospitals_count': Hospital.objects.filter(is_active=True).count(),
-        }
+        'hms_stats': single_flight(
+            key, _compute_hms_stats, getattr(settings, 'HMS_STATS_CACHE_TIMEOUT', 300)
+        )
     }
 
 
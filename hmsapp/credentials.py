@@ -0,0 +1,171 @@
+"""
+Deferred hashing of initial patient credentials
+
+Auto-created accounts start with the patient's phone number as password.
+Hashing it with PBKDF2 inside the registration request costs hundreds of
+milliseconds, so with HMS_DEFERRED_PASSWORD_HASHING the row is saved with
+PENDING_PASSWORD instead and hashed later: by a background thread after
+commit, by `manage.py hms_hash_pending`, or on the patient's first login.
+Sessions logged in while their User was pending are kept logged in once
+it is hashed (PendingLoginMiddleware).
+
+The marker starts with '!', which Django treats as an unusable password,
+so a pending User can never authenticate until it has a real hash. It does
+not weaken anything: the initial credential is the phone number, which is
+stored in clear on the same row.
+"""
+
+import hmac
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.utils.crypto import constant_time_compare
+
+
+logger = logging.getLogger(__name__)
+
+PENDING_PASSWORD = '!hms-pending'
+
+_pending = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def deferred_hashing_enabled():
+    return getattr(settings, 'HMS_DEFERRED_PASSWORD_HASHING', False)
+
+
+def initial_password(phone):
+    """Encoded initial password for an auto-created account"""
+    if deferred_hashing_enabled():
+        return PENDING_PASSWORD
+    return make_password(phone)
+
+
+def is_pending(encoded):
+    return encoded == PENDING_PASSWORD
+
+
+def matches_initial_password(raw_password, phone):
+    """Constant-time comparison against the (unhashed) initial credential"""
+    return bool(raw_password) and hmac.compare_digest(str(raw_password), str(phone))
+
+
+# ===============================
+# HASHING
+# ===============================
+def _initial_secret(model, obj_id):
+    if model is User:
+        return model.objects.filter(pk=obj_id).values_list('username', flat=True).first()
+    return model.objects.filter(pk=obj_id).values_list('phone', flat=True).first()
+
+
+def hash_pending(model, obj_id):
+    """Replace one pending marker with a real hash; True if this call did it"""
+    secret = _initial_secret(model, obj_id)
+    if secret is None:
+        return False
+    # Conditional write: never clobber a password changed in the meantime
+    return bool(model.objects.filter(pk=obj_id, password=PENDING_PASSWORD).update(
+        password=make_password(secret)
+    ))
+
+
+def hash_all_pending(batch_size=100):
+    """Hash every pending credential (Patient and User); return the count"""
+    from .models import Patient
+
+    hashed = 0
+    for model in (Patient, User):
+        while True:
+            ids = list(model.objects.filter(password=PENDING_PASSWORD)
+                       .values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            hashed += sum(hash_pending(model, obj_id) for obj_id in ids)
+    return hashed
+
+
+# ===============================
+# BACKGROUND WORKER
+# ===============================
+def _run_worker():
+    while True:
+        model, obj_id = _pending.get()
+        try:
+            close_old_connections()
+            hash_pending(model, obj_id)
+        except Exception:
+            # The row stays pending: login or hms_hash_pending will retry it
+            logger.exception('Deferred password hashing failed for %s %s', model.__name__, obj_id)
+        finally:
+            _pending.task_done()
+            if _pending.empty():
+                close_old_connections()
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='hms-password-hasher', daemon=True)
+            _worker.start()
+
+
+def schedule_hash(obj):
+    """Queue a pending credential for hashing once the transaction commits"""
+    if not is_pending(obj.password) or not getattr(settings, 'HMS_PASSWORD_HASH_WORKER', True):
+        return
+
+    def enqueue():
+        _ensure_worker()
+        _pending.put((type(obj), obj.pk))
+
+    transaction.on_commit(enqueue)
+
+
+def wait_for_pending():
+    """Block until the background worker has drained its queue"""
+    _pending.join()
+
+
+# ===============================
+# SESSIONS
+# ===============================
+class PendingLoginMiddleware:
+    """
+    login() of a pending User stores a session hash made from
+    PENDING_PASSWORD, which stops matching once the password is hashed, and
+    Django would then log the patient out. Move such sessions over to the
+    real hash if it is the initial password's (checked once per session).
+    Goes between SessionMiddleware and AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        session_hash = request.session.get(HASH_SESSION_KEY)
+        if session_hash and constant_time_compare(session_hash, _pending_session_hash()):
+            _adopt_hashed_password(request.session)
+        return self.get_response(request)
+
+
+def _pending_session_hash():
+    return User(password=PENDING_PASSWORD).get_session_auth_hash()
+
+
+def _adopt_hashed_password(session):
+    row = User.objects.filter(pk=session.get(SESSION_KEY)).values_list('username', 'password').first()
+    if row is None or is_pending(row[1]):
+        return
+    username, encoded = row
+    # Not if the password was set to something else in the meantime: that logs out
+    if check_password(username, encoded):
+        session[HASH_SESSION_KEY] = User(password=encoded).get_session_auth_hash()
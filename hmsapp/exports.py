@@ -0,0 +1,218 @@
+"""
+Streaming CSV / JSON-lines exports of cases, appointments and home care requests
+
+An export is a values_list() projection (doctor and hospital names joined
+in) read with iterator(chunk_size=...) and written out in ~64 KB pieces,
+so memory use stays flat however many rows are exported. Rows come in the
+order of the table's date index (no sort step); shards, and the statuses of
+a status filter, are read side by side and merged on that order.
+
+Used by GET /api/export/<kind>/ (a StreamingHttpResponse) and by
+`manage.py hms_export`, which reports rows per second.
+"""
+
+import csv
+import heapq
+import io
+import json
+import logging
+from datetime import datetime, time, timedelta
+from operator import itemgetter
+from time import perf_counter
+
+from django.conf import settings
+from django.db import models
+from django.db.models import F, Func
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from . import sharding
+from .models import Appointment, ArchivedEmergencyCase, EmergencyCase, HomeCareRequest
+
+
+logger = logging.getLogger(__name__)
+
+CASE_COLUMNS = (
+    # (column, values_list lookup)
+    ('id', 'id'), ('token', 'token'), ('created_at', 'created_at'),
+    ('patient_name', 'patient_name'), ('patient_phone', 'patient_phone'),
+    ('symptom', 'symptom'), ('priority', 'priority'), ('status', 'status'), ('mode', 'mode'),
+    ('doctor', 'assigned_doctor__name'), ('hospital', 'assigned_hospital__name'),
+    ('updated_at', 'updated_at'),
+)
+
+EXPORTS = {
+    # kind: model, date field (--from/--to), order (a date index), columns
+    'cases': (EmergencyCase, 'created_at', ('created_at', 'id'), CASE_COLUMNS),
+    'archived-cases': (ArchivedEmergencyCase, 'created_at', ('created_at', 'id'),
+                       CASE_COLUMNS + (('archived_at', 'archived_at'),)),
+    'appointments': (Appointment, 'appointment_date', ('appointment_date', 'appointment_time', 'id'), (
+        ('id', 'id'), ('appointment_date', 'appointment_date'), ('appointment_time', 'appointment_time'),
+        ('duration_minutes', 'duration_minutes'), ('patient_name', 'patient_name'),
+        ('patient_phone', 'patient_phone'), ('doctor', 'doctor__name'), ('hospital', 'hospital__name'),
+        ('status', 'status'), ('reason', 'reason'), ('created_at', 'created_at'),
+    )),
+    'home-care': (HomeCareRequest, 'created_at', ('created_at', 'id'), (
+        ('id', 'id'), ('token', 'token'), ('created_at', 'created_at'),
+        ('patient_name', 'patient_name'), ('phone', 'phone'), ('issue', 'issue'), ('mode', 'mode'),
+        ('status', 'status'), ('doctor', 'assigned_doctor__name'), ('hospital', 'hospital__name'),
+        ('eta', 'eta'),
+    )),
+}
+
+FORMATS = {
+    # format: content type
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# A CSV cell starting with one of these is a formula to spreadsheet apps
+FORMULA_PREFIXES = frozenset('=+-@\t\r')
+
+CHUNK_SIZE = 2000        # rows per fetchmany()
+FLUSH_BYTES = 64 * 1024  # text handed to the response / file at a time
+
+
+class ExportError(ValueError):
+    """Unknown export, format or status"""
+
+
+def columns(kind):
+    return [column for column, _ in EXPORTS[kind][3]]
+
+
+def export_queryset(kind, start=None, end=None, statuses=()):
+    """
+    values_list() queryset of `kind`, dated between the dates `start` and
+    `end` (inclusive) and in one of `statuses` if given
+    """
+    if kind not in EXPORTS:
+        raise ExportError(f'Unknown export {kind!r}; choose from {", ".join(EXPORTS)}')
+    model, date_field, ordering, fields = EXPORTS[kind]
+    rows = model.objects.all()
+    if isinstance(model._meta.get_field(date_field), models.DateTimeField):
+        # Whole local days
+        if start:
+            rows = rows.filter(**{f'{date_field}__gte': _midnight(start)})
+        if end:
+            rows = rows.filter(**{f'{date_field}__lt': _midnight(end + timedelta(days=1))})
+    else:
+        if start:
+            rows = rows.filter(**{f'{date_field}__gte': start})
+        if end:
+            rows = rows.filter(**{f'{date_field}__lte': end})
+    if statuses:
+        known = {code for code, _ in model._meta.get_field('status').choices}
+        unknown = [status for status in statuses if status not in known]
+        if unknown:
+            raise ExportError(f'Unknown status {", ".join(unknown)}; choose from {", ".join(sorted(known))}')
+        rows = rows.filter(status__in=statuses)
+    return rows.order_by(*ordering).values_list(*[_column(model, lookup) for _, lookup in fields])
+
+
+def _text_columns(kind):
+    """Positions of the text columns of `kind` (names, reasons, ...: typed in by patients)"""
+    model, _, _, fields = EXPORTS[kind]
+    positions = []
+    for position, (_, lookup) in enumerate(fields):
+        field, path = model._meta.get_field(lookup.split('__')[0]), lookup.split('__')[1:]
+        for name in path:
+            field = field.related_model._meta.get_field(name)
+        if isinstance(field, (models.CharField, models.TextField)):
+            positions.append(position)
+    return positions
+
+
+def _column(model, lookup):
+    """
+    Dates and times as ISO 8601 text, made by SQLite from the text it stores:
+    parsing every value into a datetime and formatting it again costs more
+    than the rest of the export
+    """
+    field = None if '__' in lookup else model._meta.get_field(lookup)
+    if isinstance(field, models.DateTimeField):
+        # Stored as UTC 'YYYY-MM-DD HH:MM:SS[.ffffff]'
+        suffix = " || '+00:00'" if settings.USE_TZ else ''
+        return Func(F(lookup), template=f"REPLACE(%(expressions)s, ' ', 'T'){suffix}",
+                    output_field=models.TextField())
+    if isinstance(field, (models.DateField, models.TimeField)):
+        return Cast(lookup, models.TextField())
+    return lookup
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_rows(kind, start=None, end=None, statuses=(), chunk_size=CHUNK_SIZE):
+    """Iterator over the rows (tuples) of an export, in date order, from every shard"""
+    if statuses:
+        # One query per status: each reads a (status, date) index in order,
+        # where status IN (...) would sort every row first
+        parts = [export_queryset(kind, start, end, [status]) for status in dict.fromkeys(statuses)]
+    else:
+        parts = [export_queryset(kind, start, end)]
+    if sharding.sharding_enabled():
+        parts = [queryset.using(alias) for queryset in parts for alias in sharding.shards()]
+    if len(parts) == 1:
+        return parts[0].iterator(chunk_size=chunk_size)
+    _, _, ordering, fields = EXPORTS[kind]
+    lookups = [lookup for _, lookup in fields]
+    # One open cursor per part, merged on the order they share
+    return heapq.merge(*[queryset.iterator(chunk_size=chunk_size) for queryset in parts],
+                       key=itemgetter(*[lookups.index(name) for name in ordering]))
+
+
+# ===============================
+# ENCODING
+# ===============================
+def stream(kind, fmt='csv', start=None, end=None, statuses=(), chunk_size=CHUNK_SIZE, stats=None):
+    """
+    Iterator over the text of an export, in pieces of about FLUSH_BYTES.
+    `stats` (a dict) gets 'rows', and 'seconds' once done. Bad arguments
+    raise ExportError here, before anything is read.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f'Unknown format {fmt!r}; choose from {", ".join(FORMATS)}')
+    rows = export_rows(kind, start, end, statuses, chunk_size)
+    return _encode(kind, fmt, rows, stats if stats is not None else {})
+
+
+def _encode(kind, fmt, rows, stats):
+    header = columns(kind)
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        text_columns = _text_columns(kind)
+        texts = itemgetter(*text_columns)
+
+        def write(row):
+            # '=HYPERLINK(...)' typed in as a name must stay text in Excel / Sheets
+            if not FORMULA_PREFIXES.isdisjoint([value[:1] for value in texts(row) if value]):
+                row = list(row)
+                for i in text_columns:
+                    if row[i] and row[i][0] in FORMULA_PREFIXES:
+                        row[i] = "'" + row[i]
+            writer.writerow(row)
+    else:
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+
+        def write(row):
+            buffer.write(encode(dict(zip(header, row))))
+            buffer.write('\n')
+
+    stats['rows'] = 0
+    started = perf_counter()
+    for row in rows:
+        write(row)
+        stats['rows'] += 1
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+    stats['seconds'] = perf_counter() - started
+    logger.info('Exported %d %s rows as %s in %.1fs (%.0f rows/s)', stats['rows'], kind, fmt,
+                stats['seconds'], stats['rows'] / max(stats['seconds'], 1e-9))
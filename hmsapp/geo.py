@@ -0,0 +1,256 @@
+"""
+Doctor positions, nearest-doctor search and ETAs for home visits
+
+DoctorIndex keeps the latest (lat, lon) of every available doctor in a
+uniform grid of HMS_GEO_CELL_DEGREES cells (a dict of cell -> doctor ids).
+nearest() scans rings of cells around the query point and stops once no
+unscanned cell can hold anything closer, so a query looks at a handful of
+doctors however many are on the map. Moving a doctor is two dict updates.
+
+The process-wide index (doctor_index()) is loaded from the database on first
+use and kept current by signals.py (Doctor saves and deletes) and by the
+doctors' location pings (locations.py), which also supply live ETAs. ETAs are estimated from great-circle
+distance: HMS_ROAD_FACTOR for the road detour, HMS_DISPATCH_SPEED_KMH in
+city traffic, plus HMS_DISPATCH_HANDOFF_MINUTES to get going.
+"""
+
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Doctor
+
+
+HOME_VISIT_MODES = ('Doctor Home Visit', 'Home Assistance')
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 2 * math.pi * EARTH_RADIUS_KM / 360
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def eta_minutes(distance_km):
+    """Estimated minutes to cover `distance_km` (straight line) by road"""
+    road_km = distance_km * getattr(settings, 'HMS_ROAD_FACTOR', 1.4)
+    driving = road_km / getattr(settings, 'HMS_DISPATCH_SPEED_KMH', 25) * 60
+    return math.ceil(driving + getattr(settings, 'HMS_DISPATCH_HANDOFF_MINUTES', 3))
+
+
+def format_eta(minutes):
+    return f'{minutes} min' if minutes == 1 else f'{minutes} mins'
+
+
+def has_position(obj, lat_field='latitude', lon_field='longitude'):
+    return getattr(obj, lat_field) is not None and getattr(obj, lon_field) is not None
+
+
+# ===============================
+# SPATIAL INDEX
+# ===============================
+class DoctorIndex:
+    """Grid index of doctor positions; safe to share between threads"""
+
+    def __init__(self, cell_degrees=None):
+        self.cell = cell_degrees or getattr(settings, 'HMS_GEO_CELL_DEGREES', 0.01)
+        self._positions = {}  # doctor id -> (lat, lon, cell)
+        self._cells = {}      # cell -> {doctor id, ...}
+        self._bounds = None   # (min row, max row, min col, max col) ever used
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell), math.floor(lon / self.cell)
+
+    def update(self, doctor_id, lat, lon):
+        cell = self._cell(lat, lon)
+        with self._lock:
+            old = self._positions.get(doctor_id)
+            if old is not None and old[2] != cell:
+                self._discard(doctor_id, old[2])
+            self._positions[doctor_id] = (lat, lon, cell)
+            self._cells.setdefault(cell, set()).add(doctor_id)
+            if self._bounds is None:
+                self._bounds = (cell[0], cell[0], cell[1], cell[1])
+            else:
+                top, bottom, left, right = self._bounds
+                self._bounds = (min(top, cell[0]), max(bottom, cell[0]),
+                                min(left, cell[1]), max(right, cell[1]))
+
+    def remove(self, doctor_id):
+        with self._lock:
+            old = self._positions.pop(doctor_id, None)
+            if old is not None:
+                self._discard(doctor_id, old[2])
+
+    def _discard(self, doctor_id, cell):
+        members = self._cells[cell]
+        members.discard(doctor_id)
+        if not members:
+            del self._cells[cell]
+
+    def position(self, doctor_id):
+        """(lat, lon) or None"""
+        found = self._positions.get(doctor_id)
+        return found[:2] if found else None
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """Up to `k` (distance km, doctor id) pairs, closest first"""
+        row, col = self._cell(lat, lon)
+        found = []
+        with self._lock:
+            if not self._cells:
+                return []
+            top, bottom, left, right = self._bounds
+            max_ring = max(abs(row - top), abs(row - bottom), abs(col - left), abs(col - right))
+            for ring in range(max_ring + 1):
+                # Everything outside rings 0..ring-1 is at least this far away
+                reach = (ring - 1) * self._cell_km(lat, ring)
+                if len(found) >= k and found[k - 1][0] <= reach:
+                    break
+                if len(found) == len(self._positions):
+                    break  # fewer than k doctors on the map, all found
+                if max_km is not None and reach > max_km:
+                    break
+                for cell in self._ring(row, col, ring):
+                    for doctor_id in self._cells.get(cell, ()):
+                        d_lat, d_lon, _ = self._positions[doctor_id]
+                        found.append((haversine_km(lat, lon, d_lat, d_lon), doctor_id))
+                found.sort()
+        if max_km is not None:
+            found = [item for item in found if item[0] <= max_km]
+        return found[:k]
+
+    def _cell_km(self, lat, ring):
+        """Narrowest cell side (km) within `ring` cells of `lat`: longitude degrees shrink poleward"""
+        edge = min(abs(lat) + (ring + 1) * self.cell, 89.0)
+        return self.cell * KM_PER_DEGREE * math.cos(math.radians(edge))
+
+    @staticmethod
+    def _ring(row, col, ring):
+        if ring == 0:
+            yield row, col
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield row - ring, c
+            yield row + ring, c
+        for r in range(row - ring + 1, row + ring):
+            yield r, col - ring
+            yield r, col + ring
+
+
+_index = None
+_available = set()  # ids of available doctors, positioned or not
+_refreshed = (0.0, None)  # (monotonic, wall-clock) time of the last load
+_index_lock = threading.Lock()
+
+
+def doctor_index():
+    """
+    The process-wide index of available doctors, loaded on first use. Every
+    HMS_GEO_INDEX_REFRESH_SECONDS it picks up the positions other processes
+    have written since (see locations.py).
+    """
+    global _index, _refreshed
+    from .locations import latest
+    with _index_lock:
+        checked, since = _refreshed
+        stale = time.monotonic() - checked > getattr(settings, 'HMS_GEO_INDEX_REFRESH_SECONDS', 15)
+        if _index is None or stale:
+            rows = Doctor.objects.filter(status='available')
+            if _index is None:
+                _index = DoctorIndex()
+                _available.clear()
+            else:
+                # A flush writes pings stamped up to an interval before it
+                overlap = 2 * getattr(settings, 'HMS_LOCATION_FLUSH_INTERVAL', 5.0)
+                rows = rows.filter(location_updated_at__gt=since - timedelta(seconds=overlap))
+            _refreshed = (time.monotonic(), timezone.now())
+            for pk, lat, lon in rows.values_list('pk', 'latitude', 'longitude'):
+                _available.add(pk)
+                lat, lon = (latest(pk) or (lat, lon))[:2]  # this process may know better
+                if lat is not None and lon is not None:
+                    _index.update(pk, lat, lon)
+        return _index
+
+
+def reset_index():
+    """Forget the index; the next doctor_index() reloads it from the database"""
+    global _index, _refreshed
+    with _index_lock:
+        _index = None
+        _refreshed = (0.0, None)
+
+
+def doctor_changed(doctor, deleted=False):
+    """Keep a loaded index in line with a saved or deleted Doctor"""
+    from .locations import forget, latest
+    if deleted:
+        forget(doctor.pk)
+    if _index is None:
+        return
+    # A ping newer than the saved row wins
+    position = latest(doctor.pk) or (doctor.latitude, doctor.longitude)
+    if not deleted and doctor.status == 'available':
+        _available.add(doctor.pk)
+        if position[0] is not None and position[1] is not None:
+            _index.update(doctor.pk, position[0], position[1])
+            return
+    else:
+        _available.discard(doctor.pk)
+    _index.remove(doctor.pk)
+
+
+def doctor_moved(doctor_id, lat, lon):
+    """A location ping: move the doctor in the index if they are available"""
+    if _index is not None and doctor_id in _available:
+        _index.update(doctor_id, lat, lon)
+
+
+# ===============================
+# DISPATCH & ETA
+# ===============================
+def nearest_doctor(lat, lon, specializations=(), candidates=5):
+    """
+    Closest available doctor to (lat, lon), within HMS_DISPATCH_RADIUS_KM.
+    Among the `candidates` nearest, a doctor of one of `specializations` is
+    preferred if at most HMS_DISPATCH_SPECIALIST_KM further away. Returns
+    (doctor, distance km) or None.
+    """
+    radius = getattr(settings, 'HMS_DISPATCH_RADIUS_KM', 50)
+    nearest = doctor_index().nearest(lat, lon, k=candidates, max_km=radius)
+    if not nearest:
+        return None
+    doctors = Doctor.objects.in_bulk([doctor_id for _, doctor_id in nearest])
+    ranked = [(doctors[doctor_id], distance) for distance, doctor_id in nearest
+              if doctor_id in doctors and doctors[doctor_id].status == 'available']
+    if not ranked:
+        return None
+    detour = getattr(settings, 'HMS_DISPATCH_SPECIALIST_KM', 3)
+    for doctor, distance in ranked:
+        if doctor.specialization in specializations and distance <= ranked[0][1] + detour:
+            return doctor, distance
+    return ranked[0]
+
+
+def live_eta(doctor, lat, lon):
+    """(distance km, minutes) from the doctor's latest position, or None"""
+    from .locations import latest
+    position = latest(doctor.pk)
+    if position is None and has_position(doctor):
+        position = doctor.latitude, doctor.longitude
+    if position is None or lat is None or lon is None:
+        return None
+    distance = haversine_km(position[0], position[1], lat, lon)
+    return distance, eta_minutes(distance)
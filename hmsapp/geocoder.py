@@ -0,0 +1,245 @@
+"""
+Offline geocoding of free-text locations and addresses
+
+geocode() turns what patients type ("Flat 4, Lajpat Ngr, New Delhi 110024")
+into a Place (lat, lon, name, precision) using the gazetteer file
+HMS_GAZETTEER: a CSV of cities, localities and PIN codes with their
+centroids. The text is normalized (case, punctuation, accents, common
+abbreviations, filler words), then matched:
+
+1. a known 6-digit PIN code (precision 'pin')
+2. a locality named in the text, exactly or fuzzily (misspellings),
+   preferring one near a city also named in the text ('locality')
+3. a city, exactly or fuzzily ('city')
+
+Fuzzy matching only compares against gazetteer names sharing enough
+trigrams with a word or phrase of the text, then checks the similarity
+(difflib ratio >= HMS_GEOCODE_MIN_SCORE).
+
+Results are cached twice: in an in-process LRU (HMS_GEOCODE_CACHE_SIZE
+texts, including misses) and in the GeocodeMemo table, keyed by the
+normalized text and the gazetteer's content hash, so other processes and
+restarts skip the matching and an edited gazetteer starts afresh. Inside
+deferred_memos() the memo inserts are held back, so a caller that geocodes
+before its write transaction can save them on commit instead.
+"""
+
+import csv
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .geo import haversine_km
+from .models import GeocodeMemo
+
+
+logger = logging.getLogger(__name__)
+
+Place = namedtuple('Place', 'lat lon name precision')
+
+_Entry = namedtuple('_Entry', 'name precision city lat lon')
+
+PRECISIONS = ('pin', 'locality', 'city')
+
+ABBREVIATIONS = {
+    'rd': 'road', 'ngr': 'nagar', 'sec': 'sector', 'extn': 'extension', 'ext': 'extension',
+    'col': 'colony', 'enc': 'enclave', 'mkt': 'market',
+}
+NOISE_WORDS = {
+    'near', 'nr', 'opp', 'opposite', 'behind', 'beside', 'flat', 'house', 'no', 'floor', 'india', 'the',
+}
+
+NEARBY_CITY_KM = 40  # a locality this close to a city named in the text belongs to it
+
+_PIN_SPLIT_RE = re.compile(r'\b(\d{3})\s+(\d{3})\b')
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lower-case ASCII words, abbreviations expanded, filler words dropped"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    text = _PIN_SPLIT_RE.sub(r'\1\2', text)  # "110 029" -> "110029"
+    words = [ABBREVIATIONS.get(word, word) for word in _NON_WORD_RE.sub(' ', text).split()]
+    return ' '.join(word for word in words if word not in NOISE_WORDS)
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# ===============================
+# GAZETTEER
+# ===============================
+class Gazetteer:
+    """Lookup tables built from the gazetteer CSV"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        self.version = hashlib.sha1(raw).hexdigest()[:12]
+        self.pins = {}      # '110029' -> entry
+        self.names = {}     # normalized name or alias -> [entry, ...]
+        self.trigrams = {'locality': {}, 'city': {}}  # precision -> trigram -> {name}
+        self.longest = 1    # words in the longest name
+        lines = [line for line in raw.decode('utf-8').splitlines() if line and not line.startswith('#')]
+        for row in csv.DictReader(lines):
+            if row['kind'] not in PRECISIONS:
+                raise ValueError(f'{path}: unknown kind {row["kind"]!r} for {row["name"]!r}')
+            entry = _Entry(row['name'], row['kind'], row['city'], float(row['lat']), float(row['lon']))
+            if entry.precision == 'pin':
+                self.pins[entry.name] = entry
+                continue
+            for alias in [row['name']] + [a for a in (row.get('aliases') or '').split('|') if a]:
+                name = normalize(alias)
+                self.names.setdefault(name, []).append(entry)
+                self.longest = max(self.longest, len(name.split()))
+                for gram in _trigrams(name):
+                    self.trigrams[entry.precision].setdefault(gram, set()).add(name)
+
+    def resolve(self, normalized):
+        """Best entry for a normalized text, or None"""
+        words = normalized.split()
+        for word in words:
+            if word in self.pins:
+                return self.pins[word]
+
+        phrases = [
+            ' '.join(words[i:i + n])
+            for n in range(min(self.longest, len(words)), 0, -1)
+            for i in range(len(words) - n + 1)
+            if not words[i].isdigit()
+        ]
+        found = [entry for phrase in phrases for entry in self.names.get(phrase, ())]
+        cities = [entry for entry in found if entry.precision == 'city']
+        localities = [entry for entry in found if entry.precision == 'locality']
+        if not localities:
+            localities = self._fuzzy(phrases, 'locality')
+        if cities:
+            # "Model Town, Delhi": only localities around a city the text names
+            localities = [
+                entry for entry in localities
+                if any(haversine_km(entry.lat, entry.lon, city.lat, city.lon) <= NEARBY_CITY_KM
+                       for city in cities)
+            ]
+        if localities:
+            return localities[0]
+        return cities[0] if cities else next(iter(self._fuzzy(phrases, 'city')), None)
+
+    def _fuzzy(self, phrases, precision):
+        """Entries of `precision` whose name is most similar to one of the phrases"""
+        index = self.trigrams[precision]
+        min_score = getattr(settings, 'HMS_GEOCODE_MIN_SCORE', 0.85)
+        best_score, best = 0, []
+        for phrase in phrases:
+            if len(phrase) < 4 or len(phrase.split()) > 3:
+                continue
+            grams = _trigrams(phrase)
+            shared = Counter(name for gram in grams for name in index.get(gram, ()))
+            for name, count in shared.most_common(3):
+                if count * 2 < len(grams):
+                    break
+                score = SequenceMatcher(None, phrase, name).ratio()
+                if score >= min_score and score > best_score:
+                    best_score = score
+                    best = [entry for entry in self.names[name] if entry.precision == precision]
+        return best
+
+
+_gazetteer = None
+_lookup = None
+_lock = threading.Lock()
+
+
+def gazetteer():
+    """The gazetteer of HMS_GAZETTEER, loaded on first use"""
+    global _gazetteer
+    with _lock:
+        if _gazetteer is None:
+            _gazetteer = Gazetteer(settings.HMS_GAZETTEER)
+        return _gazetteer
+
+
+def reset():
+    """Drop the loaded gazetteer and the in-process cache (the memo table stays)"""
+    global _gazetteer, _lookup
+    with _lock:
+        _gazetteer = None
+        _lookup = None
+
+
+# ===============================
+# GEOCODING
+# ===============================
+def geocode(text):
+    """Place for a free-text location or address, or None"""
+    global _lookup
+    if not text or not text.strip():
+        return None
+    lookup = _lookup
+    if lookup is None:
+        with _lock:
+            if _lookup is None:
+                _lookup = lru_cache(maxsize=getattr(settings, 'HMS_GEOCODE_CACHE_SIZE', 4096))(_geocode)
+            lookup = _lookup
+    return lookup(text)
+
+
+def _geocode(text):
+    normalized = normalize(text)
+    if not normalized:
+        return None
+    gaz = gazetteer()
+    key = hashlib.sha1(f'{gaz.version}:{normalized}'.encode()).hexdigest()
+    memo = GeocodeMemo.objects.filter(key=key).values_list('latitude', 'longitude', 'place', 'precision').first()
+    if memo:
+        return Place(*memo) if memo[0] is not None else None
+
+    entry = gaz.resolve(normalized)
+    place = Place(entry.lat, entry.lon, entry.name, entry.precision) if entry else None
+    memo = GeocodeMemo(
+        key=key, query=normalized[:1000],
+        latitude=place.lat if place else None, longitude=place.lon if place else None,
+        place=place.name if place else '', precision=place.precision if place else '',
+    )
+    pending = getattr(_deferred, 'memos', None)
+    if pending is None:
+        save_memos([memo])
+    else:
+        pending.append(memo)
+    return place
+
+
+# ===============================
+# MEMO WRITES
+# ===============================
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_memos():
+    """Collect the memo rows of geocode() calls in the block instead of inserting them"""
+    _deferred.memos = memos = []
+    try:
+        yield memos
+    finally:
+        _deferred.memos = None
+
+
+def save_memos(memos):
+    """Insert memo rows; a failure only costs the next process a re-match"""
+    if not memos:
+        return
+    try:
+        GeocodeMemo.objects.bulk_create(memos, ignore_conflicts=True)
+    except DatabaseError:
+        logger.warning('Could not memoize geocode of %r', [memo.query for memo in memos], exc_info=True)
@@ -0,0 +1,202 @@
+"""
+Registration (intake) pipeline shared by patient_register, home_care and appointment
+
+Each registration runs in one transaction.atomic() block with a fixed,
+small number of statements: assignment data (best doctor / hospital) is
+looked up once before the inserts, the patient is fetched or inserted
+without get_or_create savepoints, and nothing is written if any step fails
+(e.g. a taken appointment slot no longer leaves an orphan User/Patient).
+With sharding on, the hospital's shard transaction is nested inside and
+commits just before 'default'. Locations are geocoded before the
+transaction; a new geocode memo is inserted only once it has committed.
+"""
+
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .availability import SlotUnavailable, ensure_free
+from .geo import eta_minutes, format_eta
+from .geocoder import deferred_memos, geocode, save_memos
+from .credentials import initial_password, schedule_hash
+from .sharding import atomic_for, shard_for_hospital
+from .models import (
+    Patient, EmergencyCase, Appointment, HomeCareRequest, generate_patient_id
+)
+
+
+HOME_CARE_MODE_MAP = {
+    'Doctor Home Visit': 'home_visit',
+    'Doctor On Call Assistance': 'call_assist',
+}
+
+HOME_CARE_SYMPTOM_MAP = {
+    'Heart Attack Symptoms': 'pain',
+    'Breathing Difficulty': 'pain',
+    'Stroke Symptoms': 'stroke',
+    'Severe Weakness': 'weakness',
+}
+
+
+def _retry_once(func):
+    """Re-run a registration that lost a race on a unique column (phone, token)"""
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except IntegrityError:
+            return func(*args, **kwargs)
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def _get_or_create_patient(phone, name, user=None, **defaults):
+    """SELECT, then INSERT only for new patients; returns (patient, created)"""
+    patient = Patient.objects.filter(phone=phone).first()
+    if patient:
+        return patient, False
+
+    patient = Patient.objects.create(
+        phone=phone,
+        name=name,
+        user=user,
+        patient_id=generate_patient_id(),
+        password=initial_password(phone),
+        **defaults
+    )
+    schedule_hash(patient)
+    return patient, True
+
+
+def _position(text, lat, lon):
+    """
+    Device coordinates when given, else the geocoded location text (or None, None),
+    plus the geocode memo rows to save with _save_on_commit()
+    """
+    if lat is not None and lon is not None:
+        return lat, lon, []
+    with deferred_memos() as memos:
+        place = geocode(text)
+    return (place.lat, place.lon, memos) if place else (None, None, memos)
+
+
+def _save_on_commit(memos):
+    """Call inside the registration transaction: no write happens before or without it"""
+    if memos:
+        transaction.on_commit(partial(save_memos, memos))
+
+
+def _assigned_case(symptom, **fields):
+    """Unsaved EmergencyCase with doctor and hospital resolved up front"""
+    case = EmergencyCase(symptom=symptom, **fields)
+    case.assigned_doctor = case.get_best_doctor()
+    case.assigned_hospital = case.get_best_hospital()
+    if case.dispatch_km is not None:
+        case.eta = format_eta(eta_minutes(case.dispatch_km))
+    return case
+
+
+# ===============================
+# INTAKE SERVICES
+# ===============================
+@_retry_once
+def register_emergency(name, phone, location, symptom, care_mode='hospital', lat=None, lon=None):
+    """Emergency registration from the home page; returns (patient, case)"""
+    lat, lon, memos = _position(location, lat, lon)
+    case = _assigned_case(
+        symptom,
+        patient_name=name,
+        patient_phone=phone,
+        patient_location=location or '',
+        patient_latitude=lat,
+        patient_longitude=lon,
+        mode='Hospital Emergency' if care_mode == 'hospital' else 'Home Assistance',
+        status='Waiting',
+    )
+    with transaction.atomic(), atomic_for(case.assigned_hospital):
+        _save_on_commit(memos)
+        patient, _ = _get_or_create_patient(phone, name, location=location or '', latitude=lat, longitude=lon)
+        case.patient = patient
+        case.save()
+    return patient, case
+
+
+@_retry_once
+def register_home_care(name, phone, address, issue, mode, lat=None, lon=None):
+    """Home care request plus its emergency case; returns (patient, home_request, case)"""
+    lat, lon, memos = _position(address, lat, lon)
+    case = _assigned_case(
+        HOME_CARE_SYMPTOM_MAP.get(issue, 'pain'),
+        patient_name=name,
+        patient_phone=phone,
+        patient_location=address,
+        patient_latitude=lat,
+        patient_longitude=lon,
+        mode='Doctor Home Visit' if 'Home' in (mode or '') else 'Doctor On Call',
+        status='Doctor Assigned',
+    )
+    home_request = HomeCareRequest(
+        patient_name=name,
+        phone=phone,
+        address=address,
+        latitude=lat,
+        longitude=lon,
+        issue=issue.lower().replace(' ', '_'),
+        mode=HOME_CARE_MODE_MAP.get(mode, 'home_visit'),
+        assigned_doctor=case.assigned_doctor,
+        hospital=case.assigned_hospital,
+    )
+    if case.eta:
+        home_request.eta = case.eta
+    with transaction.atomic(), atomic_for(case.assigned_hospital):
+        _save_on_commit(memos)
+        home_request.save()
+        patient, _ = _get_or_create_patient(phone, name, address=address, latitude=lat, longitude=lon)
+        case.patient = patient
+        case.save()
+    return patient, home_request, case
+
+
+def book_appointment(name, phone, location, doctor, hospital, reason, date, time, duration=15):
+    """
+    Book an appointment, creating the patient's User and Patient if needed.
+    Returns (user, patient, appointment); raises availability.SlotUnavailable,
+    with nothing written, when the visit does not fit the doctor's day (or the
+    slot was taken by a concurrent booking). IntegrityError means another
+    request registered the same phone at the same moment.
+    """
+    with transaction.atomic(), atomic_for(hospital):
+        # First statement of the write transaction, so nothing else can book in between
+        ensure_free(doctor, date, time, duration, using=shard_for_hospital(hospital.pk if hospital else None))
+
+        user = User.objects.filter(username=phone).first()
+        if user is None:
+            user = User.objects.create(
+                username=phone, first_name=name, password=initial_password(phone)
+            )
+            schedule_hash(user)
+
+        patient, created = _get_or_create_patient(
+            phone, name, user=user, location=location or ''
+        )
+        if not created and location and patient.location != location:
+            patient.location = location
+            patient.save(update_fields=['location'])
+
+        try:
+            appointment = Appointment.objects.create(
+                patient=patient,
+                patient_name=name,
+                patient_phone=phone,
+                patient_location=location or '',
+                doctor=doctor,
+                hospital=hospital,
+                appointment_date=date,
+                appointment_time=time,
+                duration_minutes=duration,
+                reason=reason,
+            )
+        except IntegrityError as error:
+            # unique_active_appointment_slot is Appointment's only unique constraint
+            raise SlotUnavailable('That time slot has just been booked') from error
+    return user, patient, appointment
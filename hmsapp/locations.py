@@ -0,0 +1,124 @@
+"""
+Latest doctor positions from device pings, written behind
+
+record_ping() is all a location ping costs on the request path: the position
+replaces the doctor's previous one in an in-memory dict and moves the doctor
+in the dispatch index (geo.py). Nothing is written per ping. A background
+thread writes the positions that changed every HMS_LOCATION_FLUSH_INTERVAL
+seconds with bulk UPDATEs of Doctor.latitude/longitude/location_updated_at,
+so a doctor pinging every second costs one row write per interval, and a
+thousand doctors a handful of statements.
+
+latest() is what live tracking reads in the process that took the ping.
+Other worker processes see a position once it is flushed: live ETAs fall
+back to the Doctor row, and geo.doctor_index() re-reads recently written
+positions every HMS_GEO_INDEX_REFRESH_SECONDS. A position the database
+refused stays pending for the next flush; a hard kill loses at most one
+interval, which the next ping replaces anyway.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+from . import geo
+from .models import Doctor
+
+
+logger = logging.getLogger(__name__)
+
+_latest = {}      # doctor id -> (lat, lon, time)
+_dirty = set()    # doctor ids moved since the last flush
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def record_ping(doctor_id, lat, lon, at=None):
+    """Remember the doctor's position; it reaches the database with the next flush"""
+    at = at or timezone.now()
+    with _lock:
+        _latest[doctor_id] = (lat, lon, at)
+        _dirty.add(doctor_id)
+    geo.doctor_moved(doctor_id, lat, lon)
+    if _flusher is None or not _flusher.is_alive():
+        _ensure_flusher()
+
+
+def latest(doctor_id):
+    """(lat, lon, time) of the doctor's last ping in this process, or None"""
+    return _latest.get(doctor_id)
+
+
+def forget(doctor_id):
+    with _lock:
+        _latest.pop(doctor_id, None)
+        _dirty.discard(doctor_id)
+
+
+def reset():
+    """Forget every position (tests and benchmarks)"""
+    with _lock:
+        _latest.clear()
+        _dirty.clear()
+
+
+def pending_count():
+    with _lock:
+        return len(_dirty)
+
+
+# ===============================
+# WRITING
+# ===============================
+def flush():
+    """Write the positions that changed since the last flush; return how many doctors"""
+    with _flush_lock:
+        with _lock:
+            moved = {doctor_id: _latest[doctor_id] for doctor_id in _dirty}
+            _dirty.clear()
+        if not moved:
+            return 0
+        doctors = [
+            Doctor(pk=doctor_id, latitude=lat, longitude=lon, location_updated_at=at)
+            for doctor_id, (lat, lon, at) in moved.items()
+        ]
+        try:
+            # One UPDATE per batch, no signals: positions are not page-cache data
+            Doctor.objects.bulk_update(doctors, ['latitude', 'longitude', 'location_updated_at'],
+                                       batch_size=500)
+        except DatabaseError:
+            logger.exception('Could not write %d doctor positions; retrying next flush', len(moved))
+            with _lock:
+                _dirty.update(doctor_id for doctor_id in moved if doctor_id in _latest)
+            return 0
+        return len(moved)
+
+
+# ===============================
+# BACKGROUND FLUSHER
+# ===============================
+def _run_flusher():
+    while True:
+        time.sleep(getattr(settings, 'HMS_LOCATION_FLUSH_INTERVAL', 5.0))
+        try:
+            if flush():
+                close_old_connections()
+        except Exception:
+            logger.exception('Doctor position flush failed')
+
+
+def _ensure_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            if _flusher is None:
+                atexit.register(flush)
+            _flusher = threading.Thread(target=_run_flusher, name='hms-locations', daemon=True)
+            _flusher.start()
@@ -0,0 +1,45 @@
+"""
+Management command to move old finished cases into the archive table
+Usage: python manage.py hms_archive [--days 30] [--batch-size 500] [--dry-run]
+
+Completed and Cancelled cases untouched for --days (default
+settings.HMS_ARCHIVE_AFTER_DAYS) move to ArchivedEmergencyCase in short
+batches, so it is safe to run from cron while the site is live.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hmsapp import sharding
+from hmsapp.archive import archivable, archive_cases, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Archive completed/cancelled emergency cases older than N days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Age in days (default: settings.HMS_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows moved per transaction')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the cases that would move')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['dry_run']:
+            cutoff = archive_cutoff(options['days'])
+            for alias in sharding.shards():
+                self.stdout.write(f'{alias}: {archivable(alias, cutoff).count()} case(s) to archive')
+            return
+
+        stats = archive_cases(
+            days=options['days'], batch_size=options['batch_size'], pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {stats["moved"]} case(s) in {stats["batches"]} batch(es), '
+            f'{stats["seconds"]:.2f}s (longest batch {stats["longest_batch"] * 1000:.0f} ms)'
+        ))
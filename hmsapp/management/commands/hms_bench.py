@@ -0,0 +1,1314 @@
+"""
+Management command to benchmark HMS hot paths on a throwaway database
+Usage: python manage.py hms_bench <scenario> [--requests N] [--concurrency N]
+
+The benchmark never touches db.sqlite3: a temporary SQLite file is created,
+migrated, seeded with synthetic data and removed afterwards.
+"""
+
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.template import engines
+from django.test import Client, override_settings
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.http import urlencode
+
+from hmsapp import activity, agenda, autocomplete, availability, exports, geo, geocoder, intake, locations, search, sharding
+from hmsapp.archive import archive_cases
+from hmsapp.retention import expire_activity_logs, search_archive
+from hmsapp.credentials import wait_for_pending
+from hmsapp.routers import read_from, sync_replica
+from hmsapp.snapshots import create_snapshot
+from hmsapp.sqlite import SQLITE_PROFILES, read_pragmas
+from hmsapp.models import (
+    Doctor, Hospital, EmergencyCase, Patient, Appointment, DoctorActivityLog, HomeCareRequest
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark HMS request paths against a temporary database'
+
+    scenarios = {
+        'pages': 'bench_pages',
+        'registration': 'bench_registration',
+        'intake': 'bench_intake',
+        'sqlite': 'bench_sqlite',
+        'snapshot': 'bench_snapshot',
+        'replica': 'bench_replica',
+        'shards': 'bench_shards',
+        'archive': 'bench_archive',
+        'activity': 'bench_activity',
+        'retention': 'bench_retention',
+        'concurrency': 'bench_concurrency',
+        'slots': 'bench_slots',
+        'holds': 'bench_holds',
+        'agenda': 'bench_agenda',
+        'dispatch': 'bench_dispatch',
+        'pings': 'bench_pings',
+        'geocode': 'bench_geocode',
+        'admin': 'bench_admin',
+        'search': 'bench_search',
+        'autocomplete': 'bench_autocomplete',
+        'export': 'bench_export',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(self.scenarios))
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per measured phase')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Worker threads per measured phase')
+        parser.add_argument('--duration', type=float, default=5.0,
+                            help='Seconds per phase for time-boxed scenarios')
+
+    def handle(self, *args, **options):
+        self.options = options
+        settings.DEBUG = False  # no query log overhead while measuring
+        with self.bench_database():
+            getattr(self, self.scenarios[options['scenario']])()
+
+    # ===============================
+    # HELPERS
+    # ===============================
+    @contextmanager
+    def bench_database(self):
+        tmpdir = tempfile.mkdtemp(prefix='hms-bench-')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        cache.clear()
+        try:
+            yield tmpdir
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            cache.clear()
+
+    def seed(self, doctors=10, hospitals=6, cases=200):
+        specs = [code for code, _ in Doctor.SPECIALIZATION_CHOICES]
+        for i in range(doctors):
+            Doctor.objects.create(
+                name=f'Dr. Bench {i:04d}', doctor_id=f'BDOC{i:05d}',
+                specialization=specs[i % len(specs)], status='available',
+            )
+        for i in range(hospitals):
+            Hospital.objects.create(
+                name=f'Bench Hospital {i}', address=f'{i} Bench Road, New Delhi',
+                phone='011-0000000', emergency_load=['low', 'medium', 'high'][i % 3],
+            )
+        symptoms = [code for code, _ in EmergencyCase.SYMPTOM_CHOICES]
+        for i in range(cases):
+            EmergencyCase.objects.create(
+                patient_name=f'Bench Patient {i}', patient_phone=f'90000{i:05d}',
+                symptom=symptoms[i % len(symptoms)], token=f'BN-{i:06d}',
+                status=['Waiting', 'Doctor Assigned', 'In Progress'][i % 3],
+            )
+
+    def run_load(self, func, total=None, concurrency=None):
+        """Call func(i) `total` times over `concurrency` threads; return stats"""
+        total = total or self.options['requests']
+        concurrency = concurrency or self.options['concurrency']
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(i):
+            start = time.perf_counter()
+            func(i)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+        started = time.perf_counter()
+        if concurrency == 1:
+            # Inline, so connection-level instrumentation sees every query
+            for i in range(total):
+                worker(i)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(worker, range(total)))
+            connections.close_all()
+        wall = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'rps': total / wall,
+            'p50': statistics.median(latencies) * 1000,
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        }
+
+    def report(self, label, stats):
+        self.stdout.write(
+            f'  {label:<38} {stats["rps"]:>9.1f} req/s   '
+            f'p50 {stats["p50"]:>7.2f} ms   p99 {stats["p99"]:>7.2f} ms'
+        )
+
+    # ===============================
+    # SCENARIOS
+    # ===============================
+    def bench_pages(self):
+        """Public pages with and without the role-varied page cache"""
+        self.seed()
+        local = threading.local()
+
+        def get(path):
+            def call(i):
+                if not hasattr(local, 'client'):
+                    local.client = Client()
+                response = local.client.get(path)
+                assert response.status_code == 200, response.status_code
+            return call
+
+        self.stdout.write('Public page throughput')
+        for path in ['/', '/emergency-queue/', '/appointment/']:
+            with override_settings(HMS_PAGE_CACHE_ENABLED=False):
+                self.report(f'{path} (uncached)', self.run_load(get(path)))
+            cache.clear()
+            self.report(f'{path} (cached)', self.run_load(get(path)))
+
+        stampede = min(self.options['requests'], 500)
+        self.stdout.write(f'\nStampede: {stampede} simultaneous misses on /emergency-queue/')
+        cache.clear()
+        barrier = threading.Barrier(stampede)
+        misses = []
+
+        def hit(i):
+            client = Client()
+            barrier.wait()
+            response = client.get('/emergency-queue/')
+            if response['X-HMS-Cache'] == 'miss':
+                misses.append(i)
+            connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=stampede) as pool:
+            list(pool.map(hit, range(stampede)))
+        self.stdout.write(f'  renders: {len(misses)} (cache hits: {stampede - len(misses)})')
+
+    def registration_posts(self, offset):
+        """POST callables for the three intake endpoints, unique phone per call"""
+        doctor_ids = list(Doctor.objects.values_list('id', flat=True))
+
+        def phone(i):
+            return f'8{offset + i:09d}'
+
+        def patient_register(i):
+            Client().post('/patient/register/', {
+                'pName': f'Reg {i}', 'pPhone': phone(i), 'pLocation': 'Saket, Delhi',
+                'pSymptom': 'pain', 'careMode': 'hospital',
+            })
+
+        def home_care(i):
+            Client().post('/home-care/', {
+                'hcName': f'Home {i}', 'hcPhone': phone(i), 'hcAddress': 'Saket, Delhi',
+                'hcIssue': 'Stroke Symptoms', 'hcMode': 'Doctor Home Visit',
+            })
+
+        def appointment(i):
+            day = timezone.now().date() + timedelta(days=1 + i // 600)
+            Client().post('/appointment/', {
+                'pName': f'Appt {i}', 'pPhone': phone(i), 'pLocation': 'Saket, Delhi',
+                'pDoctor': doctor_ids[i % len(doctor_ids)], 'pSymptom': 'routine',
+                'appointment_date': day.isoformat(),
+                'appointment_time': f'{(i // len(doctor_ids)) % 600 // 60 + 8:02d}:{(i // len(doctor_ids)) % 60:02d}',
+            })
+
+        return {
+            '/patient/register/': patient_register,
+            '/home-care/': home_care,
+            '/appointment/': appointment,
+        }
+
+    def bench_registration(self):
+        """Intake endpoints with inline vs deferred PBKDF2 hashing"""
+        self.seed(cases=0)
+        total = self.options['requests']
+        self.stdout.write('Registration latency (sequential, new patient per request)')
+        for offset, deferred in enumerate([False, True]):
+            label = 'deferred hash' if deferred else 'inline hash'
+            with override_settings(HMS_DEFERRED_PASSWORD_HASHING=deferred):
+                posts = self.registration_posts(offset * 10 * total)
+                for index, (path, post) in enumerate(posts.items()):
+                    shifted = lambda i, post=post, base=index * total: post(base + i)
+                    self.report(f'{path} ({label})', self.run_load(shifted, concurrency=1))
+                if deferred:
+                    started = time.perf_counter()
+                    wait_for_pending()
+                    self.stdout.write(
+                        f'  background worker drained in {time.perf_counter() - started:.2f} s; '
+                        f'pending left: {Patient.objects.filter(password__startswith="!").count()}'
+                    )
+
+    def bench_intake(self):
+        """Statements, write transactions and latency per intake request"""
+        self.seed(cases=0)
+        counts = {'statements': 0, 'commits': 0}
+        open_blocks = []
+
+        def count(execute, sql, params, many, context):
+            counts['statements'] += 1
+            db = context['connection']
+            if not sql.lstrip().upper().startswith(('SELECT', 'BEGIN')):
+                if not db.in_atomic_block:
+                    counts['commits'] += 1  # autocommit: one journal sync per write
+                elif not open_blocks or open_blocks[-1] is not db.atomic_blocks[0]:
+                    open_blocks.append(db.atomic_blocks[0])
+                    counts['commits'] += 1
+            return execute(sql, params, many, context)
+
+        total = self.options['requests']
+        self.stdout.write('Intake cost per request (new patient, deferred hashing)')
+        with override_settings(HMS_DEFERRED_PASSWORD_HASHING=True, HMS_PASSWORD_HASH_WORKER=False):
+            for index, (path, post) in enumerate(self.registration_posts(0).items()):
+                counts.update(statements=0, commits=0)
+                shifted = lambda i, post=post, base=index * total: post(base + i)
+                with connection.execute_wrapper(count):
+                    stats = self.run_load(shifted, concurrency=1)
+                self.report(path, stats)
+                self.stdout.write(
+                    f'  {"":<38} {counts["statements"] / total:>9.1f} statements   '
+                    f'{counts["commits"] / total:.1f} write transactions'
+                )
+
+    def mixed_load(self, write, read, duration=None):
+        """Run writer and reader threads for `duration` seconds; return stats"""
+        duration = duration or self.options['duration']
+        threads = self.options['concurrency']
+        stop = time.monotonic() + duration
+        lock = threading.Lock()
+        result = {'writes': 0, 'errors': 0, 'write_lat': [], 'read_lat': []}
+
+        def loop(func, latencies, count_writes):
+            try:
+                while time.monotonic() < stop:
+                    start = time.perf_counter()
+                    try:
+                        func()
+                    except OperationalError:
+                        with lock:
+                            result['errors'] += 1
+                        continue
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        if count_writes:
+                            result['writes'] += 1
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=loop, args=(write, result['write_lat'], True))
+                   for _ in range(threads)]
+        workers += [threading.Thread(target=loop, args=(read, result['read_lat'], False))
+                    for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        def percentile(values, q):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+        result['writes_per_s'] = result['writes'] / duration
+        for kind in ('write', 'read'):
+            result[f'{kind}_p50'] = percentile(result[f'{kind}_lat'], 0.5)
+            result[f'{kind}_p99'] = percentile(result[f'{kind}_lat'], 0.99)
+        return result
+
+    def bench_sqlite(self):
+        """Concurrent registrations + queue readers under each pragma profile"""
+        self.seed(cases=500)
+        counter = iter(range(10**9))
+        counter_lock = threading.Lock()
+
+        def write():
+            with counter_lock:
+                i = next(counter)
+            intake.register_emergency(f'Load {i}', f'7{i:09d}', 'Saket, Delhi', 'fever')
+
+        def read():
+            list(EmergencyCase.objects.filter(
+                status__in=['Waiting', 'Doctor Assigned', 'In Progress']
+            ).values('token', 'priority', 'status')[:50])
+
+        self.stdout.write(
+            f'{self.options["concurrency"]} writers + {self.options["concurrency"]} readers, '
+            f'{self.options["duration"]:.0f}s per profile'
+        )
+        with override_settings(HMS_DEFERRED_PASSWORD_HASHING=True, HMS_PASSWORD_HASH_WORKER=False):
+            for profile in SQLITE_PROFILES:
+                connections.close_all()  # new connections pick up the profile
+                with override_settings(HMS_SQLITE_PROFILE=profile):
+                    mode = read_pragmas(connection, ['journal_mode'])['journal_mode']
+                    stats = self.mixed_load(write, read)
+                self.stdout.write(
+                    f'  {profile:<11} ({mode:<6}) {stats["writes_per_s"]:>8.1f} writes/s  '
+                    f'write p99 {stats["write_p99"]:>7.2f} ms  '
+                    f'read p50 {stats["read_p50"]:>6.2f} ms  read p99 {stats["read_p99"]:>7.2f} ms  '
+                    f'locked errors {stats["errors"]}'
+                )
+
+    def bench_snapshot(self):
+        """Writer latency with and without an online snapshot running alongside"""
+        self.seed(cases=200)
+        symptoms = [code for code, _ in EmergencyCase.SYMPTOM_CHOICES]
+        EmergencyCase.objects.bulk_create([
+            EmergencyCase(
+                patient_name=f'Archive Patient {i}', patient_phone=f'80000{i:05d}',
+                symptom=symptoms[i % len(symptoms)], token=f'BS-{i:06d}',
+                status='Completed', symptom_description='x' * 400,
+            ) for i in range(50000)
+        ], batch_size=1000)
+        counter = iter(range(10**9))
+        counter_lock = threading.Lock()
+
+        def write():
+            with counter_lock:
+                i = next(counter)
+            intake.register_emergency(f'Load {i}', f'7{i:09d}', 'Saket, Delhi', 'fever')
+
+        def read():
+            EmergencyCase.objects.filter(status='Waiting').count()
+
+        def describe(label, stats):
+            self.stdout.write(
+                f'  {label:<22} {stats["writes_per_s"]:>8.1f} writes/s  '
+                f'write p50 {stats["write_p50"]:>7.2f} ms  p99 {stats["write_p99"]:>7.2f} ms  '
+                f'locked errors {stats["errors"]}'
+            )
+
+        source = connection.settings_dict['NAME']
+        output = os.path.join(os.path.dirname(source), 'snapshots')
+        with override_settings(HMS_DEFERRED_PASSWORD_HASHING=True, HMS_PASSWORD_HASH_WORKER=False):
+            connections.close_all()
+            describe('no snapshot', self.mixed_load(write, read))
+
+            snapshots = []
+
+            def snapshot_loop():
+                stop = time.monotonic() + self.options['duration']
+                while time.monotonic() < stop:
+                    snapshots.append(create_snapshot(source, output))
+
+            snapshotter = threading.Thread(target=snapshot_loop)
+            snapshotter.start()
+            stats = self.mixed_load(write, read)
+            snapshotter.join()
+            describe('snapshot running', stats)
+
+        for snap in snapshots:
+            self.stdout.write(
+                f'  snapshot: {snap["raw_bytes"] / 1048576:.1f} MiB in {snap["backup_seconds"]:.2f}s '
+                f'({snap["raw_bytes"] / 1048576 / snap["backup_seconds"]:.1f} MiB/s, '
+                f'{snap["steps"]} steps, {snap["restarts"]} restarts, {snap["mode"]}), '
+                f'gzip -> {snap["archive_bytes"] / 1048576:.1f} MiB in {snap["compress_seconds"]:.2f}s'
+            )
+
+    def bench_replica(self):
+        """Writer latency while dashboard reads hit the primary vs a SQLite replica"""
+        self.seed(cases=5000)
+        source = connection.settings_dict['NAME']
+        connections.settings['replica'] = connections.configure_settings({
+            **connections.settings,
+            'replica': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(os.path.dirname(source), 'replica.sqlite3'),
+            },
+        })['replica']
+        sync_replica('replica')
+
+        counter = iter(range(10**9))
+        counter_lock = threading.Lock()
+
+        def write():
+            with counter_lock:
+                i = next(counter)
+            intake.register_emergency(f'Load {i}', f'7{i:09d}', 'Saket, Delhi', 'fever')
+
+        def dashboard():
+            # The queries behind admin_dashboard
+            Doctor.objects.count()
+            Patient.objects.count()
+            EmergencyCase.objects.count()
+            EmergencyCase.objects.filter(status__in=['Waiting', 'Doctor Assigned']).count()
+            list(EmergencyCase.objects.order_by('-created_at')[:10])
+            list(Doctor.objects.all())
+            list(Hospital.objects.all())
+
+        self.stdout.write(
+            f'{self.options["concurrency"]} writers + {self.options["concurrency"]} dashboard readers, '
+            f'{self.options["duration"]:.0f}s per phase'
+        )
+        try:
+            with override_settings(HMS_DEFERRED_PASSWORD_HASHING=True, HMS_PASSWORD_HASH_WORKER=False,
+                                   HMS_READ_REPLICAS=['replica']):
+                for label, alias in (('reads on primary', None), ('reads on replica', 'replica')):
+                    def read():
+                        with read_from(alias):
+                            dashboard()
+
+                    stop = threading.Event()
+
+                    def syncer():
+                        while not stop.wait(1.0):
+                            sync_replica('replica')
+                        connections.close_all()
+
+                    sync_thread = threading.Thread(target=syncer)
+                    sync_thread.start()
+                    stats = self.mixed_load(write, read)
+                    stop.set()
+                    sync_thread.join()
+                    self.stdout.write(
+                        f'  {label:<17} {stats["writes_per_s"]:>8.1f} writes/s  '
+                        f'write p50 {stats["write_p50"]:>7.2f} ms  p99 {stats["write_p99"]:>7.2f} ms  '
+                        f'dashboard p50 {stats["read_p50"]:>7.2f} ms  errors {stats["errors"]}'
+                    )
+        finally:
+            connections['replica'].close()
+            del connections['replica']
+            del connections.settings['replica']
+
+    def bench_shards(self):
+        """Case-insert throughput as per-hospital shards are added"""
+        self.seed(cases=0, hospitals=4)
+        doctor = Doctor.objects.first()
+        hospitals = list(Hospital.objects.order_by('pk'))
+        tmpdir = os.path.dirname(connection.settings_dict['NAME'])
+        processes = self.options['concurrency']
+        duration = self.options['duration']
+
+        self.stdout.write(
+            f'{processes} writer processes, {duration:.0f}s per layout, '
+            f'"durable" profile (fsync per commit)'
+        )
+        for count in (1, 2, 4):
+            aliases = [f'bench_shard{n}' for n in range(1, count)]
+            configured = connections.configure_settings({
+                **connections.settings,
+                **{alias: {'ENGINE': 'django.db.backends.sqlite3',
+                           'NAME': os.path.join(tmpdir, f'{alias}-{count}.sqlite3')}
+                   for alias in aliases},
+            })
+            for alias in aliases:
+                connections.settings[alias] = configured[alias]
+            # hospitals[0] stays on 'default', one more hospital per shard
+            layout = {alias: [hospitals[n + 1].pk] for n, alias in enumerate(aliases)}
+            try:
+                with override_settings(HMS_SHARDS=layout, HMS_SQLITE_PROFILE='durable'):
+                    connections.close_all()
+                    for alias in aliases:
+                        call_command('migrate', database=alias, verbosity=0)
+                        connections[alias].close()
+                        sharding.reserve_id_block(alias)
+                    sharding.sync_reference_tables()
+                    connections.close_all()  # children must not share parent connections
+
+                    jobs = [(doctor.pk, hospitals[i % count].pk, duration) for i in range(processes)]
+                    with multiprocessing.get_context('fork').Pool(processes) as pool:
+                        results = pool.map(_insert_cases, jobs)
+
+                    # One network-wide read over the new rows, as hms_stats does
+                    started = time.perf_counter()
+                    total = sharding.count(EmergencyCase.objects.all())
+                    fan_out_ms = (time.perf_counter() - started) * 1000
+                    rows = [EmergencyCase.objects.using(alias).count() for alias in sharding.shards()]
+            finally:
+                for alias in aliases:
+                    connections[alias].close()
+                    del connections[alias]
+                    del connections.settings[alias]
+
+            latencies = sorted(lat for result in results for lat in result['latencies'])
+            self.stdout.write(
+                f'  {count} shard(s) {total / duration:>9.1f} writes/s  '
+                f'write p50 {statistics.median(latencies) * 1000:>7.2f} ms  '
+                f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:>8.2f} ms  '
+                f'locked errors {sum(result["errors"] for result in results)}  '
+                f'rows/shard {rows}  fan-out count {fan_out_ms:.1f} ms'
+            )
+            EmergencyCase.objects.all().delete()
+
+
+    def bench_archive(self):
+        """Active-queue reads before/after archiving a large history, and the archiver's lock time"""
+        self.seed(cases=500)
+        symptoms = [code for code, _ in EmergencyCase.SYMPTOM_CHOICES]
+        EmergencyCase.objects.bulk_create([
+            EmergencyCase(
+                patient_name=f'History Patient {i}', patient_phone=f'80000{i:05d}',
+                symptom=symptoms[i % len(symptoms)], token=f'BH-{i:06d}',
+                status=['Completed', 'Cancelled'][i % 2], symptom_description='x' * 200,
+            ) for i in range(100000)
+        ], batch_size=1000)
+        EmergencyCase.objects.filter(token__startswith='BH-').update(
+            updated_at=timezone.now() - timedelta(days=365)
+        )
+        counter = iter(range(10**9))
+        counter_lock = threading.Lock()
+
+        active = ['Waiting', 'Doctor Assigned', 'In Progress', 'Doctor En Route']
+
+        def queue(i=None):
+            # The emergency_queue page query
+            list(EmergencyCase.objects.filter(status__in=active)
+                 .select_related('assigned_doctor').order_by('score', 'created_at'))
+
+        def total(i=None):
+            # hms_stats / admin_dashboard totals
+            EmergencyCase.objects.count()
+            EmergencyCase.objects.filter(priority='Critical').count()
+
+        def measure(label):
+            connections.close_all()
+            rows = EmergencyCase.objects.filter(status__in=active).count()
+            self.report(f'queue ({rows} active), {label}', self.run_load(queue, total=200))
+            self.report(f'counts, {label}', self.run_load(total, total=200))
+
+        def write():
+            with counter_lock:
+                i = next(counter)
+            intake.register_emergency(f'Load {i}', f'7{i:09d}', 'Saket, Delhi', 'fever')
+
+        self.stdout.write(f'{EmergencyCase.objects.count()} cases, 100000 of them finished a year ago')
+        measure('history in table')
+
+        with override_settings(HMS_DEFERRED_PASSWORD_HASHING=True, HMS_PASSWORD_HASH_WORKER=False):
+            stats = self.mixed_load(write, lambda: queue())
+            self.stdout.write(
+                f'  no archiver: {stats["writes_per_s"]:.1f} writes/s, '
+                f'write p99 {stats["write_p99"]:.2f} ms, locked errors {stats["errors"]}'
+            )
+            archived = {}
+
+            def archiver():
+                archived.update(archive_cases(days=30))
+                connections.close_all()
+
+            archive_thread = threading.Thread(target=archiver)
+            archive_thread.start()
+            stats = self.mixed_load(write, lambda: queue())
+            archive_thread.join()
+        self.stdout.write(
+            f'  archived {archived["moved"]} rows in {archived["seconds"]:.2f}s '
+            f'({archived["moved"] / archived["seconds"]:.0f} rows/s, {archived["batches"]} batches, '
+            f'longest batch {archived["longest_batch"] * 1000:.1f} ms); meanwhile '
+            f'{stats["writes_per_s"]:.1f} writes/s, write p99 {stats["write_p99"]:.2f} ms, '
+            f'locked errors {stats["errors"]}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        measure('history archived')
+
+
+    def bench_activity(self):
+        """Cost of logging doctor activity inline vs through the write-behind buffer"""
+        self.seed(cases=0)
+        doctor_ids = list(Doctor.objects.values_list('pk', flat=True))
+
+        def log(i):
+            activity.log_activity(doctor_ids[i % len(doctor_ids)], 'case_updated', f'Updated case BN-{i:06d}')
+
+        for label, buffered in (('inline create()', False), ('write-behind buffer', True)):
+            with override_settings(HMS_ACTIVITY_LOG_BUFFERED=buffered):
+                stats = self.run_load(log)
+                started = time.perf_counter()
+                activity.flush()
+                drain_ms = (time.perf_counter() - started) * 1000
+            self.report(label, stats)
+            if buffered:
+                self.stdout.write(f'  {"":<38} final flush {drain_ms:.1f} ms')
+        self.stdout.write(f'  rows written: {DoctorActivityLog.objects.count()}')
+
+
+    def bench_retention(self):
+        """Activity log admin queries before/after exporting 180 days of history"""
+        self.seed(cases=0)
+        doctor_ids = list(Doctor.objects.values_list('pk', flat=True))
+        actions = [code for code, _ in DoctorActivityLog.ACTION_CHOICES]
+        now = timezone.now()
+        total = 300000
+        for start in range(0, total, 10000):
+            DoctorActivityLog.objects.bulk_create([
+                DoctorActivityLog(
+                    doctor_id=doctor_ids[i % len(doctor_ids)], action=actions[i % len(actions)],
+                    description=f'Updated case BN-{i:06d} to Completed',
+                    timestamp=now - timedelta(seconds=i * 180 * 86400 // total),
+                ) for i in range(start, start + 10000)
+            ])
+
+        def changelist(i=None):
+            # What the admin changelist runs: a page ordered by -timestamp and the counts
+            list(DoctorActivityLog.objects.select_related('doctor').order_by('-timestamp')[:100])
+            DoctorActivityLog.objects.count()
+
+        self.stdout.write(f'{total} log rows over 180 days, keeping 30')
+        self.report('changelist, full table', self.run_load(changelist, total=300))
+        output = os.path.join(os.path.dirname(connection.settings_dict['NAME']), 'activity')
+        started = time.perf_counter()
+        stats = expire_activity_logs(days=30, output_dir=output, batch_size=2000)
+        seconds = time.perf_counter() - started
+        size = sum(os.path.getsize(path) for path in stats['files'])
+        self.stdout.write(
+            f'  exported {stats["exported"]} rows into {len(stats["files"])} files in {seconds:.1f}s '
+            f'({stats["exported"] / seconds:.0f} rows/s), {size / 1048576:.1f} MiB gzip'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.report('changelist, 30 days kept', self.run_load(changelist, total=300))
+        started = time.perf_counter()
+        found = sum(1 for _ in search_archive(text='BN-150000', output_dir=output))
+        self.stdout.write(f'  full-archive text search: {found} hit(s) in {time.perf_counter() - started:.2f}s')
+        day = timezone.localdate() - timedelta(days=100)
+        started = time.perf_counter()
+        found = sum(1 for _ in search_archive(start=day, end=day, output_dir=output))
+        self.stdout.write(f'  one-day search: {found} entries in {(time.perf_counter() - started) * 1000:.0f} ms')
+
+
+    def bench_concurrency(self):
+        """Concurrent read-modify-write on a few hot cases: blind, pessimistic and optimistic saves"""
+        self.seed(cases=0)
+        hot = 10
+
+        def blind(pk, mark):
+            case = EmergencyCase.objects.get(pk=pk)
+            case.symptom_description += mark
+            case.save()
+            return 0
+
+        def pessimistic(pk, mark):
+            # BEGIN IMMEDIATE (transaction_mode) takes the write lock before the read
+            with transaction.atomic():
+                case = EmergencyCase.objects.get(pk=pk)
+                case.symptom_description += mark
+                case.save()
+            return 0
+
+        def optimistic(pk, mark):
+            retries = 0
+            while True:
+                case = EmergencyCase.objects.get(pk=pk)
+                if case.save_if_current(case.version, symptom_description=case.symptom_description + mark):
+                    return retries
+                retries += 1
+
+        self.stdout.write(
+            f'{self.options["requests"]} appends over {hot} hot cases, '
+            f'{self.options["concurrency"]} threads'
+        )
+        for label, update in (('full save(), no check', blind),
+                              ('atomic() + full save()', pessimistic),
+                              ('save_if_current()', optimistic)):
+            EmergencyCase.objects.all().delete()
+            pks = [EmergencyCase.objects.create(
+                patient_name=f'Hot {n}', symptom='fever', token=f'HT-{n:04d}',
+            ).pk for n in range(hot)]
+            retries = []
+            errors = []
+
+            def call(i):
+                try:
+                    retries.append(update(pks[i % hot], 'x'))
+                except OperationalError:
+                    errors.append(i)
+
+            stats = self.run_load(call)
+            kept = sum(len(text) for text in EmergencyCase.objects.values_list('symptom_description', flat=True))
+            self.report(label, stats)
+            self.stdout.write(
+                f'  {"":<38} lost updates {self.options["requests"] - len(errors) - kept}  '
+                f'retries {sum(retries)}  locked errors {len(errors)}'
+            )
+
+
+    def bench_slots(self):
+        """Free-slot and next-free-slot lookups over two busy weeks, uncached vs cached bitmaps"""
+        self.seed(doctors=60, cases=0)
+        doctors = list(Doctor.objects.all())
+        today = timezone.localdate()
+        days = [today + timedelta(days=n) for n in range(1, 15)]
+        appointments = []
+        for d, doctor in enumerate(doctors):
+            for day in days:
+                # Every other half hour booked, 30 minutes long: 8 of 16 starts stay free
+                for k in range(0, 16, 2):
+                    minutes = 9 * 60 + (k + d % 2) * 30
+                    appointments.append(Appointment(
+                        patient_name='Bench', doctor=doctor, appointment_date=day,
+                        appointment_time=datetime.time(*divmod(minutes, 60)),
+                        duration_minutes=30, reason='bench',
+                    ))
+        Appointment.objects.bulk_create(appointments, batch_size=2000)
+        self.stdout.write(f'{len(doctors)} doctors, {len(appointments)} appointments over {len(days)} days')
+
+        def free(i):
+            availability.free_slots(doctors[i % len(doctors)], days[i // len(doctors) % len(days)], 30)
+
+        def next_slot(duration):
+            def call(i):
+                specs = Doctor.SPECIALIZATION_CHOICES
+                availability.next_free_slot(specs[i % len(specs)][0], duration, start=days[0])
+            return call
+
+        total = len(doctors) * len(days)
+        self.report('free_slots(), cold cache', self.run_load(free, total=total, concurrency=1))
+        self.report('free_slots(), cached', self.run_load(free, total=total, concurrency=1))
+        self.report('next_free_slot(30 min), cached', self.run_load(next_slot(30), total=total, concurrency=1))
+        # No 60-minute gap anywhere: scans all 14 days of 10 doctors
+        self.report('next_free_slot(60 min), none free', self.run_load(next_slot(60), total=total, concurrency=1))
+
+        def check(i):
+            try:
+                availability.check_slot(doctors[i % len(doctors)], days[0], datetime.time(9, 0), 15)
+            except availability.SlotUnavailable:
+                pass
+
+        self.report('overlap check, cached', self.run_load(check, total=total, concurrency=1))
+
+    def bench_holds(self):
+        """Patients submitting the same appointment time at once, with and without slot holds"""
+        self.seed(doctors=1, cases=0)
+        Doctor.objects.update(work_start=datetime.time(0, 0), work_end=datetime.time(23, 45))
+        doctor = Doctor.objects.get()
+        concurrency = self.options['concurrency']
+        rounds = max(1, self.options['requests'] // concurrency)
+        lock = threading.Lock()
+        counts = {}
+        book = intake.book_appointment
+
+        def counted_book(*args, **kwargs):
+            # Every call is one write transaction on the database
+            with lock:
+                counts['transactions'] += 1
+            try:
+                return book(*args, **kwargs)
+            except Exception:
+                with lock:
+                    counts['wasted'] += 1
+                raise
+
+        self.stdout.write(f'{rounds} rounds of {concurrency} patients posting the same time')
+        for n, (label, holds) in enumerate((('no holds', False), ('slot holds', True))):
+            counts.update(transactions=0, wasted=0)
+            barrier = threading.Barrier(concurrency)
+            first_day = timezone.localdate() + timedelta(days=1 + n * 30)
+
+            def patient(worker):
+                client = Client()
+                latencies = []
+                for r in range(rounds):
+                    day, slot = first_day + timedelta(days=r // 95), r % 95
+                    barrier.wait()
+                    started = time.perf_counter()
+                    client.post('/appointment/', {
+                        'pName': 'Bench', 'pPhone': f'8{n}{worker:03d}{r:05d}', 'pDoctor': doctor.pk,
+                        'appointment_date': day.isoformat(),
+                        'appointment_time': f'{slot // 4:02d}:{slot % 4 * 15:02d}',
+                    })
+                    latencies.append(time.perf_counter() - started)
+                connections.close_all()
+                return latencies
+
+            with override_settings(HMS_SLOT_HOLDS=holds, HMS_DEFERRED_PASSWORD_HASHING=True,
+                                   HMS_PASSWORD_HASH_WORKER=False), \
+                    mock.patch.object(intake, 'book_appointment', counted_book):
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    latencies = sorted(l for result in pool.map(patient, range(concurrency)) for l in result)
+                wall = time.perf_counter() - started
+            booked = Appointment.objects.filter(appointment_date__gte=first_day,
+                                                appointment_date__lt=first_day + timedelta(days=30)).count()
+            self.report(label, {
+                'rps': len(latencies) / wall,
+                'p50': statistics.median(latencies) * 1000,
+                'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            })
+            self.stdout.write(
+                f'  {"":<38} booked {booked}/{rounds}  booking transactions {counts["transactions"]}  '
+                f'wasted (rolled back) {counts["wasted"]}'
+            )
+
+    def bench_agenda(self):
+        """Doctor dashboard data as the doctor's history grows: unbounded lists vs the cached agenda"""
+        self.seed(doctors=1, cases=0)
+        doctor = Doctor.objects.get()
+        today = timezone.localdate()
+        Appointment.objects.bulk_create([
+            Appointment(patient_name=f'Visit {i}', doctor=doctor, reason='bench', appointment_date=today,
+                        appointment_time=datetime.time(9 + i // 4, i % 4 * 15))
+            for i in range(20)
+        ])
+        for i in range(5):
+            EmergencyCase.objects.create(patient_name=f'Open {i}', symptom='fever',
+                                         token=f'BO-{i:06d}', assigned_doctor=doctor)
+
+        def unbounded(i=None):
+            # What doctor_dashboard used to load on every request
+            cases = list(EmergencyCase.objects.filter(assigned_doctor=doctor).order_by('score', 'created_at'))
+            list(Appointment.objects.filter(doctor=doctor, appointment_date=today).order_by('appointment_time'))
+            sum(1 for case in cases if case.status == 'Waiting')
+
+        def cold(i=None):
+            cache.clear()
+            agenda.agenda_for(doctor.id)
+
+        def warm(i=None):
+            agenda.agenda_for(doctor.id)
+
+        closed = 0
+        for target in (1000, 10000, 50000):
+            EmergencyCase.objects.bulk_create([
+                EmergencyCase(patient_name=f'Closed {n}', symptom='fever', token=f'BC-{n:06d}',
+                              assigned_doctor=doctor, status='Completed')
+                for n in range(closed, target)
+            ], batch_size=2000)
+            closed = target
+            self.stdout.write(f'{closed} closed cases in the history')
+            self.report('all assigned cases (before)', self.run_load(unbounded, total=50, concurrency=1))
+            self.report('agenda, rebuilt', self.run_load(cold, total=200, concurrency=1))
+            self.report('agenda, cached', self.run_load(warm, total=200, concurrency=1))
+
+    def bench_dispatch(self):
+        """Nearest-doctor queries against 10k doctors moving around Delhi: grid index vs a full scan"""
+        rng = random.Random(42)
+        south, north, west, east = 28.4, 28.9, 76.8, 77.4
+
+        def somewhere():
+            return rng.uniform(south, north), rng.uniform(west, east)
+
+        specs = [code for code, _ in Doctor.SPECIALIZATION_CHOICES]
+        Doctor.objects.bulk_create([
+            Doctor(name=f'Dr. Geo {i:05d}', doctor_id=f'GDOC{i:05d}', specialization=specs[i % len(specs)],
+                   latitude=lat, longitude=lon)
+            for i, (lat, lon) in enumerate(somewhere() for _ in range(10000))
+        ], batch_size=2000)
+        geo.reset_index()
+        started = time.perf_counter()
+        index = geo.doctor_index()
+        self.stdout.write(f'{len(index)} doctors indexed from the database in '
+                          f'{(time.perf_counter() - started) * 1000:.0f} ms')
+        ids = list(index._positions)
+
+        def move(i=None):
+            # A few hundred metres in any direction, like a position ping
+            doctor_id = rng.choice(ids)
+            lat, lon = index.position(doctor_id)
+            index.update(doctor_id, min(max(lat + rng.uniform(-0.003, 0.003), south), north),
+                         min(max(lon + rng.uniform(-0.003, 0.003), west), east))
+
+        def brute_force(i=None):
+            lat, lon = somewhere()
+            sorted((geo.haversine_km(lat, lon, d_lat, d_lon), doctor_id)
+                   for doctor_id, (d_lat, d_lon, _) in index._positions.items())[:5]
+
+        self.report('position update', self.run_load(move, total=100000, concurrency=1))
+        self.report('full scan, k=5 (before)', self.run_load(brute_force, total=100, concurrency=1))
+        for k in (1, 5):
+            self.report(f'grid index, k={k}',
+                        self.run_load(lambda i: index.nearest(*somewhere(), k=k), total=20000, concurrency=1))
+
+        stop = threading.Event()
+        moves = [0]
+
+        def mover():
+            while not stop.is_set():
+                move()
+                moves[0] += 1
+
+        thread = threading.Thread(target=mover, daemon=True)
+        thread.start()
+        started = time.perf_counter()
+        stats = self.run_load(lambda i: index.nearest(*somewhere(), k=5), total=20000, concurrency=1)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        thread.join()
+        self.report('grid index, k=5, doctors moving', stats)
+        self.stdout.write(f'  {"":<38} {moves[0] / elapsed:.0f} position updates/s alongside')
+        self.report('nearest_doctor() incl. DB fetch',
+                    self.run_load(lambda i: geo.nearest_doctor(*somewhere(), ('general',)), total=500,
+                                  concurrency=1))
+
+    def bench_pings(self):
+        """POST /api/location/ from 1000 doctors: a Doctor UPDATE per ping vs the write-behind store"""
+        rng = random.Random(45)
+        Doctor.objects.bulk_create([
+            Doctor(name=f'Dr. Ping {i:04d}', doctor_id=f'PDOC{i:05d}', latitude=28.6, longitude=77.2)
+            for i in range(1000)
+        ])
+        doctor_ids = list(Doctor.objects.values_list('pk', flat=True))
+        sessions = {}
+        for doctor_id in doctor_ids:
+            client = Client()
+            session = client.session
+            session['doctor_id'] = doctor_id
+            session.save()
+            sessions[doctor_id] = session.session_key
+        geo.reset_index()
+        geo.doctor_index()
+        total = max(self.options['requests'], 20000)
+        # Straight into the WSGI handler, as a server would call it (the test
+        # Client's instrumentation costs more than the request itself)
+        handler = WSGIHandler()
+        csrf = get_random_string(32)
+
+        def ping(i):
+            doctor_id = doctor_ids[i % len(doctor_ids)]
+            body = json.dumps({'lat': 28.6 + rng.uniform(-0.05, 0.05),
+                               'lon': 77.2 + rng.uniform(-0.05, 0.05)}).encode()
+            status = []
+            handler({
+                'REQUEST_METHOD': 'POST', 'PATH_INFO': '/api/location/', 'SCRIPT_NAME': '',
+                'QUERY_STRING': '', 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+                'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(body),
+                'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                'HTTP_COOKIE': f'{settings.SESSION_COOKIE_NAME}={sessions[doctor_id]}; '
+                               f'{settings.CSRF_COOKIE_NAME}={csrf}',
+                'HTTP_X_CSRFTOKEN': csrf,
+            }, lambda code, headers: status.append(code))
+            assert status[0].startswith('204'), status[0]
+
+        def update_row(doctor_id, lat, lon, at=None):
+            # What storing each ping on Doctor would cost
+            Doctor.objects.filter(pk=doctor_id).update(latitude=lat, longitude=lon,
+                                                       location_updated_at=timezone.now())
+
+        writes = [0]
+
+        def count_writes(execute, sql, params, many, context):
+            if sql.startswith('UPDATE "hmsapp_doctor"'):
+                writes[0] += 1
+            return execute(sql, params, many, context)
+
+        self.stdout.write(f'{total} pings from {len(doctor_ids)} doctors, '
+                          f'{self.options["concurrency"]} client threads')
+        with mock.patch.object(locations, 'record_ping', update_row):
+            self.report('UPDATE per ping (before)', self.run_load(ping, total=min(total, 5000)))
+
+        locations.reset()
+        with override_settings(HMS_LOCATION_FLUSH_INTERVAL=1.0), \
+                mock.patch.object(locations, 'flush', wraps=locations.flush) as flush:
+            started = time.perf_counter()
+            stats = self.run_load(ping, total=total)
+            elapsed = time.perf_counter() - started
+            with connection.execute_wrapper(count_writes):
+                flushed = locations.flush()
+        self.report('write-behind store', stats)
+        self.stdout.write(f'  {"":<38} {flush.call_count} background flushes in {elapsed:.1f} s; '
+                          f'final flush {flushed} doctors in {writes[0]} UPDATE statements')
+        self.report('record_ping() alone',
+                    self.run_load(lambda i: locations.record_ping(doctor_ids[i % 1000], 28.6, 77.2),
+                                  total=200000, concurrency=1))
+        locations.reset()  # nothing left for the exit flush once the database is gone
+
+    def bench_search(self):
+        """Patient search over 1M rows: LIKE '%x%' on every column vs the FTS5 trigram index"""
+        rng = random.Random(48)
+        rows = max(self.options['requests'], 1000000)
+        first = ['Asha', 'Ravi', 'Meera', 'Arjun', 'Kiran', 'Sunita', 'Vikram', 'Pooja', 'Imran', 'Neha']
+        last = ['Verma', 'Sharma', 'Kumar', 'Singh', 'Iyer', 'Khan', 'Reddy', 'Gupta', 'Das', 'Nair']
+        phones = rng.sample(range(7000000000, 9999999999), rows)
+        started = time.perf_counter()
+        for start in range(0, rows, 20000):
+            Patient.objects.bulk_create([
+                Patient(name=f'{rng.choice(first)} {rng.choice(last)}{i % 997}', patient_id=f'PAT-{i:09d}',
+                        phone=str(phones[i]), email=f'patient{i}@example.com')
+                for i in range(start, min(start + 20000, rows))
+            ])
+        self.stdout.write(f'{rows} patients inserted (FTS triggers on) in {time.perf_counter() - started:.0f}s')
+
+        probe = phones[rows // 2]
+        queries = [
+            ('phone fragment', str(probe)[2:8]),
+            ('patient id fragment', f'{rows // 3:09d}'[-6:]),
+            ('name + surname', 'meera iyer42'),
+            ('common name', 'sharma'),
+        ]
+        for label, text in queries:
+            self.report(f'{label}, LIKE (before)',
+                        self.run_load(lambda i: list(Patient.objects.filter(search.like_filter(Patient, text))
+                                                     .values('pk', 'name')[:20]), total=5, concurrency=1))
+            self.report(f'{label}, FTS5',
+                        self.run_load(lambda i: search.search(Patient, text, 20, ('pk', 'name')),
+                                      total=200, concurrency=1))
+
+        admin_user = User.objects.create_superuser('bench-admin', 'bench@example.com', 'x')
+        client = Client()
+        client.force_login(admin_user)
+        for label, text in [('phone fragment', str(probe)[2:8]), ('common name', 'sharma')]:
+            path = f'/admin/hmsapp/patient/?q={text}'
+            with mock.patch('hmsapp.admin.filter_queryset', return_value=None):
+                client.get(path)
+                self.report(f'admin ?q={label}, LIKE (before)',
+                            self.run_load(lambda i: client.get(path), total=5, concurrency=1))
+            client.get(path)
+            self.report(f'admin ?q={label}, FTS5', self.run_load(lambda i: client.get(path),
+                                                                   total=20, concurrency=1))
+
+        def register(i):
+            Patient.objects.create(name=f'New Patient {i}', patient_id=f'NEW-{i:07d}', phone=f'6{i:09d}')
+
+        self.report('Patient insert, indexed', self.run_load(register, total=500, concurrency=1))
+        with connection.cursor() as cursor:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER hmsapp_patient_fts_{suffix}')
+        self.report('Patient insert, no index', self.run_load(lambda i: register(i + 500), total=500,
+                                                              concurrency=1))
+        started = time.perf_counter()
+        search.install(connection)
+        search.optimize(connection)
+        self.stdout.write(f'  rebuild + optimize of all indexes: {time.perf_counter() - started:.1f}s')
+
+    def bench_admin(self):
+        """Admin changelists and change forms over large tables: statements and latency per page"""
+        rows = max(self.options['requests'], 200000)
+        self.seed(cases=0)
+        doctors = list(Doctor.objects.all())
+        started = time.perf_counter()
+        for start in range(0, rows, 10000):
+            chunk = range(start, min(start + 10000, rows))
+            Patient.objects.bulk_create([
+                Patient(name=f'Bench Patient {i}', patient_id=f'BP-{i:07d}', phone=f'8{i:09d}') for i in chunk
+            ])
+            EmergencyCase.objects.bulk_create([
+                EmergencyCase(patient_name=f'Bench Patient {i}', symptom='fever', token=f'BN-{i:07d}',
+                              assigned_doctor=doctors[i % len(doctors)],
+                              status=['Waiting', 'In Progress', 'Completed', 'Completed'][i % 4])
+                for i in chunk
+            ])
+            Appointment.objects.bulk_create([
+                Appointment(patient_name=f'Bench Patient {i}', doctor=doctors[i % len(doctors)], reason='bench',
+                            appointment_date=datetime.date(2020, 1, 1) + timedelta(days=i // 320),
+                            appointment_time=datetime.time(8 + i // 10 % 32 // 4, i // 10 % 4 * 15))
+                for i in chunk
+            ])
+            HomeCareRequest.objects.bulk_create([
+                HomeCareRequest(patient_name=f'Bench Patient {i}', phone=f'8{i:09d}', address='Saket',
+                                issue='weakness', token=f'HB-{i:07d}', assigned_doctor=doctors[i % len(doctors)])
+                for i in chunk
+            ])
+            DoctorActivityLog.objects.bulk_create([
+                DoctorActivityLog(doctor=doctors[i % len(doctors)], action='case_updated',
+                                  description=f'Updated case BN-{i:07d}') for i in chunk
+            ])
+        with connection.cursor() as cursor:
+            # Spread creation times over the last ~3 years
+            for table in ('patient', 'emergencycase', 'appointment', 'homecarerequest'):
+                cursor.execute(f"UPDATE hmsapp_{table} SET created_at = datetime('now', '-' || (id % 1000) || ' days')")
+            cursor.execute("UPDATE hmsapp_doctoractivitylog SET timestamp = datetime('now', '-' || (id % 1000) || ' days')")
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'{rows} rows in each of 5 tables, seeded in {time.perf_counter() - started:.0f}s')
+
+        admin_user = User.objects.create_superuser('bench-admin', 'bench@example.com', 'x')
+        client = Client()
+        client.force_login(admin_user)
+        week_ago = urlencode({'since': timezone.localtime() - timedelta(days=7)})[len('since='):]
+        case = EmergencyCase.objects.order_by('pk').first()
+        pages = [
+            ('cases', '/admin/hmsapp/emergencycase/'),
+            ('cases, status filter', '/admin/hmsapp/emergencycase/?status__exact=Waiting'),
+            ('cases, last 7 days', f'/admin/hmsapp/emergencycase/?created_at__gte={week_ago}'),
+            ('case change form', f'/admin/hmsapp/emergencycase/{case.pk}/change/'),
+            ('patients', '/admin/hmsapp/patient/'),
+            ('appointments', '/admin/hmsapp/appointment/'),
+            ('appointments, 2021', '/admin/hmsapp/appointment/?appointment_date__gte=2021-01-01'
+                                   '&appointment_date__lt=2022-01-01'),
+            ('appointment add form', '/admin/hmsapp/appointment/add/'),
+            ('home care requests', '/admin/hmsapp/homecarerequest/'),
+            ('activity log', '/admin/hmsapp/doctoractivitylog/'),
+            ('activity log, last 7 days', f'/admin/hmsapp/doctoractivitylog/?timestamp__gte={week_ago}'),
+        ]
+        statements = [0]
+
+        def count(execute, sql, params, many, context):
+            statements[0] += 1
+            return execute(sql, params, many, context)
+
+        for label, path in pages:
+            client.get(path)
+            statements[0] = 0
+            with connection.execute_wrapper(count):
+                response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+            stats = self.run_load(lambda i: client.get(path), total=10, concurrency=1)
+            self.report(f'{label} ({statements[0]} queries)', stats)
+
+    def bench_geocode(self):
+        """Typed locations: cold gazetteer match, memo table hit and in-process LRU hit"""
+        rng = random.Random(46)
+        gaz = geocoder.gazetteer()
+        localities = sorted({entries[0].name for entries in gaz.names.values()
+                             if entries[0].precision == 'locality'})
+        pins = sorted(gaz.pins)
+
+        def misspell(name):
+            i = rng.randrange(1, len(name) - 1)
+            return name[:i] + name[i + 1:]
+
+        forms = [
+            lambda i, place: f'House {i}, {place}, New Delhi',
+            lambda i, place: f'{i} {misspell(place)}',
+            lambda i, place: f'Flat {i}, near {place} {rng.choice(pins)}',
+        ]
+        texts = [forms[i % 3](i, rng.choice(localities)) for i in range(6000)]
+        self.stdout.write(f'{len(texts)} distinct texts; gazetteer of {len(gaz.names)} names, {len(gaz.pins)} PINs')
+
+        self.report('cold: match + memo insert', self.run_load(lambda i: geocoder.geocode(texts[i]),
+                                                                total=len(texts), concurrency=1))
+        matched = sum(geocoder.geocode(text) is not None for text in texts)
+        self.stdout.write(f'  {"":<38} {matched}/{len(texts)} resolved')
+
+        geocoder.reset()
+        geocoder.gazetteer()
+        self.report('memo table hit (new process)', self.run_load(lambda i: geocoder.geocode(texts[i]),
+                                                                   total=len(texts), concurrency=1))
+        # A working set that fits HMS_GEOCODE_CACHE_SIZE
+        self.report('in-process LRU hit', self.run_load(lambda i: geocoder.geocode(texts[i % 1000]),
+                                                         total=100000, concurrency=1))
+        self.report('normalize + match only', self.run_load(lambda i: gaz.resolve(geocoder.normalize(texts[i])),
+                                                             total=len(texts), concurrency=1))
+
+    def bench_autocomplete(self):
+        """Booking form: every doctor/hospital as <option>s vs the lazy prefix-trie pickers"""
+        rng = random.Random(49)
+        first = ['Asha', 'Ravi', 'Meera', 'Arjun', 'Kiran', 'Sunita', 'Vikram', 'Pooja', 'Imran', 'Neha']
+        last = ['Verma', 'Sharma', 'Kumar', 'Singh', 'Iyer', 'Khan', 'Reddy', 'Gupta', 'Das', 'Nair']
+        specializations = [key for key, _ in Doctor.SPECIALIZATION_CHOICES]
+        # The pickers as they were rendered before /api/autocomplete/
+        options = engines['django'].from_string(
+            '{% for doc in doctors %}<option value="{{ doc.id }}">{{ doc.name }} '
+            '({{ doc.get_specialization_display }})</option>{% endfor %}'
+            '{% for hospital in hospitals %}<option value="{{ hospital.id }}">{{ hospital.name }}</option>{% endfor %}'
+        )
+        Hospital.objects.bulk_create([Hospital(name=f'{rng.choice(last)} Memorial Hospital {i}', address='Pune',
+                                               phone=str(i)) for i in range(200)])
+        client = Client()
+        created = 0
+        for doctors in (100, 1000, 10000):
+            Doctor.objects.bulk_create([
+                Doctor(name=f'Dr. {rng.choice(first)} {rng.choice(last)}', doctor_id=f'AC{i:06d}',
+                       specialization=rng.choice(specializations), status=rng.choice(['available', 'busy', 'offline']))
+                for i in range(created, doctors)
+            ])
+            created = doctors
+            self.stdout.write(f'{doctors} doctors, 200 hospitals')
+
+            def render_options(i):
+                return options.render({
+                    'doctors': Doctor.objects.filter(status__in=['available', 'busy']),
+                    'hospitals': Hospital.objects.filter(is_active=True),
+                })
+
+            size = len(render_options(0)) // 1024
+            self.report(f'<option> lists ({size} KB, before)', self.run_load(render_options, total=50, concurrency=1))
+            with override_settings(HMS_PAGE_CACHE_ENABLED=False):
+                size = len(client.get('/appointment/').content) // 1024
+                self.report(f'booking page ({size} KB)', self.run_load(lambda i: client.get('/appointment/'),
+                                                                    total=50, concurrency=1))
+            autocomplete.reset()  # bulk_create sent no signals
+            started = time.perf_counter()
+            autocomplete.autocomplete('doctors')
+            self.stdout.write(f'  {"trie build":<38} {(time.perf_counter() - started) * 1000:.1f} ms')
+            queries = ['c', 'car', 'sha', 'meera sh', 'dr', '']
+            self.report('GET /api/autocomplete/', self.run_load(
+                lambda i: client.get('/api/autocomplete/', {'q': queries[i % len(queries)]}), total=500, concurrency=1))
+            for query in queries:
+                started = time.perf_counter()
+                for _ in range(10000):
+                    autocomplete.complete('doctors', query)
+                micros = (time.perf_counter() - started) * 100
+                self.stdout.write(f'  {f"complete({query!r}), top 10":<38} {micros:.1f} us')
+
+    def bench_export(self):
+        """Case exports: loading every row as the admin does vs streaming CSV / JSON lines"""
+        rows = max(self.options['requests'], 1000000)
+        self.seed(cases=0)
+        doctors = list(Doctor.objects.all())
+        hospitals = list(Hospital.objects.all())
+        started = time.perf_counter()
+        for start in range(0, rows, 20000):
+            EmergencyCase.objects.bulk_create([
+                EmergencyCase(patient_name=f'Export Patient {i}', patient_phone=f'9{i:09d}', symptom='fever',
+                              token=f'XP-{i:08d}', assigned_doctor=doctors[i % len(doctors)],
+                              assigned_hospital=hospitals[i % len(hospitals)],
+                              status=['Waiting', 'In Progress', 'Completed', 'Completed'][i % 4])
+                for i in range(start, min(start + 20000, rows))
+            ])
+        with connection.cursor() as cursor:
+            # One year of cases, oldest first
+            cursor.execute(f"UPDATE hmsapp_emergencycase SET created_at = "
+                           f"datetime('2025-01-01', '+' || (id * 31536 / {rows} * 1000) || ' seconds')")
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'{rows} cases seeded in {time.perf_counter() - started:.0f}s')
+
+        def measure(label, consume, count):
+            started = time.perf_counter()
+            consume()
+            elapsed = time.perf_counter() - started
+            tracemalloc.start()
+            consume()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write(f'  {label:<38} {count / elapsed:>11,.0f} rows/s   peak {peak / 2**20:>7.1f} MB')
+
+        month = {'start': datetime.date(2025, 1, 1), 'end': datetime.date(2025, 1, 31)}
+        in_month = exports.export_queryset('cases', **month).count()
+        measure(f'{in_month} rows as models (before)',
+                lambda: list(EmergencyCase.objects.select_related('assigned_doctor', 'assigned_hospital').filter(
+                    created_at__gte=timezone.make_aware(datetime.datetime(2025, 1, 1)),
+                    created_at__lt=timezone.make_aware(datetime.datetime(2025, 2, 1)))), in_month)
+        measure(f'{in_month} rows, CSV stream', lambda: sum(map(len, exports.stream('cases', **month))), in_month)
+        for chunk_size in (100, 2000, 10000):
+            measure(f'{rows} rows, CSV, chunk {chunk_size}',
+                    lambda: sum(map(len, exports.stream('cases', chunk_size=chunk_size))), rows)
+        measure(f'{rows} rows, JSON lines', lambda: sum(map(len, exports.stream('cases', 'jsonl'))), rows)
+        measure(f'{rows // 4} rows, status filter',
+                lambda: sum(map(len, exports.stream('cases', statuses=['Waiting']))), rows // 4)
+
+        admin_user = User.objects.create_superuser('bench-admin', 'bench@example.com', 'x')
+        client = Client()
+        client.force_login(admin_user)
+        measure(f'{rows} rows, GET /api/export/cases/',
+                lambda: sum(map(len, client.get('/api/export/cases/').streaming_content)), rows)
+
+def _insert_cases(job):
+    """Writer process for bench_shards: insert cases for one hospital until time is up"""
+    doctor_pk, hospital_pk, duration = job
+    doctor = Doctor.objects.get(pk=doctor_pk)
+    hospital = Hospital.objects.get(pk=hospital_pk)
+    result = {'latencies': [], 'errors': 0}
+    stop = time.monotonic() + duration
+    while time.monotonic() < stop:
+        start = time.perf_counter()
+        try:
+            EmergencyCase.objects.create(
+                patient_name='Shard Load', symptom='fever',
+                assigned_doctor=doctor, assigned_hospital=hospital,
+            )
+        except OperationalError:
+            result['errors'] += 1
+            continue
+        except IntegrityError:
+            continue  # token taken between the check and the insert
+        result['latencies'].append(time.perf_counter() - start)
+    connections.close_all()
+    return result
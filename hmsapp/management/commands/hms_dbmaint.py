@@ -0,0 +1,203 @@
+"""
+Management command for routine SQLite maintenance
+Usage: python manage.py hms_dbmaint [--analyze] [--integrity quick|full|skip]
+
+Safe to schedule hourly during live traffic: statistics are refreshed with a
+bounded analysis_limit, free pages are returned with incremental_vacuum in
+small write transactions separated by pauses, the WAL is checkpointed in
+PASSIVE mode and the integrity check / report only read.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'ANALYZE/optimize, incremental vacuum, integrity check and storage report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run ANALYZE on every table instead of PRAGMA optimize')
+        parser.add_argument('--analysis-limit', type=int, default=1000,
+                            help='Rows sampled per index by ANALYZE (0 = no limit)')
+        parser.add_argument('--vacuum-pages', type=int, default=200,
+                            help='Free pages released per incremental_vacuum step')
+        parser.add_argument('--vacuum-pause', type=float, default=0.05,
+                            help='Seconds to sleep between vacuum steps')
+        parser.add_argument('--max-vacuum-pages', type=int, default=20000,
+                            help='Upper bound on pages released per run')
+        parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                            help='One-time switch to auto_vacuum=INCREMENTAL (runs a full, '
+                                 'blocking VACUUM - do it in a maintenance window)')
+        parser.add_argument('--integrity', choices=['quick', 'full', 'skip'], default='quick')
+        parser.add_argument('--exact-counts', action='store_true',
+                            help='COUNT(*) every table instead of using sqlite_stat1 estimates')
+        parser.add_argument('--skip-report', action='store_true')
+
+    def handle(self, *args, **options):
+        self.connection = connections[options['database']]
+        if self.connection.vendor != 'sqlite':
+            raise CommandError('hms_dbmaint only supports SQLite databases')
+        self.options = options
+
+        self.optimize()
+        self.vacuum()
+        self.checkpoint()
+        self.integrity_check()
+        if not options['skip_report']:
+            self.report()
+
+    def pragma(self, statement):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {statement}')
+            return cursor.fetchall()
+
+    # ===============================
+    # MAINTENANCE STEPS
+    # ===============================
+    def optimize(self):
+        started = time.perf_counter()
+        self.pragma(f'analysis_limit = {self.options["analysis_limit"]}')
+        if self.options['analyze']:
+            with self.connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            step = 'ANALYZE'
+        else:
+            self.pragma('optimize')
+            step = 'PRAGMA optimize'
+        self.stdout.write(f'{step}: {time.perf_counter() - started:.2f}s')
+
+    def vacuum(self):
+        auto_vacuum = self.pragma('auto_vacuum')[0][0]
+        if auto_vacuum != 2:
+            if not self.options['enable_incremental_vacuum']:
+                free = self.pragma('freelist_count')[0][0]
+                self.stdout.write(self.style.WARNING(
+                    f'Incremental vacuum unavailable (auto_vacuum={auto_vacuum}); '
+                    f'{free} free page(s). Run once with --enable-incremental-vacuum.'
+                ))
+                return
+            started = time.perf_counter()
+            self.pragma('auto_vacuum = INCREMENTAL')
+            with self.connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+            self.stdout.write(f'Switched to auto_vacuum=INCREMENTAL: {time.perf_counter() - started:.2f}s')
+
+        released = 0
+        longest = 0.0
+        while released < self.options['max_vacuum_pages']:
+            free = self.pragma('freelist_count')[0][0]
+            if not free:
+                break
+            step = min(free, self.options['vacuum_pages'],
+                       self.options['max_vacuum_pages'] - released)
+            started = time.perf_counter()
+            # Each step is its own short write transaction
+            self.pragma(f'incremental_vacuum({step})')
+            longest = max(longest, time.perf_counter() - started)
+            released += step
+            time.sleep(self.options['vacuum_pause'])
+        self.stdout.write(
+            f'Incremental vacuum: released {released} page(s), '
+            f'longest write lock {longest * 1000:.1f} ms, '
+            f'{self.pragma("freelist_count")[0][0]} free page(s) left'
+        )
+
+    def checkpoint(self):
+        if self.pragma('journal_mode')[0][0] == 'wal':
+            busy, log, done = self.pragma('wal_checkpoint(PASSIVE)')[0]
+            self.stdout.write(f'WAL checkpoint (passive): {done}/{log} frame(s) copied')
+
+    def integrity_check(self):
+        if self.options['integrity'] == 'skip':
+            return
+        started = time.perf_counter()
+        check = 'quick_check' if self.options['integrity'] == 'quick' else 'integrity_check'
+        problems = [row[0] for row in self.pragma(check) if row[0] != 'ok']
+        elapsed = time.perf_counter() - started
+        if problems:
+            for problem in problems[:20]:
+                self.stderr.write(problem)
+            raise CommandError(f'{check} found {len(problems)} problem(s)')
+        self.stdout.write(self.style.SUCCESS(f'{check}: ok ({elapsed:.2f}s)'))
+
+    # ===============================
+    # STORAGE REPORT
+    # ===============================
+    def row_estimates(self):
+        """Row counts per table and index from sqlite_stat1 (filled by ANALYZE)"""
+        estimates = {}
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if not cursor.fetchone():
+                return estimates
+            cursor.execute('SELECT tbl, idx, stat FROM sqlite_stat1')
+            for table, index, stat in cursor.fetchall():
+                rows = int(stat.split()[0])
+                estimates[index or table] = rows
+                estimates.setdefault(table, rows)
+        return estimates
+
+    def btree_stats(self):
+        """Pages, unused bytes and out-of-order pages per table/index (dbstat)"""
+        stats = {}
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT name, pageno, unused, pgsize FROM dbstat ORDER BY name, path')
+            previous = {}
+            for name, pageno, unused, pgsize in cursor:
+                entry = stats.setdefault(name, {'pages': 0, 'unused': 0, 'bytes': 0, 'jumps': 0})
+                entry['pages'] += 1
+                entry['unused'] += unused
+                entry['bytes'] += pgsize
+                if name in previous and pageno != previous[name] + 1:
+                    entry['jumps'] += 1
+                previous[name] = pageno
+        return stats
+
+    def report(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, type, tbl_name FROM sqlite_master "
+                "WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%' "
+                "ORDER BY tbl_name, type DESC, name"
+            )
+            objects = cursor.fetchall()
+
+        estimates = self.row_estimates()
+        try:
+            stats = self.btree_stats()
+        except Exception as e:
+            stats = {}
+            self.stdout.write(self.style.WARNING(f'dbstat unavailable, page counts skipped: {e}'))
+
+        self.stdout.write('')
+        self.stdout.write(f'{"object":<56} {"type":<6} {"rows":>10} {"pages":>8} '
+                          f'{"unused":>7} {"frag":>6}')
+        self.stdout.write('-' * 98)
+        for name, kind, table in objects:
+            if self.options['exact_counts'] and kind == 'table':
+                with self.connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM "{name}"')
+                    rows = cursor.fetchone()[0]
+            else:
+                rows = estimates.get(name)
+            entry = stats.get(name, {'pages': 0, 'unused': 0, 'bytes': 0, 'jumps': 0})
+            unused = entry['unused'] / entry['bytes'] if entry['bytes'] else 0.0
+            frag = entry['jumps'] / (entry['pages'] - 1) if entry['pages'] > 1 else 0.0
+            label = name if kind == 'table' else f'  {name}'
+            self.stdout.write(
+                f'{label[:56]:<56} {kind:<6} {rows if rows is not None else "n/a":>10} '
+                f'{entry["pages"]:>8} {unused:>6.0%} {frag:>6.0%}'
+            )
+
+        page_count = self.pragma('page_count')[0][0]
+        page_size = self.pragma('page_size')[0][0]
+        free = self.pragma('freelist_count')[0][0]
+        self.stdout.write('-' * 98)
+        self.stdout.write(
+            f'database: {page_count} pages x {page_size} B = {page_count * page_size / 1048576:.1f} MiB, '
+            f'{free} free page(s) ({free / page_count if page_count else 0:.1%})'
+        )
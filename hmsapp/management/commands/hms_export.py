@@ -0,0 +1,63 @@
+"""
+Management command to export cases, appointments and home care requests
+Usage: python manage.py hms_export {cases,archived-cases,appointments,home-care}
+                                   [--format csv|jsonl] [--from DATE] [--to DATE]
+                                   [--status STATUS ...] [--output PATH]
+
+Rows are streamed (see hmsapp/exports.py), so any number of them exports in
+constant memory. Writes to stdout unless --output is given; a path ending
+in .gz is gzip-compressed. Rows per second are reported on stderr.
+"""
+
+import gzip
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from hmsapp import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream cases, archived cases, appointments or home care requests to CSV or JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(exports.EXPORTS))
+        parser.add_argument('--format', dest='fmt', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--from', dest='start', help='First day (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end', help='Last day (YYYY-MM-DD)')
+        parser.add_argument('--status', nargs='+', default=[], help='Only these statuses')
+        parser.add_argument('--output', help='File to write (default: stdout); .gz to compress')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE,
+                            help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        dates = {}
+        for key in ('start', 'end'):
+            try:
+                dates[key] = parse_date(options[key]) if options[key] else None
+            except ValueError:
+                dates[key] = None
+            if options[key] and dates[key] is None:
+                raise CommandError(f'Invalid date: {options[key]}')
+
+        stats = {}
+        try:
+            pieces = exports.stream(options['kind'], options['fmt'], dates['start'], dates['end'],
+                                    options['status'], options['chunk_size'], stats)
+        except exports.ExportError as error:
+            raise CommandError(error)
+        path = options['output']
+        if path is None:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+        else:
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'wt', encoding='utf-8', newline='') as output:
+                for piece in pieces:
+                    output.write(piece)
+        self.stderr.write(
+            f'Exported {stats["rows"]} {options["kind"]} row(s) in {stats["seconds"]:.1f}s '
+            f'({stats["rows"] / max(stats["seconds"], 1e-9):,.0f} rows/s)'
+        )
@@ -0,0 +1,21 @@
+"""
+Management command to write spooled doctor activity log entries
+Usage: python manage.py hms_flush_activity
+
+Entries the database refused during a flush are kept in
+settings.HMS_ACTIVITY_LOG_SPOOL; running processes replay the file on their
+next flush. Run this after an outage or a shutdown with no traffic left.
+"""
+
+from django.core.management.base import BaseCommand
+
+from hmsapp.activity import flush, spool_path
+
+
+class Command(BaseCommand):
+    help = 'Write doctor activity log entries left in the spool file'
+
+    def handle(self, *args, **options):
+        written = flush()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} activity log entries from the spool'))
+        self.stdout.write(f'Spool file: {spool_path()}')
@@ -0,0 +1,70 @@
+"""
+Management command to fill in coordinates from typed locations and addresses
+Usage: python manage.py hms_geocode [--batch-size 500] [--dry-run]
+
+Rows saved before geocoding existed (or whose text did not resolve then)
+have no coordinates. This geocodes their location/address text with the
+current gazetteer (see hmsapp/geocoder.py) and saves the coordinates in
+batches, on every shard. Rows that still do not resolve keep NULL.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hmsapp import sharding
+from hmsapp.geocoder import geocode
+from hmsapp.models import EmergencyCase, HomeCareRequest, Hospital, Patient
+
+
+# model, text fields (first non-empty wins), latitude field, longitude field
+TARGETS = [
+    (Hospital, ('address',), 'latitude', 'longitude'),
+    (Patient, ('location', 'address'), 'latitude', 'longitude'),
+    (EmergencyCase, ('patient_location',), 'patient_latitude', 'patient_longitude'),
+    (HomeCareRequest, ('address',), 'latitude', 'longitude'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Geocode hospitals, patients, cases and home care requests without coordinates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows read and updated per statement')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the rows that would be geocoded')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        for model, text_fields, lat_field, lon_field in TARGETS:
+            aliases = sharding.shards() if sharding.is_sharded(model) else ['default']
+            for alias in aliases:
+                pending = model.objects.using(alias).filter(**{f'{lat_field}__isnull': True})
+                if options['dry_run']:
+                    self.stdout.write(f'{model.__name__} on {alias}: {pending.count()} without coordinates')
+                    continue
+                found, missed = self.backfill(pending, text_fields, lat_field, lon_field, options['batch_size'])
+                self.stdout.write(f'{model.__name__} on {alias}: {found} geocoded, {missed} not found')
+
+    def backfill(self, pending, text_fields, lat_field, lon_field, batch_size):
+        found = missed = 0
+        last_pk = 0
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk).order_by('pk').only('pk', *text_fields)[:batch_size])
+            if not batch:
+                return found, missed
+            last_pk = batch[-1].pk
+            located = []
+            for obj in batch:
+                text = next((getattr(obj, field) for field in text_fields if getattr(obj, field)), '')
+                place = geocode(text)
+                if place is None:
+                    missed += 1
+                    continue
+                setattr(obj, lat_field, place.lat)
+                setattr(obj, lon_field, place.lon)
+                located.append(obj)
+            # No signals: coordinates are not shown on cached pages
+            pending.model.objects.using(pending.db).bulk_update(located, [lat_field, lon_field])
+            found += len(located)
@@ -0,0 +1,21 @@
+"""
+Management command to hash deferred initial passwords
+Usage: python manage.py hms_hash_pending [--batch-size N]
+
+Safe to run from cron: rows are updated only while still pending.
+"""
+
+from django.core.management.base import BaseCommand
+
+from hmsapp.credentials import hash_all_pending
+
+
+class Command(BaseCommand):
+    help = 'Hash initial patient passwords that were stored as pending markers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        hashed = hash_all_pending(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Hashed {hashed} pending credential(s)'))
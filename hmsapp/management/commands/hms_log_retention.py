@@ -0,0 +1,78 @@
+"""
+Management command for doctor activity log retention
+Usage: python manage.py hms_log_retention [--days 90] [--output DIR] [--dry-run]
+       python manage.py hms_log_retention --search [--from DATE] [--to DATE]
+                                          [--doctor ID] [--action A] [--contains TEXT]
+
+The first form exports rows older than --days to compressed, per-day JSONL
+files and deletes them; it is safe to run nightly from cron. --search
+prints matching archived entries as JSON lines, for audits.
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from hmsapp.models import DoctorActivityLog
+from hmsapp.retention import archive_dir, expire_activity_logs, search_archive
+
+
+class Command(BaseCommand):
+    help = 'Export old doctor activity logs to compressed archives, or search them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Keep this many days (default: settings.HMS_ACTIVITY_LOG_RETENTION_DAYS)')
+        parser.add_argument('--output', default=None,
+                            help='Archive directory (default: settings.HMS_ACTIVITY_LOG_ARCHIVE_DIR)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows fetched and deleted per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the rows that would be exported')
+        parser.add_argument('--search', action='store_true', help='Search the archive')
+        parser.add_argument('--from', dest='start', help='First day (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end', help='Last day (YYYY-MM-DD)')
+        parser.add_argument('--doctor', type=int, help='Doctor primary key')
+        parser.add_argument('--action', choices=[code for code, _ in DoctorActivityLog.ACTION_CHOICES])
+        parser.add_argument('--contains', help='Text in the description (case-insensitive)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['search']:
+            self.search(options)
+            return
+
+        stats = expire_activity_logs(
+            days=options['days'], output_dir=options['output'],
+            batch_size=options['batch_size'], dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(
+                f'{stats["exported"]} row(s) over {stats["days"]} day(s) '
+                f'older than {stats["cutoff"]:%Y-%m-%d} would be archived'
+            )
+            return
+        for path in stats['files']:
+            self.stdout.write(f'  {path}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {stats["exported"]} row(s) over {stats["days"]} day(s) '
+            f'to {options["output"] or archive_dir()}; deleted {stats["deleted"]}'
+        ))
+
+    def search(self, options):
+        dates = {}
+        for key in ('start', 'end'):
+            if options[key]:
+                dates[key] = parse_date(options[key])
+                if dates[key] is None:
+                    raise CommandError(f'Invalid date: {options[key]}')
+        found = 0
+        for entry in search_archive(
+            start=dates.get('start'), end=dates.get('end'), doctor_id=options['doctor'],
+            action=options['action'], text=options['contains'], output_dir=options['output'],
+        ):
+            self.stdout.write(json.dumps(entry, ensure_ascii=False))
+            found += 1
+        self.stderr.write(f'{found} archived entr{"y" if found == 1 else "ies"}')
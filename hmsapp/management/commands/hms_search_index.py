@@ -0,0 +1,39 @@
+"""
+Management command to rebuild the full-text search indexes
+Usage: python manage.py hms_search_index [--database ALIAS] [--no-optimize]
+
+The indexes are kept current by triggers (see hmsapp/search.py); rebuild
+them after restoring rows with triggers off, or if searches look wrong.
+Runs on every shard unless --database is given.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from hmsapp import search, sharding
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (and optimize) the FTS5 search indexes of patients, cases and home care requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', help='Only this database alias')
+        parser.add_argument('--no-optimize', action='store_true',
+                            help='Skip merging the rebuilt indexes into one b-tree each')
+
+    def handle(self, *args, **options):
+        aliases = [options['database']] if options['database'] else sharding.shards()
+        for alias in aliases:
+            connection = connections[alias]
+            if not search.supported(connection):
+                raise CommandError(f'{alias}: full-text search needs SQLite 3.34 or later')
+            started = time.perf_counter()
+            rebuilt = search.install(connection, rebuild=True)
+            if not options['no_optimize']:
+                search.optimize(connection)
+            self.stdout.write(self.style.SUCCESS(
+                f'{alias}: rebuilt {", ".join(rebuilt) or "nothing (not migrated)"} '
+                f'in {time.perf_counter() - started:.1f}s'
+            ))
@@ -0,0 +1,48 @@
+"""
+Management command to prepare and inspect per-hospital shards
+Usage: python manage.py hms_shards [--report]
+
+Migrates every alias in settings.HMS_SHARDS, reserves its id block and
+copies the Doctor/Hospital reference tables into it. Safe to re-run.
+"""
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from hmsapp.models import EmergencyCase, Appointment, HomeCareRequest
+from hmsapp.sharding import (
+    reserve_id_block, sharding_enabled, shards, sync_reference_tables
+)
+
+
+class Command(BaseCommand):
+    help = 'Migrate shards, reserve their id blocks and sync reference tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report', action='store_true',
+                            help='Only print the row distribution per shard')
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError('Sharding is off (settings.HMS_SHARDS is empty)')
+
+        if not options['report']:
+            for alias in shards()[1:]:
+                if connections[alias].vendor != 'sqlite':
+                    raise CommandError(f'{alias}: only SQLite shards are supported')
+                call_command('migrate', database=alias, verbosity=0)
+                # Reconnect so the shard pragmas (foreign_keys=OFF) apply
+                connections[alias].close()
+                reserve_id_block(alias)
+                self.stdout.write(f'{alias}: migrated, id block reserved')
+            sync_reference_tables()
+            self.stdout.write(self.style.SUCCESS('Reference tables copied to every shard'))
+
+        self.stdout.write(f'{"shard":<16} {"cases":>10} {"appointments":>13} {"home care":>10}')
+        for alias in shards():
+            self.stdout.write(
+                f'{alias:<16} {EmergencyCase.objects.using(alias).count():>10} '
+                f'{Appointment.objects.using(alias).count():>13} '
+                f'{HomeCareRequest.objects.using(alias).count():>10}'
+            )
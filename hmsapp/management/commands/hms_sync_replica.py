@@ -0,0 +1,44 @@
+"""
+Management command to keep local SQLite read replicas in sync
+Usage: python manage.py hms_sync_replica [--interval 5] [--once]
+
+Copies the primary into every alias in settings.HMS_READ_REPLICAS with the
+online backup API. Keep --interval below HMS_REPLICA_STICKY_SECONDS so a
+client that wrote reads from the primary until the replica has caught up.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hmsapp.routers import replica_aliases, sync_replica
+
+
+class Command(BaseCommand):
+    help = 'Refresh SQLite read replicas from the primary database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between syncs')
+        parser.add_argument('--once', action='store_true', help='Sync once and exit')
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Pages copied per backup step')
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError('No replicas configured (settings.HMS_READ_REPLICAS)')
+
+        while True:
+            for alias in aliases:
+                try:
+                    stats = sync_replica(alias, pages=options['pages'])
+                except ValueError as e:
+                    raise CommandError(str(e))
+                self.stdout.write(
+                    f'{alias}: {stats["pages"]} pages in {stats["seconds"] * 1000:.0f} ms '
+                    f'({stats["restarts"]} restart(s), {stats["mode"]})'
+                )
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0002_appointment_hospital_appointment_patient_location_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="homecarerequest",
+            name="hospital",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="hmsapp.hospital",
+            ),
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0003_homecarerequest_hospital"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedEmergencyCase",
+            fields=[
+                ("patient_name", models.CharField(max_length=100)),
+                ("patient_phone", models.CharField(default="", max_length=15)),
+                ("patient_location", models.CharField(default="", max_length=200)),
+                (
+                    "symptom",
+                    models.CharField(
+                        choices=[
+                            ("pain", "Chest Pain / Breathing Difficulty"),
+                            ("trauma", "Severe Physical Injury"),
+                            ("burn", "Burns"),
+                            ("fever", "High Fever / Flu"),
+                            ("stroke", "Stroke Symptoms"),
+                            ("weakness", "Severe Weakness"),
+                            ("routine", "Routine Checkup"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                ("symptom_description", models.TextField(blank=True)),
+                (
+                    "priority",
+                    models.CharField(
+                        choices=[
+                            ("Critical", "Critical"),
+                            ("High", "High"),
+                            ("Medium", "Medium"),
+                            ("Low", "Low"),
+                        ],
+                        default="Low",
+                        max_length=20,
+                    ),
+                ),
+                ("score", models.PositiveIntegerField(default=3)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Waiting", "Waiting"),
+                            ("Doctor Assigned", "Doctor Assigned"),
+                            ("In Progress", "In Progress"),
+                            ("Doctor En Route", "Doctor En Route"),
+                            ("Completed", "Completed"),
+                            ("Cancelled", "Cancelled"),
+                        ],
+                        default="Waiting",
+                        max_length=30,
+                    ),
+                ),
+                (
+                    "mode",
+                    models.CharField(
+                        choices=[
+                            ("Hospital Emergency", "Hospital Emergency"),
+                            ("Home Assistance", "Home Assistance"),
+                            ("Doctor Home Visit", "Doctor Home Visit"),
+                            ("Doctor On Call", "Doctor On Call Assistance"),
+                        ],
+                        default="Hospital Emergency",
+                        max_length=30,
+                    ),
+                ),
+                ("eta", models.CharField(blank=True, max_length=50)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("token", models.CharField(db_index=True, max_length=20)),
+                (
+                    "archived_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="emergencycase",
+            index=models.Index(
+                fields=["status", "score", "created_at"], name="hmsapp_case_queue_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedemergencycase",
+            name="assigned_doctor",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="hmsapp.doctor",
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedemergencycase",
+            name="assigned_hospital",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="hmsapp.hospital",
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedemergencycase",
+            name="patient",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="hmsapp.patient",
+            ),
+        ),
+    ]
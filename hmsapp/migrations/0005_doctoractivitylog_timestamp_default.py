@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0004_archivedemergencycase"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="doctoractivitylog",
+            name="timestamp",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
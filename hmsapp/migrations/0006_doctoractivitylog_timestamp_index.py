@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0005_doctoractivitylog_timestamp_default"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="doctoractivitylog",
+            name="timestamp",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0006_doctoractivitylog_timestamp_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedemergencycase",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="emergencycase",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
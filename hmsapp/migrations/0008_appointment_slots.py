@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:09
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0007_case_version"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="appointment",
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name="appointment",
+            name="duration_minutes",
+            field=models.PositiveSmallIntegerField(default=15),
+        ),
+        migrations.AddField(
+            model_name="doctor",
+            name="work_end",
+            field=models.TimeField(default=datetime.time(17, 0)),
+        ),
+        migrations.AddField(
+            model_name="doctor",
+            name="work_start",
+            field=models.TimeField(default=datetime.time(9, 0)),
+        ),
+        migrations.AddConstraint(
+            model_name="appointment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "Cancelled"), _negated=True),
+                fields=("doctor", "appointment_date", "appointment_time"),
+                name="unique_active_appointment_slot",
+            ),
+        ),
+    ]
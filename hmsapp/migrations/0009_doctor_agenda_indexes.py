@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0008_appointment_slots"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["doctor", "appointment_date"], name="hmsapp_appt_doctor_day_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedemergencycase",
+            index=models.Index(
+                fields=["assigned_doctor", "-created_at"],
+                name="hmsapp_arch_doctor_hist_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emergencycase",
+            index=models.Index(
+                fields=["assigned_doctor", "status"], name="hmsapp_case_doctor_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emergencycase",
+            index=models.Index(
+                fields=["assigned_doctor", "-created_at"],
+                name="hmsapp_case_doctor_hist_idx",
+            ),
+        ),
+    ]
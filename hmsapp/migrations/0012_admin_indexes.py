@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0011_geocoding"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["appointment_date", "appointment_time"],
+                name="hmsapp_appt_day_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(fields=["created_at"], name="hmsapp_appt_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedemergencycase",
+            index=models.Index(fields=["created_at"], name="hmsapp_arch_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedemergencycase",
+            index=models.Index(fields=["archived_at"], name="hmsapp_arch_archived_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="emergencycase",
+            index=models.Index(
+                fields=["score", "created_at"], name="hmsapp_case_order_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emergencycase",
+            index=models.Index(fields=["created_at"], name="hmsapp_case_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="homecarerequest",
+            index=models.Index(
+                fields=["created_at"], name="hmsapp_homecare_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="patient",
+            index=models.Index(
+                fields=["created_at"], name="hmsapp_patient_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0012_admin_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="emergencycase",
+            index=models.Index(
+                fields=["status", "created_at"], name="hmsapp_case_status_day_idx"
+            ),
+        ),
+    ]
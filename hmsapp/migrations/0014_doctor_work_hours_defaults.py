@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:06
+
+import hmsapp.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hmsapp", "0013_export_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="doctor",
+            name="work_end",
+            field=models.TimeField(default=hmsapp.models.default_work_end),
+        ),
+        migrations.AlterField(
+            model_name="doctor",
+            name="work_start",
+            field=models.TimeField(default=hmsapp.models.default_work_start),
+        ),
+    ]
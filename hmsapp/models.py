@@ -1,8 +1,54 @@
-from django.db import models
+from django.db import models, router
+from django.db.models import F
+from django.db.models.signals import post_save
 from django.contrib.auth.models import User
+from django.utils import timezone
+import datetime
 import random
 import string
 
+
+def generate_token(model, prefix, using=None):
+    """Random display token not yet used by `model` (widens if the space fills up)"""
+    digits = 4
+    for attempt in range(1, 100):
+        token = prefix + ''.join(random.choices(string.digits, k=digits))
+        if not model.objects.using(using).filter(token=token).exists():
+            return token
+        if attempt % 5 == 0:
+            digits += 1
+    raise RuntimeError(f'Could not generate a unique {model.__name__} token')
+
+
+def generate_patient_id():
+    """PAT-<yymmddHHMMSS><4 random digits>; unique even for same-second registrations"""
+    stamp = timezone.now().strftime('%y%m%d%H%M%S')
+    while True:
+        patient_id = f"PAT-{stamp}{''.join(random.choices(string.digits, k=4))}"
+        if not Patient.objects.filter(patient_id=patient_id).exists():
+            return patient_id
+
+
+def default_work_start():
+    # Callables: a fixed time default trips fields.W161 at some times of day
+    return datetime.time(9, 0)
+
+
+def default_work_end():
+    return datetime.time(17, 0)
+
+
+class ShardedQuerySet(models.QuerySet):
+    """create() routes by the new instance (its hospital picks the shard)"""
+    
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
 # ===============================
 # DOCTOR MODEL
 # ===============================
@@ -30,6 +76,13 @@ class Doctor(models.Model):
     email = models.EmailField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
     password = models.CharField(max_length=100, default='doctor123')
+    # Bookable hours for appointments (see availability.py)
+    work_start = models.TimeField(default=default_work_start)
+    work_end = models.TimeField(default=default_work_end)
+    # Latest known position, for home-visit dispatch (see geo.py)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    location_updated_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -58,6 +111,8 @@ class Patient(models.Model):
     gender = models.CharField(max_length=10, choices=GENDER_CHOICES, blank=True)
     address = models.TextField(blank=True)
     location = models.CharField(max_length=200, blank=True)  # NEW: Patient location
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     password = models.CharField(max_length=100, default='')  # For patient login
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -70,18 +125,32 @@ class Patient(models.Model):
         self.password = make_password(raw_password)
     
     def check_password(self, raw_password):
-        """Check password for patient"""
+        """Check password for patient (hashes a pending initial password on success)"""
         from django.contrib.auth.hashers import check_password
+        from .credentials import PENDING_PASSWORD, is_pending, matches_initial_password
+        
+        if is_pending(self.password):
+            if not matches_initial_password(raw_password, self.phone):
+                return False
+            self.set_password(raw_password)
+            Patient.objects.filter(pk=self.pk, password=PENDING_PASSWORD).update(password=self.password)
+            return True
         return check_password(raw_password, self.password)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Admin changelist order and created_at filter
+            models.Index(fields=['created_at'], name='hmsapp_patient_created_idx'),
+        ]
 
 
 # ===============================
 # EMERGENCY CASE MODEL (UPDATED)
 # ===============================
-class EmergencyCase(models.Model):
+class CaseRecord(models.Model):
+    """Columns shared by live cases and their archived copies"""
+    
     SYMPTOM_CHOICES = [
         ('pain', 'Chest Pain / Breathing Difficulty'),
         ('trauma', 'Severe Physical Injury'),
@@ -108,6 +177,16 @@ class EmergencyCase(models.Model):
         ('Cancelled', 'Cancelled'),
     ]
     
+    # Status changes a doctor may make; Completed and Cancelled are final
+    STATUS_TRANSITIONS = {
+        'Waiting': {'Doctor Assigned', 'Doctor En Route', 'In Progress', 'Completed', 'Cancelled'},
+        'Doctor Assigned': {'Doctor En Route', 'In Progress', 'Completed', 'Cancelled'},
+        'Doctor En Route': {'In Progress', 'Completed', 'Cancelled'},
+        'In Progress': {'Completed', 'Cancelled'},
+        'Completed': set(),
+        'Cancelled': set(),
+    }
+    
     MODE_CHOICES = [
         ('Hospital Emergency', 'Hospital Emergency'),
         ('Home Assistance', 'Home Assistance'),
@@ -120,6 +199,8 @@ class EmergencyCase(models.Model):
     patient_name = models.CharField(max_length=100)
     patient_phone = models.CharField(max_length=15, default='')  # NEW
     patient_location = models.CharField(max_length=200, default='')  # NEW
+    patient_latitude = models.FloatField(null=True, blank=True)
+    patient_longitude = models.FloatField(null=True, blank=True)
     symptom = models.CharField(max_length=50, choices=SYMPTOM_CHOICES)
     symptom_description = models.TextField(blank=True)
     
@@ -135,20 +216,26 @@ class EmergencyCase(models.Model):
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='Waiting')
     mode = models.CharField(max_length=30, choices=MODE_CHOICES, default='Hospital Emergency')
     
-    # Token & Tracking
-    token = models.CharField(max_length=20, unique=True)
+    # Tracking
     eta = models.CharField(max_length=50, blank=True)
     
+    # Optimistic concurrency: bumped by every save_if_current()
+    version = models.PositiveIntegerField(default=1)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        abstract = True
+
+
+class EmergencyCase(CaseRecord):
+    token = models.CharField(max_length=20, unique=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
     def save(self, *args, **kwargs):
-        # Auto-generate token if not set
-        if not self.token:
-            prefix = 'HC-' if 'Home' in self.mode or 'Call' in self.mode else 'SC-'
-            self.token = prefix + ''.join(random.choices(string.digits, k=4))
-        
         # Auto-assign priority based on symptom
         symptom_priority = {
             'pain': ('Critical', 1),
@@ -171,52 +258,141 @@ class EmergencyCase(models.Model):
             if not self.assigned_hospital:
                 self.assigned_hospital = self.get_best_hospital()
         
+        if not self._state.adding:
+            self.version += 1  # a full save still invalidates copies read before it
+        
+        # Auto-generate token if not set (unique within the row's shard)
+        if not self.token:
+            prefix = 'HC-' if 'Home' in self.mode or 'Call' in self.mode else 'SC-'
+            self.token = generate_token(
+                EmergencyCase, prefix, router.db_for_write(EmergencyCase, instance=self)
+            )
+        
         super().save(*args, **kwargs)
     
+    def save_if_current(self, version, **changes):
+        """
+        UPDATE only `changes` (plus version and updated_at), and only if the
+        row is still at `version`. Returns False when someone else saved the
+        case in the meantime; the instance is left untouched then.
+        """
+        now = timezone.now()
+        rows = EmergencyCase.objects.using(self._state.db).filter(pk=self.pk, version=version)
+        updated = rows.update(**changes, version=F('version') + 1, updated_at=now)
+        if not updated:
+            return False
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.version, self.updated_at = version + 1, now
+        # update() sends no post_save; send it so the cache receivers see the change
+        post_save.send(
+            sender=EmergencyCase, instance=self, created=False, raw=False,
+            using=self._state.db, update_fields=frozenset(changes),
+        )
+        return True
+    
+    SYMPTOM_DOCTOR_MAP = {
+        'pain': ['emergency', 'cardiology'],
+        'trauma': ['emergency', 'orthopedics'],
+        'burn': ['emergency'],
+        'stroke': ['emergency', 'cardiology'],
+        'weakness': ['general'],
+        'fever': ['general', 'outpatient'],
+        'routine': ['general', 'outpatient'],
+    }
+    
     def get_best_doctor(self):
-        """Get the best available doctor based on symptom"""
-        symptom_doctor_map = {
-            'pain': ['emergency', 'cardiology'],
-            'trauma': ['emergency', 'orthopedics'],
-            'burn': ['emergency'],
-            'stroke': ['emergency', 'cardiology'],
-            'weakness': ['general'],
-            'fever': ['general', 'outpatient'],
-            'routine': ['general', 'outpatient'],
-        }
+        """Get the best available doctor based on symptom (one query)"""
+        from django.db.models import Case, When, Value
+        from . import geo
         
-        specializations = symptom_doctor_map.get(self.symptom, ['general'])
+        specializations = self.SYMPTOM_DOCTOR_MAP.get(self.symptom, ['general'])
         
-        for spec in specializations:
-            doctor = Doctor.objects.filter(
-                specialization=spec,
-                status='available'
-            ).first()
-            if doctor:
+        # Home visits go to the nearest doctor, preferring the specialization
+        self.dispatch_km = None
+        if self.mode in geo.HOME_VISIT_MODES and geo.has_position(self, 'patient_latitude', 'patient_longitude'):
+            found = geo.nearest_doctor(self.patient_latitude, self.patient_longitude, specializations)
+            if found:
+                doctor, self.dispatch_km = found
                 return doctor
         
-        return Doctor.objects.filter(status='available').first()
+        # Preferred specializations first, in order, then any available doctor
+        rank = Case(
+            *[When(specialization=spec, then=Value(i)) for i, spec in enumerate(specializations)],
+            default=Value(len(specializations)),
+        )
+        return Doctor.objects.filter(status='available').order_by(rank, 'name').first()
     
     def get_best_hospital(self):
-        """Get the best available hospital"""
-        from django.db.models import Q
-        
-        # Prefer hospitals with low load
-        hospital = Hospital.objects.filter(
-            is_active=True,
-            emergency_load__in=['low', 'medium']
-        ).order_by('emergency_load').first()
+        """Get the best available hospital (one query)"""
+        from django.db.models import Case, When, Value
+        from . import geo
         
-        if not hospital:
-            hospital = Hospital.objects.filter(is_active=True).first()
+        # Prefer hospitals with low load, then medium, then any active one
+        rank = Case(
+            When(emergency_load='low', then=Value(0)),
+            When(emergency_load='medium', then=Value(1)),
+            default=Value(2),
+        )
+        hospitals = Hospital.objects.filter(is_active=True).annotate(rank=rank).order_by('rank', 'name')
+        if not geo.has_position(self, 'patient_latitude', 'patient_longitude'):
+            return hospitals.first()
         
-        return hospital
+        # The nearest of the least loaded ones (those without coordinates last)
+        hospitals = list(hospitals)
+        if not hospitals:
+            return None
+        tier = [hospital for hospital in hospitals if hospital.rank == hospitals[0].rank]
+        return min(tier, key=lambda hospital: geo.haversine_km(
+            self.patient_latitude, self.patient_longitude, hospital.latitude, hospital.longitude
+        ) if geo.has_position(hospital) else float('inf'))
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Doctor whose agenda holds the case, should it be reassigned (see agenda.py)
+        instance._loaded_doctor_id = instance.__dict__.get('assigned_doctor_id')
+        return instance
     
     def __str__(self):
         return f"{self.token} - {self.patient_name} ({self.priority})"
     
     class Meta:
         ordering = ['score', 'created_at']
+        indexes = [
+            # Active queue: status IN (...) ORDER BY score, created_at
+            models.Index(fields=['status', 'score', 'created_at'], name='hmsapp_case_queue_idx'),
+            # Doctor agenda (open cases) and doctor history (newest first)
+            models.Index(fields=['assigned_doctor', 'status'], name='hmsapp_case_doctor_idx'),
+            models.Index(fields=['assigned_doctor', '-created_at'], name='hmsapp_case_doctor_hist_idx'),
+            # Admin changelist: unfiltered order, created_at filter
+            models.Index(fields=['score', 'created_at'], name='hmsapp_case_order_idx'),
+            models.Index(fields=['created_at'], name='hmsapp_case_created_idx'),
+            # Exports of one status in date order (the queue index would need a sort)
+            models.Index(fields=['status', 'created_at'], name='hmsapp_case_status_day_idx'),
+        ]
+
+
+class ArchivedEmergencyCase(CaseRecord):
+    """A Completed/Cancelled case moved out of the live table (see archive.py)"""
+    
+    id = models.BigIntegerField(primary_key=True)  # the original EmergencyCase id
+    token = models.CharField(max_length=20, db_index=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"{self.token} - {self.patient_name} (archived)"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['assigned_doctor', '-created_at'], name='hmsapp_arch_doctor_hist_idx'),
+            # Admin changelist order and filters
+            models.Index(fields=['created_at'], name='hmsapp_arch_created_idx'),
+            models.Index(fields=['archived_at'], name='hmsapp_arch_archived_idx'),
+        ]
 
 
 # ===============================
@@ -240,6 +416,7 @@ class Appointment(models.Model):
     
     appointment_date = models.DateField()
     appointment_time = models.TimeField()
+    duration_minutes = models.PositiveSmallIntegerField(default=15)
     reason = models.TextField()
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Scheduled')
@@ -248,12 +425,35 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ShardedQuerySet.as_manager()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_doctor_id = instance.__dict__.get('doctor_id')
+        return instance
+    
     def __str__(self):
         return f"{self.patient_name} - {self.doctor.name} ({self.appointment_date})"
     
     class Meta:
         ordering = ['appointment_date', 'appointment_time']
-        unique_together = ['doctor', 'appointment_date', 'appointment_time']  # Prevent double booking
+        indexes = [
+            # Doctor agenda: one doctor's appointments of one day
+            models.Index(fields=['doctor', 'appointment_date'], name='hmsapp_appt_doctor_day_idx'),
+            # Admin changelist order and date hierarchy; created_at filter
+            models.Index(fields=['appointment_date', 'appointment_time'], name='hmsapp_appt_day_idx'),
+            models.Index(fields=['created_at'], name='hmsapp_appt_created_idx'),
+        ]
+        constraints = [
+            # Last line of defence against double booking; overlaps are
+            # rejected earlier by availability.ensure_free()
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'appointment_time'],
+                condition=~models.Q(status='Cancelled'),
+                name='unique_active_appointment_slot',
+            ),
+        ]
 
 
 # ===============================
@@ -271,6 +471,9 @@ class Hospital(models.Model):
     address = models.TextField()
     phone = models.CharField(max_length=15)
     email = models.EmailField(blank=True)
+    # Geocoded from the address on save unless set (see geocoder.py)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     
     emergency_load = models.CharField(max_length=20, choices=LOAD_CHOICES, default='low')
     is_active = models.BooleanField(default=True)
@@ -285,6 +488,21 @@ class Hospital(models.Model):
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        moved = self.address != getattr(self, '_loaded_address', self.address)
+        if self.address and (moved or self.latitude is None):
+            from .geocoder import geocode
+            place = geocode(self.address)
+            self.latitude, self.longitude = (place.lat, place.lon) if place else (None, None)
+        super().save(*args, **kwargs)
+        self._loaded_address = self.address
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_address = instance.__dict__.get('address')
+        return instance
+    
     class Meta:
         ordering = ['name']
 
@@ -316,10 +534,13 @@ class HomeCareRequest(models.Model):
     patient_name = models.CharField(max_length=100)
     phone = models.CharField(max_length=15)
     address = models.TextField()
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     issue = models.CharField(max_length=50, choices=ISSUE_CHOICES)
     mode = models.CharField(max_length=20, choices=MODE_CHOICES, default='home_visit')
     
     assigned_doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, blank=True)
+    hospital = models.ForeignKey(Hospital, on_delete=models.SET_NULL, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     
     eta = models.CharField(max_length=50, default='15-20 mins')
@@ -328,9 +549,13 @@ class HomeCareRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ShardedQuerySet.as_manager()
+    
     def save(self, *args, **kwargs):
         if not self.token:
-            self.token = 'HC-' + ''.join(random.choices(string.digits, k=4))
+            self.token = generate_token(
+                HomeCareRequest, 'HC-', router.db_for_write(HomeCareRequest, instance=self)
+            )
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -338,6 +563,10 @@ class HomeCareRequest(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Admin changelist order and created_at filter
+            models.Index(fields=['created_at'], name='hmsapp_homecare_created_idx'),
+        ]
 
 
 # ===============================
@@ -355,10 +584,28 @@ class DoctorActivityLog(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     description = models.TextField(blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)  # set when logged, not when flushed
     
     def __str__(self):
         return f"{self.doctor.name} - {self.action}"
     
     class Meta:
         ordering = ['-timestamp']
+
+
+# ===============================
+# GEOCODE MEMO MODEL
+# ===============================
+class GeocodeMemo(models.Model):
+    """A resolved location string (see geocoder.py); no coordinates = no match"""
+    
+    key = models.CharField(max_length=40, unique=True)  # sha1 of gazetteer version + normalized query
+    query = models.TextField()
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    place = models.CharField(max_length=100, blank=True)
+    precision = models.CharField(max_length=10, blank=True)  # pin, locality or city
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.query} -> {self.place or '?'}"
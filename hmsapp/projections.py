@@ -0,0 +1,64 @@
+"""
+Sparse fieldsets (?fields=) for the HMS JSON API
+
+Every API field names the ORM column it is read from, so a fieldset is pushed
+down into a .values() projection: unrequested TextFields are never loaded and
+a join happens only when a requested field crosses a relation.
+"""
+
+
+class FieldsetError(ValueError):
+    """Raised when ?fields= names a field the endpoint does not expose"""
+
+
+class ApiField:
+    """One API field: its source column and an optional display formatter.
+
+    A field without a column is the 1-based row number (e.g. queue_no).
+    """
+
+    def __init__(self, column=None, display=None):
+        self.column = column
+        self.display = display
+
+    def value(self, row, position):
+        if self.column is None:
+            return position
+        value = row[self.column]
+        return self.display(value) if self.display else value
+
+
+def choice_display(choices):
+    """Formatter mirroring get_FOO_display() without loading the model"""
+    labels = dict(choices)
+    return lambda value: labels.get(value, value)
+
+
+def parse_fields(raw, spec):
+    """Turn a comma-separated ?fields= value into an ordered list of names"""
+    if not raw:
+        return list(spec)
+
+    fields = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in spec]
+    if unknown or not fields:
+        raise FieldsetError(
+            f'Unknown field(s): {", ".join(unknown) or "(none given)"}. '
+            f'Available: {", ".join(spec)}'
+        )
+    return fields
+
+
+def project(queryset, spec, fields, fetch=list):
+    """
+    Fetch only the columns behind `fields` and build the API rows.
+    `fetch` evaluates the values() queryset (e.g. sharding.collect).
+    """
+    columns = list(dict.fromkeys(
+        spec[name].column for name in fields if spec[name].column
+    ))
+    rows = fetch(queryset.values(*columns) if columns else queryset.values('pk'))
+    return [
+        {name: spec[name].value(row, position) for name in fields}
+        for position, row in enumerate(rows, 1)
+    ]
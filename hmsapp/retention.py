@@ -0,0 +1,182 @@
+"""
+Retention for DoctorActivityLog
+
+Log rows older than settings.HMS_ACTIVITY_LOG_RETENTION_DAYS (whole days)
+are exported to gzip-compressed JSON lines, one file per day, under
+settings.HMS_ACTIVITY_LOG_ARCHIVE_DIR, and then deleted in small batches.
+Rows are streamed with iterator(), so memory use does not depend on the
+size of the table.
+
+There is one file per day, activity-<YYYY-MM-DD>.jsonl.gz, in id order.
+Exporting a day merges its archive with the rows still in the table
+(skipping ids already archived) into a temporary file that then replaces
+it, so re-running after an interrupted delete, or for rows that arrive
+later for an archived day (e.g. a replayed spool), archives each row once.
+Files named activity-<YYYY-MM-DD>-<first id>.jsonl.gz by earlier versions
+are read too and merged into the day's file on its next export.
+search_archive() scans the files, skipping days outside the requested range
+by file name alone.
+"""
+
+import gzip
+import heapq
+import json
+import os
+import re
+from datetime import datetime, time, timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DoctorActivityLog
+
+
+EXPORT_FIELDS = ('id', 'doctor_id', 'doctor__name', 'action', 'description', 'timestamp')
+FILE_RE = re.compile(r'^activity-(\d{4}-\d{2}-\d{2})(?:-(\d+))?\.jsonl\.gz$')
+
+
+def archive_dir():
+    return str(getattr(settings, 'HMS_ACTIVITY_LOG_ARCHIVE_DIR',
+                       os.path.join(settings.BASE_DIR, 'archive', 'activity')))
+
+
+def retention_cutoff(days=None):
+    """Midnight (current timezone) `days` days ago; older rows are exported"""
+    days = getattr(settings, 'HMS_ACTIVITY_LOG_RETENTION_DAYS', 90) if days is None else days
+    today = timezone.localdate()
+    return timezone.make_aware(datetime.combine(today - timedelta(days=days), time.min))
+
+
+def _day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+# ===============================
+# EXPORT & DELETE
+# ===============================
+def _export_day(day, output_dir, chunk_size):
+    """
+    Merge one day's rows into its archive file; return (path, rows newly
+    archived, last id in the table)
+    """
+    start, end = _day_range(day)
+    rows = (DoctorActivityLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            .order_by('pk').values(*EXPORT_FIELDS))
+    last_id = rows.values_list('pk', flat=True).last()
+    if last_id is None:
+        return None, 0, None
+
+    path = os.path.join(output_dir, f'activity-{day.isoformat()}.jsonl.gz')
+    previous = archive_files(day, day, output_dir)  # this file, or older per-run files
+    archived = [((entry['id'], False, entry) for entry in _read(name)) for name in previous]
+    fresh = ((row['id'], True, row) for row in rows.iterator(chunk_size=chunk_size))
+    tmp_path = path + '.tmp'
+    count, written_id = 0, None
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as gz:
+            # Both in id order; on equal ids the archived copy comes first
+            for row_id, is_new, entry in heapq.merge(*archived, fresh, key=itemgetter(0)):
+                if row_id == written_id:
+                    continue  # archived by an earlier, interrupted run
+                if is_new:
+                    entry['doctor'] = entry.pop('doctor__name')
+                    entry['timestamp'] = entry['timestamp'].isoformat()
+                    count += 1
+                gz.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+                written_id = row_id
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    for name in previous:
+        if name != path:
+            os.remove(name)  # merged into `path`
+    return path, count, last_id
+
+
+def _read(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _delete_day(day, last_id, batch_size):
+    """Delete the exported rows of `day` (ids up to last_id) in short transactions"""
+    start, end = _day_range(day)
+    exported = DoctorActivityLog.objects.filter(timestamp__gte=start, timestamp__lt=end, pk__lte=last_id)
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(exported.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if ids:
+                DoctorActivityLog.objects.filter(pk__in=ids).delete()
+        if not ids:
+            return deleted
+        deleted += len(ids)
+
+
+def expire_activity_logs(days=None, output_dir=None, batch_size=1000, dry_run=False):
+    """
+    Export and delete every row older than the retention cutoff, one day at
+    a time. Returns a stats dict; with dry_run only the candidate days and
+    rows are counted.
+    """
+    cutoff = retention_cutoff(days)
+    old = DoctorActivityLog.objects.filter(timestamp__lt=cutoff)
+    stats = {'cutoff': cutoff, 'days': 0, 'exported': 0, 'deleted': 0, 'files': []}
+    if dry_run:
+        stats['days'] = len(old.dates('timestamp', 'day'))
+        stats['exported'] = old.count()
+        return stats
+
+    output_dir = output_dir or archive_dir()
+    os.makedirs(output_dir, exist_ok=True)
+    for day in old.dates('timestamp', 'day'):
+        path, count, last_id = _export_day(day, output_dir, chunk_size=batch_size)
+        if path is None:
+            continue
+        stats['days'] += 1
+        stats['exported'] += count
+        stats['files'].append(path)
+        stats['deleted'] += _delete_day(day, last_id, batch_size)
+    return stats
+
+
+# ===============================
+# ARCHIVE SEARCH
+# ===============================
+def archive_files(start=None, end=None, output_dir=None):
+    """Archive files whose day falls in [start, end] (dates), oldest first"""
+    output_dir = output_dir or archive_dir()
+    if not os.path.isdir(output_dir):
+        return []
+    files = []
+    for name in os.listdir(output_dir):
+        match = FILE_RE.match(name)
+        if not match:
+            continue
+        day = match.group(1)
+        if (start and day < start.isoformat()) or (end and day > end.isoformat()):
+            continue
+        files.append((day, int(match.group(2) or 0), os.path.join(output_dir, name)))
+    return [path for _, _, path in sorted(files)]
+
+
+def search_archive(start=None, end=None, doctor_id=None, action=None, text=None, output_dir=None):
+    """
+    Yield archived entries (dicts) between the dates `start` and `end`
+    (inclusive), optionally for one doctor / action, or whose description
+    contains `text` (case-insensitive).
+    """
+    needle = text.lower() if text else None
+    for path in archive_files(start, end, output_dir):
+        for entry in _read(path):
+            if doctor_id is not None and entry['doctor_id'] != doctor_id:
+                continue
+            if action and entry['action'] != action:
+                continue
+            if needle and needle not in entry['description'].lower():
+                continue
+            yield entry
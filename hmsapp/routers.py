@@ -0,0 +1,142 @@
+"""
+Read-replica routing for HMS
+
+Reads made while serving a safe request (GET/HEAD/OPTIONS) go to one of the
+aliases in settings.HMS_READ_REPLICAS. Everything else uses the primary
+('default'): writes, reads inside a transaction, reads after the request
+has written, management commands, and every request from a client that
+wrote within the last HMS_REPLICA_STICKY_SECONDS. That window is carried in
+a short-lived cookie and should exceed the replica lag (for SQLite replicas,
+the `hms_sync_replica` interval), so a patient who just registered sees
+their own case.
+"""
+
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from .snapshots import backup_connection
+
+
+PRIMARY = 'default'
+STICKY_COOKIE = 'hms_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Sessions are read on every request and must never lag behind a login
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_read_alias = ContextVar('hms_read_alias', default=None)
+_wrote = ContextVar('hms_wrote', default=False)
+
+
+def replica_aliases():
+    return list(getattr(settings, 'HMS_READ_REPLICAS', []))
+
+
+def sticky_seconds():
+    return getattr(settings, 'HMS_REPLICA_STICKY_SECONDS', 10)
+
+
+@contextmanager
+def read_from(alias):
+    """Send reads in this block to `alias` (None = primary)"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def record_write():
+    """Note that this request wrote: later reads use the primary (see db_for_write)"""
+    _wrote.set(True)
+    _read_alias.set(None)
+
+
+def use_primary():
+    """Read from the primary in this block, e.g. to render a page that gets cached"""
+    return read_from(None)
+
+
+# ===============================
+# ROUTER
+# ===============================
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if (alias is None
+                or model._meta.app_label in PRIMARY_ONLY_APPS
+                or connections[PRIMARY].in_atomic_block):
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Read-your-writes for the rest of the request, then via the cookie
+        record_write()
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, never migrated on their own
+        return False if db in replica_aliases() else None
+
+
+# ===============================
+# MIDDLEWARE
+# ===============================
+class ReplicaRoutingMiddleware:
+    """Pick a replica for safe requests and pin recent writers to the primary"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas = replica_aliases()
+        alias = None
+        if replicas and request.method in SAFE_METHODS and not self.pinned(request):
+            alias = random.choice(replicas)
+
+        wrote_token = _wrote.set(False)
+        try:
+            with read_from(alias):
+                response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _wrote.reset(wrote_token)
+
+        if replicas and wrote:
+            seconds = sticky_seconds()
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time()) + seconds),
+                max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def pinned(self, request):
+        try:
+            return int(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+# ===============================
+# SQLITE REPLICAS
+# ===============================
+def sync_replica(alias, pages=1024, pause=0.0):
+    """Refresh a SQLite replica from the primary with an online backup"""
+    source, target = connections[PRIMARY], connections[alias]
+    if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+        raise ValueError('sync_replica only copies SQLite databases')
+    source.ensure_connection()
+    target.ensure_connection()
+    started = time.perf_counter()
+    stats = backup_connection(source.connection, target.connection, pages=pages, pause=pause)
+    stats['seconds'] = time.perf_counter() - started
+    return stats
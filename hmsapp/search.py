@@ -0,0 +1,204 @@
+"""
+Full-text search over patients, cases and home care requests (SQLite FTS5)
+
+Each searched table has an external-content FTS5 index, <table>_fts, built
+with the trigram tokenizer: any 3+ character fragment of a name, phone
+number, token or address is an index lookup instead of a LIKE '%x%' scan of
+every row. SQLite triggers keep the index in step with every write to the
+table, including bulk_create(), update() and raw SQL.
+
+install() creates whatever is missing and runs after every migrate (a table
+rebuilt by a migration loses its triggers, so its index is rebuilt too).
+`manage.py hms_search_index` rebuilds and optimizes the indexes.
+
+Search terms are ANDed, each matching any indexed column, like the admin's
+own search. Terms shorter than three characters cannot use a trigram
+index: filter_queryset() then returns None and search() falls back to LIKE.
+"""
+
+import threading
+
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from . import sharding
+from .models import EmergencyCase, HomeCareRequest, Patient
+
+
+INDEXES = {
+    # model: indexed fields
+    Patient: ('name', 'patient_id', 'phone', 'email'),
+    EmergencyCase: ('token', 'patient_name', 'patient_phone', 'symptom_description'),
+    HomeCareRequest: ('token', 'patient_name', 'phone', 'address'),
+}
+
+MIN_TERM_LENGTH = 3  # trigram tokenizer
+# Past this many matches (a common surname) a LIKE scan down the page's
+# ordering index fills a page sooner than fetching and sorting every match
+MAX_INDEX_MATCHES = 50000
+
+_installed = {}  # (alias, database name) -> bool
+_installed_lock = threading.Lock()
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def supported(connection):
+    """FTS5 with the trigram tokenizer needs SQLite 3.34"""
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 34, 0)
+
+
+def is_installed(connection):
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _installed:
+        installed = False
+        if supported(connection):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (%s, %s, %s)",
+                    [fts_table(model) for model in INDEXES],
+                )
+                installed = cursor.fetchone()[0] == len(INDEXES)
+        with _installed_lock:
+            _installed[key] = installed
+    return _installed[key]
+
+
+def match_expression(text):
+    """FTS5 query for `text` (every term, in any column), or None if a term is too short"""
+    terms = (text or '').split()
+    if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms):
+        return None
+    return ' AND '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+# ===============================
+# INDEX MAINTENANCE
+# ===============================
+def _statements(model):
+    """(name, CREATE statement) for the FTS table and its three triggers"""
+    table = model._meta.db_table
+    fts = fts_table(model)
+    columns = [model._meta.get_field(name).column for name in INDEXES[model]]
+    names = ', '.join(f'"{column}"' for column in columns)
+    old = ', '.join(f'old."{column}"' for column in columns)
+    new = ', '.join(f'new."{column}"' for column in columns)
+    changed = ' OR '.join(f'old."{column}" IS NOT new."{column}"' for column in ['id'] + columns)
+    delete = f'INSERT INTO "{fts}"("{fts}", rowid, {names}) VALUES (\'delete\', old."id", {old});'
+    insert = f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new."id", {new});'
+    return [
+        (fts, f'CREATE VIRTUAL TABLE "{fts}" USING fts5({names}, '
+              f'content="{table}", content_rowid="id", tokenize="trigram")'),
+        (f'{fts}_ai', f'CREATE TRIGGER "{fts}_ai" AFTER INSERT ON "{table}" BEGIN {insert} END'),
+        (f'{fts}_ad', f'CREATE TRIGGER "{fts}_ad" AFTER DELETE ON "{table}" BEGIN {delete} END'),
+        # Only when an indexed column changed: status updates cost nothing
+        (f'{fts}_au', f'CREATE TRIGGER "{fts}_au" AFTER UPDATE ON "{table}" WHEN {changed} '
+                      f'BEGIN {delete} {insert} END'),
+    ]
+
+
+def install(connection, rebuild=False):
+    """
+    Create the missing FTS tables and triggers on `connection` and rebuild
+    the indexes that were (re)created, or all with rebuild=True. Returns the
+    names of the rebuilt indexes.
+    """
+    if not supported(connection):
+        return []
+    rebuilt = []
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {name for (name,) in cursor.fetchall()}
+        for model in INDEXES:
+            if model._meta.db_table not in existing:
+                continue  # not migrated on this database yet
+            missing = [sql for name, sql in _statements(model) if name not in existing]
+            for sql in missing:
+                cursor.execute(sql)
+            if missing or rebuild:
+                fts = fts_table(model)
+                cursor.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+                rebuilt.append(fts)
+    with _installed_lock:
+        _installed.pop((connection.alias, connection.settings_dict['NAME']), None)
+    return rebuilt
+
+
+def optimize(connection):
+    """Merge each index's b-trees into one (after a rebuild or many writes)"""
+    if not is_installed(connection):
+        return
+    with connection.cursor() as cursor:
+        for model in INDEXES:
+            fts = fts_table(model)
+            cursor.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'optimize\')')
+
+
+# ===============================
+# QUERIES
+# ===============================
+def filter_queryset(queryset, text):
+    """
+    `queryset` narrowed to the rows matching `text` through the index, or
+    None when the index cannot answer (short terms, no FTS5, model not
+    indexed) or matches more than MAX_INDEX_MATCHES rows
+    """
+    model = queryset.model
+    expression = match_expression(text)
+    connection = connections[queryset.db]
+    if model not in INDEXES or expression is None or not is_installed(connection):
+        return None
+    fts = fts_table(model)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM (SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s LIMIT %s)',
+                       [expression, MAX_INDEX_MATCHES + 1])
+        if cursor.fetchone()[0] > MAX_INDEX_MATCHES:
+            return None
+    return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s', [expression]))
+
+
+def like_filter(model, text):
+    """The LIKE equivalent of a search, for what the index cannot answer"""
+    condition = Q()
+    for term in (text or '').split():
+        any_column = Q()
+        for name in INDEXES[model]:
+            any_column |= Q(**{f'{name}__icontains': term})
+        condition &= any_column
+    return condition
+
+
+def search(model, text, limit=20, fields=('pk',)):
+    """
+    Up to `limit` rows (values() dicts of `fields`) matching `text`, newest
+    first, from every shard holding `model`
+    """
+    expression = match_expression(text)
+    columns = list(dict.fromkeys(['created_at', *fields]))
+
+    def newest(alias):
+        connection = connections[alias]
+        rows = model.objects.using(alias)
+        if expression is None or not is_installed(connection):
+            rows = rows.filter(like_filter(model, text))
+        else:
+            # Newest rowids first lets FTS5 stop after `limit` matches, however
+            # common the term (ranking would score every match)
+            fts = fts_table(model)
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH %s ORDER BY rowid DESC LIMIT %s',
+                               [expression, limit])
+                rows = rows.filter(pk__in=[pk for (pk,) in cursor.fetchall()])
+        return list(rows.order_by('-created_at', '-pk').values(*columns)[:limit])
+
+    aliases = sharding.shards() if sharding.is_sharded(model) else [sharding.PRIMARY]
+    results = [row for result in sharding.fan_out(newest, aliases) for row in result]
+    results.sort(key=lambda row: row['created_at'], reverse=True)
+    rows = results[:limit]
+    if 'created_at' not in fields:
+        for row in rows:
+            del row['created_at']
+    return rows
@@ -0,0 +1,258 @@
+"""
+Per-hospital sharding for HMS (optional)
+
+With settings.HMS_SHARDS = {'shard1': [hospital ids], ...}, EmergencyCase
+(and its archive), Appointment and HomeCareRequest rows are stored in the
+database alias that owns their hospital (assigned_hospital / hospital).
+Rows of unmapped hospitals, or without one, stay on 'default'. All other
+tables live on 'default' only, except Doctor and Hospital: they are
+reference tables copied to every shard on commit, so shard queries can
+still join them.
+
+Each shard has its own id block (shard number x HMS_SHARD_ID_BLOCK), which
+keeps ids unique across shards. shard_for_pk() then finds a row's shard
+from its id alone. Network-wide reads go through collect() and count(),
+which run the query on every shard in parallel and merge the results.
+
+Shard files are prepared with `manage.py hms_shards`. SQLite cannot check
+foreign keys across files, so shard connections run with foreign_keys=OFF.
+Limitations:
+- unique constraints (tokens, appointment slots) hold per shard
+- deleting a Patient does not cascade into the shards
+- admin changelists show the rows on 'default'
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import Doctor, Hospital
+from .routers import PRIMARY, ReplicaRouter, record_write
+
+
+SHARDED_MODELS = {
+    # model_name: field holding the hospital that picks the shard
+    'emergencycase': 'assigned_hospital_id',
+    'appointment': 'hospital_id',
+    'homecarerequest': 'hospital_id',
+    'archivedemergencycase': 'assigned_hospital_id',
+}
+REFERENCE_MODELS = {'doctor', 'hospital'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def shards():
+    """Shard aliases in id-block order; 'default' is shard 0"""
+    return [PRIMARY] + [alias for alias in getattr(settings, 'HMS_SHARDS', {}) if alias != PRIMARY]
+
+
+def sharding_enabled():
+    return bool(getattr(settings, 'HMS_SHARDS', {}))
+
+
+def id_block():
+    return getattr(settings, 'HMS_SHARD_ID_BLOCK', 10**12)
+
+
+def shard_for_hospital(hospital_id):
+    for alias, hospital_ids in getattr(settings, 'HMS_SHARDS', {}).items():
+        if hospital_id in hospital_ids:
+            return alias
+    return PRIMARY
+
+
+def shard_for_pk(pk):
+    """Shard holding the sharded row with primary key `pk`"""
+    aliases = shards()
+    number = int(pk) // id_block()
+    return aliases[number] if number < len(aliases) else PRIMARY
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'hmsapp' and model._meta.model_name in SHARDED_MODELS
+
+
+def shard_for_instance(instance):
+    if not instance._state.adding and instance._state.db:
+        return instance._state.db  # rows never move between shards
+    return shard_for_hospital(getattr(instance, SHARDED_MODELS[instance._meta.model_name]))
+
+
+def atomic_for(hospital):
+    """
+    transaction.atomic() on the hospital's shard, for use next to the
+    'default' transaction (no-op when that shard is 'default')
+    """
+    if not sharding_enabled():
+        return nullcontext()
+    alias = shard_for_hospital(hospital.pk if hospital else None)
+    return nullcontext() if alias == PRIMARY else transaction.atomic(using=alias)
+
+
+# ===============================
+# ROUTER
+# ===============================
+class ShardRouter:
+    """Runs before ReplicaRouter; has no opinion while HMS_SHARDS is empty"""
+
+    def db_for_read(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        if instance is None or instance._state.db in (None, PRIMARY):
+            return None
+        if is_sharded(model):
+            return instance._state.db if isinstance(instance, model) else None
+        if model._meta.model_name in REFERENCE_MODELS:
+            return instance._state.db  # local copy on the instance's shard
+        # Global tables (patients, users...) only live on 'default'
+        return ReplicaRouter().db_for_read(model) or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        if is_sharded(model) and isinstance(instance, model):
+            record_write()
+            return shard_for_instance(instance)
+        if not is_sharded(model) and instance is not None and instance._state.db not in (None, PRIMARY):
+            record_write()
+            return PRIMARY  # e.g. a Doctor loaded through a shard's copy
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+# ===============================
+# CROSS-SHARD QUERIES
+# ===============================
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'HMS_SHARD_FANOUT_WORKERS', 8),
+                thread_name_prefix='hms-shard',
+            )
+        return _executor
+
+
+def fan_out(func, aliases=None):
+    """
+    Call func(alias) for every shard in parallel; return results in shard order.
+    'default' runs in the calling thread so it sees the caller's transaction.
+    """
+    aliases = shards() if aliases is None else aliases
+    if len(aliases) == 1:
+        return [func(aliases[0])]
+    futures = {
+        alias: _get_executor().submit(func, alias)
+        for alias in aliases if alias != PRIMARY
+    }
+    results = {alias: func(alias) for alias in aliases if alias == PRIMARY}
+    for alias, future in futures.items():
+        results[alias] = future.result()
+    return [results[alias] for alias in aliases]
+
+
+def _sort_key(field):
+    def key(row):
+        value = row[field] if isinstance(row, dict) else getattr(row, field)
+        return (value is None, value)
+    return key
+
+
+def collect(queryset):
+    """
+    Evaluate `queryset` on every shard and merge the rows into one list,
+    honouring its order_by() and [:n] slice. Accepts model and values()
+    querysets; values() querysets get their ordering columns added and
+    removed again.
+    """
+    if not sharding_enabled():
+        return list(queryset)
+
+    query = queryset.query
+    ordering = list(query.order_by or queryset.model._meta.ordering)
+    limit = query.high_mark
+    if query.low_mark:
+        raise ValueError('collect() does not support offsets')
+
+    extra = []
+    if query.values_select:
+        extra = [name.lstrip('-') for name in ordering
+                 if name.lstrip('-') not in query.values_select]
+        if extra:
+            queryset = queryset.values(*query.values_select, *extra)
+
+    results = fan_out(lambda alias: list(queryset.using(alias)))
+    rows = [row for result in results for row in result]
+    # Stable sorts from the last key to the first give a multi-key ordering
+    for name in reversed(ordering):
+        rows.sort(key=_sort_key(name.lstrip('-')), reverse=name.startswith('-'))
+    if limit is not None:
+        rows = rows[:limit]
+    for row in rows if extra else ():
+        for name in extra:
+            del row[name]
+    return rows
+
+
+def count(queryset):
+    """COUNT(*) summed over every shard"""
+    if not sharding_enabled():
+        return queryset.count()
+    return sum(fan_out(lambda alias: queryset.using(alias).count()))
+
+
+# ===============================
+# REFERENCE TABLES
+# ===============================
+def copy_reference_rows(model, objs, aliases=None):
+    """Upsert Doctor/Hospital rows into every shard (objs stay bound to 'default')"""
+    fields = model._meta.concrete_fields
+    update_fields = [field.name for field in fields if not field.primary_key]
+    for alias in aliases or shards()[1:]:
+        copies = [model(**{field.attname: getattr(obj, field.attname) for field in fields})
+                  for obj in objs]
+        model.objects.using(alias).bulk_create(
+            copies, update_conflicts=True, unique_fields=['id'], update_fields=update_fields,
+        )
+
+
+def delete_reference_rows(model, pks, aliases=None):
+    for alias in aliases or shards()[1:]:
+        model.objects.using(alias).filter(pk__in=pks).delete()
+
+
+def sync_reference_tables(aliases=None):
+    """Copy every Doctor and Hospital from 'default' into the shards"""
+    for model in (Doctor, Hospital):
+        objs = list(model.objects.using(PRIMARY).all())
+        copy_reference_rows(model, objs, aliases)
+        for alias in aliases or shards()[1:]:
+            model.objects.using(alias).exclude(pk__in=[obj.pk for obj in objs]).delete()
+
+
+def reserve_id_block(alias):
+    """Start the shard's sharded-table ids at its block (SQLite AUTOINCREMENT)"""
+    start = shards().index(alias) * id_block()
+    with connections[alias].cursor() as cursor:
+        for model_name in SHARDED_MODELS:
+            model = apps.get_model('hmsapp', model_name)
+            if model._meta.auto_field is None:
+                continue  # keeps the id of the row it was copied from
+            table = model._meta.db_table
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+            elif row[0] < start:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [start, table])
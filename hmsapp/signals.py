@@ -0,0 +1,138 @@
+"""
+Model signal handlers for HMS
+Connected from HmsappConfig.ready()
+"""
+
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, post_save, post_delete
+from django.dispatch import receiver
+
+from . import agenda, autocomplete, geo, search
+from .caching import bump_generation
+from .sharding import (
+    copy_reference_rows, delete_reference_rows, sharding_enabled, shards
+)
+from .sqlite import apply_pragmas
+from .models import (
+    Doctor, Patient, EmergencyCase, Appointment,
+    Hospital, HomeCareRequest
+)
+
+
+CACHED_MODELS = (Doctor, Patient, EmergencyCase, Appointment, Hospital, HomeCareRequest)
+
+
+# ===============================
+# CACHE INVALIDATION
+# ===============================
+@receiver([post_save, post_delete])
+def invalidate_model_cache(sender, using=None, **kwargs):
+    """Bump the model's cache generation once committed, so dependent pages re-render"""
+    # Bumping before the commit would let a concurrent request cache the old
+    # rows under the new generation (see invalidate_slot_cache)
+    if sender in CACHED_MODELS:
+        name = sender._meta.model_name
+        transaction.on_commit(lambda: bump_generation(name), using=using)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+@receiver([post_save, post_delete], sender=Doctor)
+def invalidate_slot_cache(sender, instance, using=None, **kwargs):
+    """Drop the cached availability bitmaps of the doctor concerned, once committed"""
+    # Bumping before the commit would let a concurrent reader cache the old day
+    # under the new generation
+    doctor_id = instance.pk if sender is Doctor else instance.doctor_id
+    transaction.on_commit(lambda: bump_generation(f'slots:{doctor_id}'), using=using)
+
+
+# ===============================
+# DOCTOR AGENDA
+# ===============================
+@receiver([post_save, post_delete], sender=EmergencyCase)
+def refile_agenda_case(sender, instance, using=None, signal=None, **kwargs):
+    """Patch the cached agendas of the case's old and new doctor once committed"""
+    doctor_ids = {getattr(instance, '_loaded_doctor_id', None), instance.assigned_doctor_id} - {None}
+    entry = None
+    if signal is post_save and instance.status in agenda.OPEN_CASE_STATUSES:
+        entry = {**agenda.case_entry(instance), 'doctor_id': instance.assigned_doctor_id}
+    instance._loaded_doctor_id = instance.assigned_doctor_id
+    case_id = instance.pk
+    transaction.on_commit(lambda: agenda.case_changed(case_id, doctor_ids, entry), using=using)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def refile_agenda_appointment(sender, instance, using=None, signal=None, **kwargs):
+    doctor_ids = {getattr(instance, '_loaded_doctor_id', None), instance.doctor_id} - {None}
+    entry = None
+    if signal is post_save:
+        entry = {**agenda.appointment_entry(instance),
+                 'doctor_id': instance.doctor_id, 'date': instance.appointment_date}
+    instance._loaded_doctor_id = instance.doctor_id
+    appointment_id = instance.pk
+    transaction.on_commit(lambda: agenda.appointment_changed(appointment_id, doctor_ids, entry), using=using)
+
+
+# ===============================
+# DISPATCH INDEX
+# ===============================
+@receiver([post_save, post_delete], sender=Doctor)
+def move_doctor_in_index(sender, instance, raw=False, using=None, signal=None, **kwargs):
+    """Put the doctor's committed position and status into the nearest-doctor index"""
+    if raw or using not in (None, 'default'):
+        return  # shard copies of the row
+    deleted = signal is post_delete
+    transaction.on_commit(lambda: geo.doctor_changed(instance, deleted), using=using)
+
+
+# ===============================
+# BOOKING FORM AUTOCOMPLETE
+# ===============================
+@receiver([post_save, post_delete], sender=Doctor)
+@receiver([post_save, post_delete], sender=Hospital)
+def relist_in_autocomplete(sender, instance, raw=False, using=None, signal=None, **kwargs):
+    """Rebuild the booking form's prefix trie once committed, if what it lists changed"""
+    if raw or using not in (None, 'default'):
+        return  # shard copies of the row
+    kind = 'doctors' if sender is Doctor else 'hospitals'
+    deleted = signal is post_delete
+    transaction.on_commit(lambda: autocomplete.changed(kind, instance, deleted), using=using)
+
+
+# ===============================
+# SHARD REFERENCE TABLES
+# ===============================
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Hospital)
+def replicate_reference_row(sender, instance, raw=False, using=None, **kwargs):
+    """Copy a saved Doctor/Hospital into every shard once it is committed"""
+    if sharding_enabled() and not raw and using == 'default':
+        transaction.on_commit(lambda: copy_reference_rows(sender, [instance]), using=using)
+
+
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Hospital)
+def delete_reference_row(sender, instance, using=None, **kwargs):
+    if sharding_enabled() and using == 'default':
+        pk = instance.pk
+        transaction.on_commit(lambda: delete_reference_rows(sender, [pk]), using=using)
+
+
+# ===============================
+# DATABASE CONNECTIONS
+# ===============================
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Apply the HMS_SQLITE_PROFILE pragmas to every new SQLite connection"""
+    apply_pragmas(connection)
+    if connection.vendor == 'sqlite' and connection.alias in shards()[1:]:
+        # Patients, users... are on 'default', so shard rows point across files
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA foreign_keys = OFF')
+
+
+@receiver(post_migrate)
+def install_search_indexes(sender, using='default', **kwargs):
+    """FTS tables and triggers (search.py); a migration that rebuilt a table dropped its triggers"""
+    if sender.name == 'hmsapp':
+        search.install(connections[using])
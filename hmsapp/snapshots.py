@@ -0,0 +1,206 @@
+"""
+Online SQLite snapshots for HMS
+
+Snapshots use the SQLite backup API in small page steps with a pause
+between them, so the source is only read-locked for one step at a time and
+writers keep going. Archives are gzip-compressed with a sha256sum-style
+sidecar (<archive>.sha256) and can be verified or restored by
+`manage.py hms_snapshot`.
+"""
+
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.utils import timezone
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot fails its checksum or integrity check"""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+# ===============================
+# BACKUP
+# ===============================
+def backup_connection(src, dst, pages=256, pause=0.01, max_restarts=3):
+    """
+    Copy the open sqlite3 connection `src` into `dst` in `pages`-sized steps.
+
+    Every write to the source by another connection makes the backup API
+    start over; after `max_restarts` restarts the rest is copied in a
+    single step from one read snapshot (in WAL mode that still does not
+    block writers; with a rollback journal writers wait for the copy).
+    """
+    stats = {'steps': 0, 'restarts': 0, 'pages': 0, 'mode': 'stepped'}
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining
+        stats['steps'] += 1
+        stats['pages'] = total
+        if last_remaining is not None and remaining > last_remaining:
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _TooManyRestarts
+        last_remaining = remaining
+        if remaining and pause:
+            time.sleep(pause)  # no lock is held between steps
+
+    try:
+        src.backup(dst, pages=pages, progress=progress)
+    except _TooManyRestarts:
+        stats['mode'] = 'single-step'
+        src.backup(dst, pages=-1)
+    return stats
+
+
+def backup_database(source, target, pages=256, pause=0.01, max_restarts=3):
+    """Copy the SQLite file `source` to `target` while it stays online"""
+    src = sqlite3.connect(source, timeout=30)
+    try:
+        dst = sqlite3.connect(target)
+        try:
+            return backup_connection(src, dst, pages, pause, max_restarts)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+
+def quick_check(path, full=False):
+    """Run (quick|integrity)_check on a database file; raise SnapshotError on failure"""
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute('PRAGMA integrity_check' if full else 'PRAGMA quick_check').fetchall()
+    finally:
+        conn.close()
+    problems = [row[0] for row in rows if row[0] != 'ok']
+    if problems:
+        raise SnapshotError(f'{path}: {"; ".join(problems[:5])}')
+
+
+def table_counts(path):
+    conn = sqlite3.connect(path)
+    try:
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )]
+        return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+
+
+# ===============================
+# COMPRESSION & CHECKSUMS
+# ===============================
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def checksum_path(archive):
+    return f'{archive}.sha256'
+
+
+def write_checksum(archive):
+    digest = sha256_file(archive)
+    with open(checksum_path(archive), 'w') as f:
+        f.write(f'{digest}  {os.path.basename(archive)}\n')
+    return digest
+
+
+def verify_checksum(archive):
+    try:
+        with open(checksum_path(archive)) as f:
+            expected = f.read().split()[0]
+    except (OSError, IndexError):
+        raise SnapshotError(f'Missing or empty checksum file {checksum_path(archive)}')
+    actual = sha256_file(archive)
+    if actual != expected:
+        raise SnapshotError(f'Checksum mismatch for {archive}: {actual} != {expected}')
+    return actual
+
+
+# ===============================
+# SNAPSHOT / VERIFY / RESTORE
+# ===============================
+def create_snapshot(source, output_dir, pages=256, pause=0.01, compresslevel=6):
+    """Back up, check, compress and checksum `source`; return a stats dict"""
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(str(source)))[0]
+    archive = os.path.join(
+        output_dir, f'hms-{stem}-{timezone.now().strftime("%Y%m%d-%H%M%S")}.sqlite3.gz'
+    )
+    fd, copy = tempfile.mkstemp(suffix='.sqlite3', dir=output_dir)
+    os.close(fd)
+    try:
+        started = time.perf_counter()
+        stats = backup_database(str(source), copy, pages=pages, pause=pause)
+        stats['backup_seconds'] = time.perf_counter() - started
+        quick_check(copy)
+        stats['raw_bytes'] = os.path.getsize(copy)
+
+        started = time.perf_counter()
+        with open(copy, 'rb') as src, gzip.open(archive, 'wb', compresslevel=compresslevel) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        stats['compress_seconds'] = time.perf_counter() - started
+    finally:
+        os.remove(copy)
+
+    stats['archive'] = archive
+    stats['archive_bytes'] = os.path.getsize(archive)
+    stats['sha256'] = write_checksum(archive)
+    return stats
+
+
+def unpack_snapshot(archive, directory):
+    """Verify the checksum, decompress into `directory` and integrity-check"""
+    verify_checksum(archive)
+    fd, path = tempfile.mkstemp(suffix='.sqlite3', dir=directory)
+    os.close(fd)
+    try:
+        with gzip.open(archive, 'rb') as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        quick_check(path, full=True)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def verify_snapshot(archive):
+    """Checksum + full integrity check + row counts, without installing anything"""
+    path = unpack_snapshot(archive, tempfile.gettempdir())
+    try:
+        return table_counts(path)
+    finally:
+        os.remove(path)
+
+
+def restore_snapshot(archive, target, force=False):
+    """Verify `archive` and atomically install it at `target` (service must be stopped)"""
+    target = str(target)
+    if os.path.exists(target) and not force:
+        raise SnapshotError(f'{target} exists; pass force=True to replace it')
+    path = unpack_snapshot(archive, os.path.dirname(os.path.abspath(target)))
+    counts = table_counts(path)
+    # A WAL left over from the old file would be replayed onto the new one
+    for suffix in ('-wal', '-shm', '-journal'):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    os.replace(path, target)
+    return counts
@@ -1,3 +1,1509 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.forms.models import model_to_dict
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, connections
+from django.db.utils import load_backend
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .caching import bump_generation
+from .credentials import PENDING_PASSWORD
+from .models import (
+    Doctor, Hospital, EmergencyCase, Patient, Appointment, ArchivedEmergencyCase, DoctorActivityLog,
+    GeocodeMemo, HomeCareRequest,
+)
+from . import activity, agenda, autocomplete, availability, credentials, exports, geo, geocoder, intake, locations, search, sharding
+from .admin import EmergencyCaseAdminForm, EstimatedCountPaginator, LargeTableAdmin
+from .archive import archive_cases
+from .retention import expire_activity_logs, search_archive
+from .routers import STICKY_COOKIE, sync_replica
+from .sharding import reserve_id_block, shard_for_pk
+from .snapshots import SnapshotError, create_snapshot, restore_snapshot, verify_snapshot
+
+
+# ===============================
+# HELPERS
+# ===============================
+class SqliteFilesMixin:
+    """
+    Extra SQLite file databases (`file_aliases`) for TransactionTestCases,
+    e.g. shards, or writer threads that need file locking rather than the
+    in-memory test database. Registered before the runner checks aliases.
+    """
+
+    file_aliases = ()
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        extra = {
+            alias: {'ENGINE': 'django.db.backends.sqlite3',
+                    'NAME': os.path.join(cls.tmpdir, f'{alias}.sqlite3')}
+            for alias in cls.file_aliases
+        }
+        configured = connections.configure_settings({**connections.settings, **extra})
+        for alias in extra:
+            connections.settings[alias] = configured[alias]
+        super().setUpClass()
+        for alias in extra:
+            call_command('migrate', database=alias, verbosity=0)
+            connections[alias].close()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.file_aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(cls.tmpdir)
+
+
+# ===============================
+# PAGE & FRAGMENT CACHE
+# ===============================
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(
+            name='Dr. Test', doctor_id='TDOC1', specialization='emergency'
+        )
+        Hospital.objects.create(name='Test Hospital', address='Delhi', phone='011')
+
+    def test_second_get_is_served_from_cache(self):
+        self.assertEqual(self.client.get('/emergency-queue/')['X-HMS-Cache'], 'miss')
+        self.assertEqual(self.client.get('/emergency-queue/')['X-HMS-Cache'], 'hit')
+
+    def test_model_change_invalidates_page(self):
+        self.client.get('/emergency-queue/')
+        with self.captureOnCommitCallbacks(execute=True):
+            EmergencyCase.objects.create(patient_name='Asha', symptom='pain', token='SC-0001')
+            # Not committed yet: nothing is invalidated that could be re-cached stale
+            self.assertEqual(self.client.get('/emergency-queue/')['X-HMS-Cache'], 'hit')
+        response = self.client.get('/emergency-queue/')
+        self.assertEqual(response['X-HMS-Cache'], 'miss')
+        self.assertContains(response, 'SC-0001')
+
+    def test_pages_vary_on_session_role(self):
+        self.client.get('/emergency-queue/')
+        session = self.client.session
+        session['doctor_id'] = self.doctor.id
+        session.save()
+        response = self.client.get('/emergency-queue/')
+        self.assertEqual(response['X-HMS-Cache'], 'miss')
+        self.assertContains(response, 'Doctor Login', count=0)
+
+    def test_cached_page_gets_a_fresh_csrf_token(self):
+        self.client.get('/appointment/')
+        client = Client(enforce_csrf_checks=True)
+        response = client.get('/appointment/')
+        self.assertEqual(response['X-HMS-Cache'], 'hit')
+        self.assertNotContains(response, '__hms_csrf_token__')
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_hospital_card_fragment_follows_model_changes(self):
+        self.client.get('/')
+        Hospital.objects.update(available_beds=7)  # bypasses signals
+        self.assertNotContains(self.client.get('/'), 'Beds: 7/100')
+        with self.captureOnCommitCallbacks(execute=True):
+            Hospital.objects.get().save()
+        self.assertContains(self.client.get('/'), 'Beds: 7/100')
+
+
+# ===============================
+# API BOOTSTRAP
+# ===============================
+class BootstrapApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(
+            name='Dr. Test', doctor_id='TDOC1', specialization='emergency'
+        )
+        Hospital.objects.create(name='Test Hospital', address='Delhi', phone='011')
+        EmergencyCase.objects.create(patient_name='Asha', symptom='pain', token='SC-0001')
+
+    def test_returns_requested_sections_only(self):
+        data = self.client.get('/api/bootstrap/?include=queue,hospitals').json()
+        self.assertEqual(set(data), {'queue', 'hospitals'})
+        self.assertEqual(data['queue'][0]['doctor'], 'Dr. Test')
+        self.assertEqual(data['hospitals'][0]['name'], 'Test Hospital')
+
+    def test_my_cases_requires_doctor_session(self):
+        data = self.client.get('/api/bootstrap/?include=my_cases').json()
+        self.assertEqual(data['errors'], {'my_cases': 'Not authenticated'})
+
+        session = self.client.session
+        session['doctor_id'] = self.doctor.id
+        session.save()
+        data = self.client.get('/api/bootstrap/').json()
+        self.assertEqual([case['token'] for case in data['my_cases']], ['SC-0001'])
+
+    def test_queue_section_matches_the_queue_page(self):
+        EmergencyCase.objects.create(patient_name='Ravi', symptom='fever', token='SC-0002',
+                                     status='Doctor En Route', assigned_doctor=self.doctor)
+        queue = self.client.get('/api/bootstrap/?include=queue').json()['queue']
+        page = self.client.get('/emergency-queue/')
+        self.assertEqual([case['token'] for case in queue], [case.token for case in page.context['cases']])
+        self.assertEqual(queue[0]['mode'], 'Hospital Emergency')
+        self.assertContains(page, 'id="queueWaiting"')
+
+    def test_unknown_section_is_rejected(self):
+        response = self.client.get('/api/bootstrap/?include=queue,billing')
+        self.assertEqual(response.status_code, 400)
+
+
+# ===============================
+# SPARSE FIELDSETS (?fields=)
+# ===============================
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        Doctor.objects.create(name='Dr. Test', doctor_id='TDOC1', specialization='emergency')
+        EmergencyCase.objects.create(
+            patient_name='Asha', symptom='pain', token='SC-0001',
+            symptom_description='long free text',
+        )
+
+    def test_projection_is_pushed_down_to_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/emergency-cases/?fields=token,priority').json()
+        self.assertEqual(data['cases'], [{'token': 'SC-0001', 'priority': 'Critical'}])
+        sql = queries.captured_queries[-1]['sql']
+        self.assertNotIn('symptom_description', sql)
+        self.assertNotIn('JOIN', sql)
+
+    def test_related_field_adds_join_only_when_requested(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/emergency-cases/?fields=token,doctor').json()
+        self.assertEqual(data['cases'][0]['doctor'], 'Dr. Test')
+        self.assertIn('JOIN', queries.captured_queries[-1]['sql'])
+
+    def test_default_response_is_unchanged(self):
+        case = self.client.get('/api/emergency-cases/').json()['cases'][0]
+        self.assertEqual(case['queue_no'], 1)
+        self.assertEqual(case['symptom'], 'Chest Pain / Breathing Difficulty')
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/api/hospitals/?fields=name,password')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/bootstrap/?include=queue&fields[queue]=secret')
+        self.assertEqual(response.status_code, 400)
+
+
+# ===============================
+# DEFERRED PASSWORD HASHING
+# ===============================
+@override_settings(
+    HMS_DEFERRED_PASSWORD_HASHING=True,
+    HMS_PASSWORD_HASH_WORKER=False,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class DeferredPasswordTests(TestCase):
+    def register(self, phone='9876500001'):
+        self.client.post('/patient/register/', {
+            'pName': 'Asha', 'pPhone': phone, 'pLocation': 'Saket', 'pSymptom': 'fever',
+        })
+        return Patient.objects.get(phone=phone)
+
+    def test_registration_stores_pending_marker(self):
+        self.assertEqual(self.register().password, PENDING_PASSWORD)
+
+    def test_first_login_hashes_the_initial_password(self):
+        self.register()
+        self.client.post('/patient/logout/')
+        self.client.post('/patient/login/', {'phone': '9876500001', 'password': 'wrong'})
+        self.assertNotIn('patient_id', self.client.session)
+
+        self.client.post('/patient/login/', {'phone': '9876500001', 'password': '9876500001'})
+        self.assertIn('patient_id', self.client.session)
+        patient = Patient.objects.get(phone='9876500001')
+        self.assertTrue(check_password('9876500001', patient.password))
+
+    def test_command_hashes_patients_and_users(self):
+        self.register()
+        self.client.post('/appointment/', {
+            'pName': 'Ravi', 'pPhone': '9876500002', 'pDoctor': Doctor.objects.create(
+                name='Dr. Test', doctor_id='TDOC1').id,
+            'appointment_date': '2030-01-01', 'appointment_time': '10:00',
+        })
+        user = User.objects.get(username='9876500002')
+        self.assertFalse(user.has_usable_password())
+
+        call_command('hms_hash_pending', stdout=StringIO())
+        self.assertFalse(Patient.objects.filter(password=PENDING_PASSWORD).exists())
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('9876500002'))
+
+    def test_booking_session_survives_the_deferred_hash(self):
+        doctor = Doctor.objects.create(name='Dr. Test', doctor_id='TDOC1')
+        self.client.post('/appointment/', {
+            'pName': 'Ravi', 'pPhone': '9876500003', 'pLocation': 'Saket', 'pDoctor': doctor.id,
+            'appointment_date': '2030-01-01', 'appointment_time': '10:00',
+        })
+        user = User.objects.get(username='9876500003')
+        self.assertTrue(credentials.hash_pending(User, user.pk))
+
+        response = self.client.get('/patient/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, user)
+        self.assertEqual(self.client.session['patient_phone'], '9876500003')
+        # A password set by someone else still ends the session
+        user.refresh_from_db()
+        user.password = PENDING_PASSWORD
+        user.save()
+        login_client = Client()
+        login_client.force_login(user)
+        user.set_password('changed')
+        user.save()
+        self.assertTrue(login_client.get('/patient/dashboard/').wsgi_request.user.is_anonymous)
+
+
+# ===============================
+# INTAKE PIPELINE
+# ===============================
+@override_settings(HMS_DEFERRED_PASSWORD_HASHING=True, HMS_PASSWORD_HASH_WORKER=False)
+class IntakeTests(TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(
+            name='Dr. Test', doctor_id='TDOC1', specialization='general'
+        )
+        Hospital.objects.create(name='Test Hospital', address='Delhi', phone='011')
+
+    def book(self, phone):
+        return self.client.post('/appointment/', {
+            'pName': 'Ravi', 'pPhone': phone, 'pDoctor': self.doctor.id,
+            'appointment_date': '2030-01-01', 'appointment_time': '10:00',
+        })
+
+    def test_taken_slot_leaves_no_partial_registration(self):
+        self.book('9876500001')
+        self.book('9876500002')
+        self.assertFalse(User.objects.filter(username='9876500002').exists())
+        self.assertFalse(Patient.objects.filter(phone='9876500002').exists())
+
+    def test_registration_statement_budget(self):
+        from . import intake
+        geocoder.reset()
+        # 2 assignment lookups + 5 in the transaction (+ SAVEPOINT/RELEASE under TestCase),
+        # + geocode memo SELECT the first time a location is seen; its INSERT waits for the commit
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(10):
+            intake.register_emergency('Ravi', '9876500013', 'Saket', 'fever')
+        self.assertFalse(GeocodeMemo.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(GeocodeMemo.objects.get().place, 'Saket')
+        with self.assertNumQueries(9):
+            patient, case = intake.register_emergency('Asha', '9876500003', 'Saket', 'fever')
+        self.assertEqual(case.patient, patient)
+        self.assertEqual(case.assigned_doctor, self.doctor)
+        self.assertEqual(case.assigned_hospital.name, 'Test Hospital')
+
+    def test_home_care_request_gets_the_case_doctor(self):
+        from . import intake
+        Doctor.objects.create(name='Dr. Em', doctor_id='TDOC2', specialization='emergency')
+        _, home_request, case = intake.register_home_care(
+            'Asha', '9876500004', 'Saket', 'Stroke Symptoms', 'Doctor Home Visit'
+        )
+        self.assertEqual(home_request.assigned_doctor.name, 'Dr. Em')
+        self.assertEqual(case.assigned_doctor, home_request.assigned_doctor)
+        self.assertEqual(case.mode, 'Doctor Home Visit')
+
+
+# ===============================
+# SQLITE PRAGMA PROFILES
+# ===============================
+class SqliteProfileTests(TestCase):
+    def test_profile_is_applied_to_new_connections(self):
+        from .sqlite import read_pragmas
+        pragmas = read_pragmas(connection, ['synchronous', 'temp_store', 'busy_timeout'])
+        # production profile: synchronous NORMAL (1), temp_store MEMORY (2)
+        self.assertEqual(pragmas, {'synchronous': 1, 'temp_store': 2, 'busy_timeout': 5000})
+
+    def test_unknown_profile_is_rejected(self):
+        from .sqlite import get_pragmas
+        with self.assertRaises(ValueError):
+            get_pragmas('turbo')
+
+
+class ReadTransactionTests(SqliteFilesMixin, TransactionTestCase):
+    file_aliases = ('readers',)
+
+    def setUp(self):
+        connections['readers'].close()
+        connections['readers'].settings_dict['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+        self.addCleanup(connections['readers'].close)
+
+    def test_snapshot_reads_do_not_wait_for_a_writer(self):
+        from django.db import OperationalError, transaction
+        from .sqlite import read_transaction
+        EmergencyCase.objects.using('readers').create(patient_name='Asha', symptom='fever', token='SC-0001')
+        connections['readers'].cursor().execute('PRAGMA busy_timeout = 50')
+        writer = sqlite3.connect(connections['readers'].settings_dict['NAME'])
+        self.addCleanup(writer.close)
+        writer.execute('BEGIN IMMEDIATE')
+
+        with self.assertRaises(OperationalError):  # BEGIN IMMEDIATE queues for the write lock
+            with transaction.atomic(using='readers'):
+                pass
+        with read_transaction(using='readers'):
+            self.assertEqual(EmergencyCase.objects.using('readers').count(), 1)
+        self.assertEqual(connections['readers'].transaction_mode, 'IMMEDIATE')
+
+
+# ===============================
+# DATABASE MAINTENANCE
+# ===============================
+class DbMaintenanceCommandTests(TestCase):
+    def test_maintenance_run_reports_every_table(self):
+        out = StringIO()
+        call_command('hms_dbmaint', '--exact-counts', stdout=out)
+        output = out.getvalue()
+        self.assertIn('quick_check: ok', output)
+        self.assertIn('hmsapp_emergencycase', output)
+        self.assertIn('free page(s)', output)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.source = os.path.join(self.tmpdir, 'source.sqlite3')
+        conn = sqlite3.connect(self.source)
+        conn.execute('CREATE TABLE cases (id INTEGER PRIMARY KEY, note TEXT)')
+        conn.executemany('INSERT INTO cases (note) VALUES (?)', [('x' * 200,)] * 500)
+        conn.commit()
+        conn.close()
+
+    def test_snapshot_verify_and_restore(self):
+        stats = create_snapshot(self.source, self.tmpdir, pages=4, pause=0)
+        self.assertGreater(stats['steps'], 1)
+        self.assertEqual(verify_snapshot(stats['archive']), {'cases': 500})
+
+        target = os.path.join(self.tmpdir, 'restored.sqlite3')
+        self.assertEqual(restore_snapshot(stats['archive'], target), {'cases': 500})
+        with self.assertRaises(SnapshotError):
+            restore_snapshot(stats['archive'], target)
+
+    def test_tampered_archive_is_rejected(self):
+        archive = create_snapshot(self.source, self.tmpdir, pause=0)['archive']
+        with open(archive, 'ab') as f:
+            f.write(b'junk')
+        with self.assertRaises(SnapshotError):
+            verify_snapshot(archive)
+
+
+# ===============================
+# CASE ARCHIVE
+# ===============================
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = Patient.objects.create(name='Asha', patient_id='PT-1', phone='9876500010')
+        self.old = EmergencyCase.objects.create(
+            patient=self.patient, patient_name='Asha', symptom='fever',
+            token='SC-0001', status='Completed',
+        )
+        self.active = EmergencyCase.objects.create(
+            patient=self.patient, patient_name='Asha', symptom='pain', token='SC-0002',
+        )
+        EmergencyCase.objects.filter(pk=self.old.pk).update(
+            updated_at=timezone.now() - timedelta(days=90)
+        )
+
+    def test_old_finished_cases_move_with_their_id(self):
+        stats = archive_cases(days=30, pause=0)
+        self.assertEqual(stats['moved'], 1)
+        self.assertFalse(EmergencyCase.objects.filter(pk=self.old.pk).exists())
+        archived = ArchivedEmergencyCase.objects.get(pk=self.old.pk)
+        self.assertEqual((archived.token, archived.status), ('SC-0001', 'Completed'))
+        self.assertEqual(list(EmergencyCase.objects.all()), [self.active])
+
+    def test_patient_history_includes_archived_cases(self):
+        archive_cases(days=30, pause=0)
+        session = self.client.session
+        session['patient_id'] = self.patient.id
+        session.save()
+        response = self.client.get('/patient/dashboard/')
+        self.assertEqual([case.token for case in response.context['past_cases']], ['SC-0001'])
+        self.assertEqual([case.token for case in response.context['upcoming_cases']], ['SC-0002'])
+
+
+# ===============================
+# ACTIVITY LOG BUFFER
+# ===============================
+@override_settings(HMS_ACTIVITY_LOG_BUFFERED=False)
+class ActivityLogTests(TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(name='Dr. Log', doctor_id='LDOC1', specialization='general')
+        self.case = EmergencyCase.objects.create(patient_name='Asha', symptom='fever', token='SC-0001')
+        session = self.client.session
+        session['doctor_id'] = self.doctor.id
+        session['doctor_name'] = self.doctor.name
+        session.save()
+
+    def test_inline_mode_writes_during_the_request(self):
+        self.client.post(f'/doctor/case/{self.case.pk}/update/', {'status': 'In Progress'})
+        log = DoctorActivityLog.objects.get()
+        self.assertEqual((log.doctor, log.action), (self.doctor, 'case_updated'))
+        self.assertEqual(log.description, 'Updated case SC-0001 to In Progress')
+
+    @override_settings(HMS_ACTIVITY_LOG_BUFFERED=True, HMS_ACTIVITY_LOG_FLUSH_INTERVAL=3600)
+    def test_buffered_entries_are_written_on_flush_with_their_own_time(self):
+        self.client.post(f'/doctor/case/{self.case.pk}/update/', {'status': 'Completed'})
+        self.client.get('/doctor/logout/')
+        self.assertFalse(DoctorActivityLog.objects.exists())
+        flushed_at = timezone.now()
+        self.assertEqual(activity.flush(), 2)
+        logs = list(DoctorActivityLog.objects.order_by('timestamp'))
+        self.assertEqual([log.action for log in logs], ['case_updated', 'logout'])
+        self.assertTrue(all(log.timestamp < flushed_at for log in logs))
+
+    def test_refused_batch_is_spooled_and_replayed(self):
+        spool = os.path.join(tempfile.mkdtemp(), 'spool.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(spool))
+        with override_settings(HMS_ACTIVITY_LOG_BUFFERED=True, HMS_ACTIVITY_LOG_FLUSH_INTERVAL=3600,
+                               HMS_ACTIVITY_LOG_SPOOL=spool):
+            activity.log_activity(self.doctor.id, 'login', 'Dr. Log logged in')
+            with mock.patch.object(DoctorActivityLog.objects, 'bulk_create', side_effect=DatabaseError), \
+                    self.assertLogs('hmsapp.activity', 'ERROR'):
+                self.assertEqual(activity.flush(), 0)
+            self.assertTrue(os.path.exists(spool))
+            call_command('hms_flush_activity', stdout=StringIO())
+        self.assertFalse(os.path.exists(spool))
+        self.assertEqual(DoctorActivityLog.objects.get().description, 'Dr. Log logged in')
+
+    def test_spooled_entries_survive_a_flush_that_dies(self):
+        import fcntl
+        spool = os.path.join(tempfile.mkdtemp(), 'spool.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(spool))
+        with override_settings(HMS_ACTIVITY_LOG_SPOOL=spool):
+            activity._spool([{'doctor_id': self.doctor.id, 'action': 'login',
+                              'description': 'spooled', 'timestamp': timezone.now()}])
+            with mock.patch.object(activity, '_save', side_effect=RuntimeError('killed')):
+                with self.assertRaises(RuntimeError):
+                    activity.flush()
+            # Claimed but not committed: still on disk, and skipped while another process holds it
+            (taken,) = [name for name in os.listdir(os.path.dirname(spool)) if name.endswith('.taken')]
+            with open(os.path.join(os.path.dirname(spool), taken)) as other:
+                fcntl.flock(other.fileno(), fcntl.LOCK_EX)
+                self.assertEqual(activity.flush(), 0)
+            self.assertEqual(activity.flush(), 1)
+            self.assertEqual(activity.flush(), 0)
+        self.assertEqual(DoctorActivityLog.objects.get().description, 'spooled')
+        self.assertFalse([name for name in os.listdir(os.path.dirname(spool)) if name.endswith('.taken')])
+
+
+# ===============================
+# ACTIVITY LOG RETENTION
+# ===============================
+class LogRetentionTests(TestCase):
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+        self.doctor = Doctor.objects.create(name='Dr. Log', doctor_id='LDOC1', specialization='general')
+        now = timezone.now()
+        for days, action, description in [(200, 'login', 'Dr. Log logged in'),
+                                          (200, 'case_updated', 'Updated case SC-0001 to Completed'),
+                                          (120, 'logout', 'Dr. Log logged out'),
+                                          (1, 'login', 'Dr. Log logged in')]:
+            DoctorActivityLog.objects.create(
+                doctor=self.doctor, action=action, description=description,
+                timestamp=now - timedelta(days=days),
+            )
+
+    def test_old_rows_move_to_daily_archives(self):
+        stats = expire_activity_logs(days=90, output_dir=self.output)
+        self.assertEqual((stats['exported'], stats['deleted'], stats['days']), (3, 3, 2))
+        self.assertEqual(len(os.listdir(self.output)), 2)
+        self.assertEqual(DoctorActivityLog.objects.count(), 1)
+        # Nothing left to export: a second run is a no-op
+        self.assertEqual(expire_activity_logs(days=90, output_dir=self.output)['exported'], 0)
+
+    def test_rerun_after_an_interrupted_delete_archives_each_row_once(self):
+        from . import retention
+        delete_day = retention._delete_day
+
+        def interrupted(day, last_id, batch_size):
+            delete_day(day, last_id, 1)  # ... after the first batch, dies
+            raise KeyboardInterrupt
+
+        with mock.patch.object(retention, '_delete_day', side_effect=interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                expire_activity_logs(days=90, output_dir=self.output, batch_size=1)
+        self.assertEqual(expire_activity_logs(days=90, output_dir=self.output)['exported'], 1)
+        # A late row for an archived day joins the day's file
+        DoctorActivityLog.objects.create(doctor=self.doctor, action='login', description='late',
+                                         timestamp=timezone.now() - timedelta(days=200))
+        self.assertEqual(expire_activity_logs(days=90, output_dir=self.output)['exported'], 1)
+
+        self.assertEqual(len(os.listdir(self.output)), 2)
+        ids = [entry['id'] for entry in search_archive(output_dir=self.output)]
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(len(set(ids)), 4)
+        self.assertEqual(DoctorActivityLog.objects.count(), 1)
+
+    def test_search_filters_archived_entries(self):
+        expire_activity_logs(days=90, output_dir=self.output)
+        found = list(search_archive(text='sc-0001', output_dir=self.output))
+        self.assertEqual([entry['action'] for entry in found], ['case_updated'])
+        self.assertEqual(found[0]['doctor'], 'Dr. Log')
+        recent = timezone.localdate() - timedelta(days=150)
+        self.assertEqual(
+            [entry['action'] for entry in search_archive(start=recent, output_dir=self.output)],
+            ['logout'],
+        )
+        self.assertEqual(len(list(search_archive(doctor_id=self.doctor.pk + 1, output_dir=self.output))), 0)
+
+
+# ===============================
+# OPTIMISTIC CONCURRENCY
+# ===============================
+class CaseVersionTests(SqliteFilesMixin, TransactionTestCase):
+    file_aliases = ('writers',)  # real file locking for the writer threads
+
+    def setUp(self):
+        self.case = EmergencyCase.objects.create(patient_name='Asha', symptom='fever', token='SC-0001')
+
+    def post_status(self, status, version):
+        return self.client.post(
+            f'/doctor/case/{self.case.pk}/update/', {'status': status, 'version': version},
+            HTTP_ACCEPT='application/json',
+        )
+
+    def test_stale_version_is_reported_as_conflict(self):
+        self.assertEqual(self.post_status('In Progress', 1).json(), {'status': 'In Progress', 'version': 2})
+        response = self.post_status('Cancelled', 1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'In Progress')
+        self.assertEqual(EmergencyCase.objects.get().status, 'In Progress')
+
+    def test_parallel_writers_lose_no_updates(self):
+        writers, rounds = 4, 10
+        cases = EmergencyCase.objects.using('writers')
+        pk = cases.create(patient_name='Asha', symptom='fever', token='SC-0001').pk
+
+        def append(mark):
+            try:
+                for _ in range(rounds):
+                    while True:
+                        case = cases.get(pk=pk)
+                        if case.save_if_current(case.version, eta=case.eta + mark):
+                            break
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=append, args=(str(n),)) for n in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        case = cases.get(pk=pk)
+        self.assertEqual(len(case.eta), writers * rounds)
+        self.assertEqual(case.version, 1 + writers * rounds)
+
+    def test_admin_form_rejects_a_stale_version(self):
+        data = {**model_to_dict(self.case), 'status': 'Cancelled'}
+        self.case.save_if_current(1, status='Completed')
+        form = EmergencyCaseAdminForm(
+            {k: v for k, v in data.items() if v is not None}, instance=EmergencyCase.objects.get()
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('version', form.errors)
+
+
+# ===============================
+# BULK CASE STATUS
+# ===============================
+@override_settings(HMS_ACTIVITY_LOG_BUFFERED=False)
+class BulkCaseStatusTests(TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(name='Dr. Bulk', doctor_id='BDOC1', specialization='general')
+        self.cases = [
+            EmergencyCase.objects.create(
+                patient_name=f'Patient {i}', symptom='fever', token=f'SC-{i:04d}',
+                assigned_doctor=self.doctor, status='In Progress',
+            ) for i in range(50)
+        ]
+        session = self.client.session
+        session['doctor_id'] = self.doctor.id
+        session.save()
+
+    def post(self, updates):
+        return self.client.post(
+            '/doctor/cases/bulk-update/', json.dumps({'updates': updates}), content_type='application/json'
+        )
+
+    def test_closing_50_cases_is_one_update(self):
+        updates = [{'id': case.pk, 'status': 'Completed', 'version': case.version} for case in self.cases]
+        # SELECT cases, UPDATE, activity log INSERT (+ SAVEPOINT/RELEASE under TestCase);
+        # the session comes from the cache
+        with self.assertNumQueries(5):
+            result = self.post(updates).json()
+        self.assertEqual((len(result['updated']), result['rejected']), (50, []))
+        self.assertEqual(EmergencyCase.objects.filter(status='Completed', version=2).count(), 50)
+        self.assertEqual(DoctorActivityLog.objects.filter(doctor=self.doctor).count(), 50)
+
+    def test_invalid_changes_are_rejected_individually(self):
+        other = Doctor.objects.create(name='Dr. Other', doctor_id='BDOC2', specialization='general')
+        foreign = EmergencyCase.objects.create(patient_name='X', symptom='fever', token='SC-9999',
+                                               assigned_doctor=other)
+        done, stale, ok, odd = self.cases[:4]
+        done.save_if_current(1, status='Completed')
+        result = self.post([
+            {'id': done.pk, 'status': 'In Progress'},
+            {'id': stale.pk, 'status': 'Completed', 'version': 7},
+            {'id': ok.pk, 'status': 'Cancelled'},
+            {'id': odd.pk, 'status': 'Teleported'},
+            {'id': foreign.pk, 'status': 'Completed'},
+        ]).json()
+        self.assertEqual([case['id'] for case in result['updated']], [ok.pk])
+        reasons = {item['id']: item['reason'] for item in result['rejected']}
+        self.assertEqual(reasons[done.pk], 'cannot change from Completed to In Progress')
+        self.assertTrue(reasons[stale.pk].startswith('changed by someone else'))
+        self.assertIn('unknown status', reasons[odd.pk])
+        self.assertEqual(reasons[foreign.pk], 'no such case assigned to you')
+        self.assertEqual(EmergencyCase.objects.get(pk=foreign.pk).status, 'Waiting')
+
+    def test_requires_doctor_session_and_valid_body(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.client.post('/doctor/cases/bulk-update/', 'nope',
+                                          content_type='application/json').status_code, 400)
+        self.client.session.flush()
+        self.client.cookies.clear()
+        self.assertEqual(self.post([{'id': 1, 'status': 'Completed'}]).status_code, 401)
+
+
+# ===============================
+# SLOT AVAILABILITY
+# ===============================
+@override_settings(HMS_DEFERRED_PASSWORD_HASHING=True, HMS_PASSWORD_HASH_WORKER=False)
+class AvailabilityTests(TestCase):
+    day = timezone.localdate() + timedelta(days=7)
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(
+            name='Dr. Slot', doctor_id='SDOC1', specialization='cardiology',
+            work_start=time(9, 0), work_end=time(12, 0),
+        )
+
+    def book(self, phone, start, duration=15, client=None):
+        # Slot bitmaps are invalidated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return (client or self.client).post('/appointment/', {
+                'pName': 'Ravi', 'pPhone': phone, 'pDoctor': self.doctor.id, 'pDuration': duration,
+                'appointment_date': self.day.isoformat(), 'appointment_time': start,
+            })
+
+    def test_overlapping_visit_is_rejected_before_any_write(self):
+        self.book('9876510001', '10:00', duration=30)
+        response = self.book('9876510002', '10:15')
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertFalse(User.objects.filter(username='9876510002').exists())
+        self.assertContains(response, 'overlaps another appointment')
+        self.assertContains(response, 'Free times on')
+        # The authoritative check in the booking transaction, without the view's cached check
+        with self.assertRaises(availability.SlotUnavailable):
+            intake.book_appointment('Asha', '9876510003', '', self.doctor, None, 'fever',
+                                    self.day, time(9, 50), duration=15)
+        self.assertFalse(Patient.objects.filter(phone='9876510003').exists())
+
+    def test_free_slots_follow_hours_bookings_and_cancellations(self):
+        self.assertEqual(len(availability.free_slots(self.doctor, self.day, 15)), 12)
+        self.book('9876510004', '10:00', duration=60)
+        slots = availability.free_slots(self.doctor, self.day, 30)
+        self.assertEqual(slots, [time(9, 0), time(9, 15), time(9, 30), time(11, 0), time(11, 15), time(11, 30)])
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.get().delete()
+        self.assertIn(time(10, 0), availability.free_slots(self.doctor, self.day, 30))
+
+    def test_impossible_date_or_time_is_a_form_error(self):
+        for day, start in (('2026-02-30', '10:00'), (self.day.isoformat(), '25:00')):
+            response = self.client.post('/appointment/', {
+                'pName': 'Ravi', 'pPhone': '9876510009', 'pDoctor': self.doctor.id,
+                'appointment_date': day, 'appointment_time': start,
+            })
+            self.assertContains(response, 'Please choose a valid date and time.')
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_unknown_duration_is_refused_before_any_slot_search(self):
+        with mock.patch.object(availability, 'slot_board') as board, \
+                mock.patch.object(availability, 'hold_slot') as hold:
+            response = self.book('9876510010', '', duration=1000000)
+        self.assertContains(response, 'Visits last 15, 30, 45, 60 minutes.')
+        self.assertFalse(board.called or hold.called)
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_lost_races_report_the_real_conflict(self):
+        self.book('9876510011', '10:00')
+        # Slot taken between the check and the insert: only the constraint is left to catch it
+        with mock.patch.object(intake, 'ensure_free'), mock.patch.object(availability, 'check_slot'):
+            response = self.book('9876510012', '10:00')
+        self.assertContains(response, 'That time slot has just been booked. Please choose a different time.')
+        # Phone registered by a concurrent request: not a slot problem
+        with mock.patch.object(User.objects, 'create', side_effect=IntegrityError):
+            response = self.book('9876510013', '11:00')
+        self.assertContains(response, 'registered at the same moment')
+        self.assertNotContains(response, 'choose a different time')
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_slot_apis(self):
+        Doctor.objects.create(name='Dr. Late', doctor_id='SDOC2', specialization='cardiology',
+                              work_start=time(9, 30), work_end=time(12, 0))
+        self.book('9876510005', '09:00', duration=45)
+        data = self.client.get('/api/slots/', {
+            'doctor': self.doctor.id, 'date': self.day.isoformat(), 'duration': 45,
+        }).json()
+        self.assertEqual(data['slots'][:2], ['09:45', '10:00'])
+        data = self.client.get('/api/slots/next/', {
+            'specialization': 'cardiology', 'date': self.day.isoformat(),
+        }).json()
+        self.assertEqual((data['slot']['doctor_name'], data['slot']['time']), ('Dr. Late', '09:30'))
+        self.assertEqual(self.client.get('/api/slots/', {'doctor': self.doctor.id, 'duration': 20}).status_code, 400)
+
+    def hold(self, client, start, duration=15):
+        return client.post('/api/slots/hold/', {
+            'doctor': self.doctor.id, 'date': self.day.isoformat(), 'time': start, 'duration': duration,
+        })
+
+    def test_held_time_is_refused_before_the_booking_transaction(self):
+        first, second = Client(), Client()
+        self.assertEqual(self.hold(first, '10:00', duration=30).status_code, 200)
+        response = self.hold(second, '10:15')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['held'], ['10:00', '10:15'])
+        with mock.patch.object(intake, 'book_appointment', wraps=intake.book_appointment) as book:
+            response = self.book('9876510006', '10:15', client=second)
+        self.assertFalse(book.called)
+        self.assertContains(response, 'Someone else is booking that time')
+        # The holder books; the hold is released and the time shows as taken
+        self.book('9876510007', '10:00', duration=30, client=first)
+        self.assertEqual(Appointment.objects.get().patient_phone, '9876510007')
+        data = second.get('/api/slots/', {'doctor': self.doctor.id, 'date': self.day.isoformat()}).json()
+        self.assertEqual(data['held'], [])
+        self.assertNotIn('10:15', data['slots'])
+
+    def test_impossible_hold_time_is_a_bad_request(self):
+        self.assertEqual(self.hold(Client(), '25:00').status_code, 400)
+        response = Client().post('/api/slots/hold/', {
+            'doctor': self.doctor.id, 'date': '2026-02-30', 'time': '10:00',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date (YYYY-MM-DD)', response.json()['error'])
+
+    def test_hold_of_an_unknown_length_writes_nothing(self):
+        with mock.patch.object(cache, 'add') as add:
+            with self.assertRaises(availability.SlotUnavailable):
+                availability.hold_slot(self.doctor, self.day, time(10, 0), 10**8, 'owner')
+        self.assertFalse(add.called)
+
+    def test_new_hold_replaces_the_previous_one(self):
+        first = Client()
+        self.hold(first, '09:00')
+        self.hold(first, '11:00')
+        free, held = availability.slot_board(self.doctor, self.day, 15, owner='someone-else')
+        self.assertEqual(held, [time(11, 0)])
+        self.assertIn(time(9, 0), free)
+
+
+# ===============================
+# DOCTOR AGENDA
+# ===============================
+class DoctorAgendaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(name='Dr. Agenda', doctor_id='ADOC1', specialization='general')
+        for i in range(30):
+            EmergencyCase.objects.create(patient_name=f'Old {i}', symptom='fever', token=f'SC-H{i:03d}',
+                                         assigned_doctor=self.doctor, status='Completed')
+        self.case = EmergencyCase.objects.create(patient_name='Open', symptom='pain', token='SC-OPEN',
+                                                 assigned_doctor=self.doctor)
+        EmergencyCase.objects.filter(pk=self.case.pk).update(created_at=timezone.now() - timedelta(days=1))
+        Appointment.objects.create(patient_name='Visit', doctor=self.doctor, reason='checkup',
+                                   appointment_date=timezone.localdate(), appointment_time=time(10, 0))
+        session = self.client.session
+        session['doctor_id'] = self.doctor.id
+        session.save()
+
+    def agenda_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = agenda.agenda_for(self.doctor.id)
+        return result, [q['sql'] for q in queries if 'hmsapp_' in q['sql']]
+
+    def test_dashboard_lists_only_today_and_open_cases(self):
+        response = self.client.get('/doctor/dashboard/')
+        self.assertContains(response, 'SC-OPEN')
+        self.assertContains(response, 'Visit')
+        self.assertNotContains(response, 'SC-H001')
+        self.assertEqual(response.context['open_cases'], 1)
+        # Cases still open from earlier days lead the timeline
+        timeline = response.context['timeline']
+        self.assertEqual([(item['kind'], item.get('carried_over')) for item in timeline],
+                         [('case', True), ('appointment', None)])
+        # Second load is served from the cached agenda
+        self.assertEqual(self.agenda_queries()[1], [])
+
+    def test_changes_patch_the_cached_agenda(self):
+        agenda.agenda_for(self.doctor.id)
+        other = Doctor.objects.create(name='Dr. Other', doctor_id='ADOC2', specialization='general')
+        with self.captureOnCommitCallbacks(execute=True):
+            EmergencyCase.objects.create(patient_name='New', symptom='fever', token='SC-NEW',
+                                         assigned_doctor=self.doctor)
+            Appointment.objects.create(patient_name='Later', doctor=self.doctor, reason='x',
+                                       appointment_date=timezone.localdate(), appointment_time=time(9, 0))
+            self.case.save_if_current(self.case.version, status='In Progress')
+        result, queries = self.agenda_queries()
+        self.assertEqual(queries, [])
+        self.assertEqual([(e['token'], e['status']) for e in result['cases']],
+                         [('SC-OPEN', 'In Progress'), ('SC-NEW', 'Waiting')])
+        self.assertEqual([e['patient_name'] for e in result['appointments']], ['Later', 'Visit'])
+
+        case = EmergencyCase.objects.get(token='SC-NEW')
+        with self.captureOnCommitCallbacks(execute=True):
+            case.assigned_doctor = other
+            case.save()
+            self.case.save_if_current(self.case.version, status='Completed')
+        self.assertEqual(agenda.agenda_for(self.doctor.id)['cases'], [])
+        self.assertEqual([e['token'] for e in agenda.agenda_for(other.id)['cases']], ['SC-NEW'])
+
+    def test_history_is_paginated(self):
+        response = self.client.get('/doctor/history/')
+        self.assertEqual((len(response.context['cases']), response.context['has_next']), (25, True))
+        response = self.client.get('/doctor/history/?page=2')
+        self.assertEqual((len(response.context['cases']), response.context['has_next']), (5, False))
+        self.assertNotContains(response, 'SC-OPEN')
+
+
+# ===============================
+# HOME VISIT DISPATCH
+# ===============================
+class DispatchTests(TestCase):
+    def setUp(self):
+        geo.reset_index()
+        locations.reset()
+        self.near = Doctor.objects.create(name='Near', doctor_id='GDOC1', specialization='general',
+                                          latitude=28.6330, longitude=77.2200)
+        self.far = Doctor.objects.create(name='Far', doctor_id='GDOC2', specialization='emergency',
+                                         latitude=28.5000, longitude=77.0500)
+
+    def test_index_matches_brute_force(self):
+        import random
+        rng = random.Random(7)
+        index = geo.DoctorIndex(cell_degrees=0.01)
+        points = {i: (rng.uniform(28.4, 28.9), rng.uniform(76.8, 77.4)) for i in range(2000)}
+        for doctor_id, (lat, lon) in points.items():
+            index.update(doctor_id, lat, lon)
+        for doctor_id in range(0, 2000, 3):  # move a third of them
+            points[doctor_id] = (rng.uniform(28.4, 28.9), rng.uniform(76.8, 77.4))
+            index.update(doctor_id, *points[doctor_id])
+        for _ in range(50):
+            lat, lon = rng.uniform(28.3, 29.0), rng.uniform(76.7, 77.5)
+            expected = sorted((geo.haversine_km(lat, lon, *p), i) for i, p in points.items())[:5]
+            self.assertEqual(index.nearest(lat, lon, k=5), expected)
+        self.assertEqual(index.nearest(28.6, 77.2, k=3, max_km=0.0001), [])
+
+    def test_sparse_index_stops_scanning_early(self):
+        index = geo.DoctorIndex(cell_degrees=0.01)
+        index.update(1, 28.61, 77.21)  # Delhi
+        index.update(2, 28.63, 77.22)
+        with mock.patch.object(geo.DoctorIndex, '_ring', wraps=index._ring) as ring:
+            self.assertEqual([doctor_id for _, doctor_id in index.nearest(28.6, 77.2, k=5)], [1, 2])
+        self.assertLess(ring.call_count, 10)  # every doctor found: no walk to the edge
+        index.update(3, 19.07, 72.88)  # Mumbai, ~1150 km away
+        with mock.patch.object(geo.DoctorIndex, '_ring', wraps=index._ring) as ring:
+            self.assertEqual(len(index.nearest(28.6, 77.2, k=5, max_km=50)), 2)
+        self.assertLess(ring.call_count, 60)
+
+    def test_home_visit_goes_to_nearest_doctor_with_eta(self):
+        _, home_request, case = intake.register_home_care(
+            'Asha', '9876500031', 'Connaught Place', 'Stroke Symptoms', 'Doctor Home Visit',
+            lat=28.6315, lon=77.2167,
+        )
+        # Far is the stroke specialization but 20 km away
+        self.assertEqual(case.assigned_doctor, self.near)
+        self.assertEqual(case.eta, geo.format_eta(geo.eta_minutes(geo.haversine_km(
+            28.6315, 77.2167, self.near.latitude, self.near.longitude))))
+        self.assertEqual(home_request.eta, case.eta)
+        self.assertEqual((case.patient_latitude, home_request.latitude), (28.6315, 28.6315))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Doctor.objects.create(name='Close Em', doctor_id='GDOC3', specialization='emergency',
+                                  latitude=28.6500, longitude=77.2167)
+        _, _, case = intake.register_home_care(
+            'Ravi', '9876500033', 'Connaught Place', 'Stroke Symptoms', 'Doctor Home Visit',
+            lat=28.6315, lon=77.2167,
+        )
+        self.assertEqual(case.assigned_doctor.name, 'Close Em')
+
+    def test_index_follows_doctor_changes(self):
+        geo.doctor_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.near.status = 'busy'
+            self.near.save()
+        self.assertEqual(geo.nearest_doctor(28.6315, 77.2167)[0], self.far)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.latitude, self.far.longitude = 28.6316, 77.2168
+            self.far.save()
+        self.assertLess(geo.nearest_doctor(28.6315, 77.2167)[1], 0.1)
+
+    def test_tracking_shows_assigned_doctor_and_live_eta(self):
+        self.client.post('/home-care/', {
+            'hcName': 'Asha', 'hcPhone': '9876500032', 'hcAddress': 'CP', 'hcIssue': 'Severe Weakness',
+            'hcMode': 'Doctor Home Visit', 'latitude': '28.6315', 'longitude': '77.2167',
+        })
+        with override_settings(HMS_LOCATION_FLUSH_INTERVAL=3600):
+            locations.record_ping(self.near.pk, 28.6400, 77.2300)  # the doctor has moved on
+        response = self.client.get('/home-tracking/')
+        distance = geo.haversine_km(28.6400, 77.2300, 28.6315, 77.2167)
+        eta = geo.format_eta(geo.eta_minutes(distance))
+        self.assertEqual(response.context['doctor'], self.near)
+        self.assertEqual(response.context['distance_km'], round(distance, 1))
+        self.assertContains(response, 'Dr. Near')
+        self.assertContains(response, eta)
+        live = self.client.get('/api/tracking/').json()
+        self.assertEqual((live['doctor'], live['distance_km'], live['eta']), ('Near', round(distance, 1), eta))
+
+
+@override_settings(HMS_LOCATION_FLUSH_INTERVAL=3600)
+class LocationPingTests(TestCase):
+    def setUp(self):
+        geo.reset_index()
+        locations.reset()
+        self.doctor = Doctor.objects.create(name='Pinger', doctor_id='PDOC1', specialization='general',
+                                            latitude=28.5, longitude=77.0)
+        session = self.client.session
+        session['doctor_id'] = self.doctor.id
+        session.save()
+
+    def ping(self, lat, lon, client=None):
+        return (client or self.client).post('/api/location/', {'lat': lat, 'lon': lon},
+                                            content_type='application/json')
+
+    def test_pings_are_coalesced_into_one_write(self):
+        geo.doctor_index()
+        with self.assertNumQueries(0):  # cached session, no Doctor writes
+            self.assertEqual(self.ping(28.60, 77.20).status_code, 204)
+        for step in range(1, 10):
+            self.ping(28.60 + step / 1000, 77.20)
+        self.assertEqual(Doctor.objects.get().latitude, 28.5)
+        # The index and live ETAs see the latest ping before any write
+        self.assertEqual(geo.doctor_index().position(self.doctor.pk), (28.609, 77.20))
+        self.assertLess(geo.live_eta(self.doctor, 28.609, 77.20)[0], 0.001)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(locations.flush(), 1)
+        doctor = Doctor.objects.get()
+        self.assertEqual((doctor.latitude, doctor.longitude), (28.609, 77.20))
+        self.assertIsNotNone(doctor.location_updated_at)
+        self.assertEqual(locations.flush(), 0)
+
+    def test_pings_need_a_doctor_session_and_valid_coordinates(self):
+        self.assertEqual(self.ping(28.6, 77.2, client=Client()).status_code, 401)
+        self.assertEqual(self.ping(128.6, 77.2).status_code, 400)
+        self.assertEqual(self.ping('north', 77.2).status_code, 400)
+        self.assertEqual(locations.pending_count(), 0)
+
+    def test_busy_doctor_is_tracked_but_not_dispatched(self):
+        self.doctor.status = 'busy'
+        self.doctor.save()
+        geo.doctor_index()
+        self.ping(28.61, 77.21)
+        self.assertIsNone(geo.doctor_index().position(self.doctor.pk))
+        self.assertEqual(locations.latest(self.doctor.pk)[:2], (28.61, 77.21))
+        # Available again: indexed at the pinged position, not the stale row
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.status = 'available'
+            self.doctor.save()
+        self.assertEqual(geo.doctor_index().position(self.doctor.pk), (28.61, 77.21))
+
+    def test_index_picks_up_positions_flushed_by_other_processes(self):
+        geo.doctor_index()
+        Doctor.objects.filter(pk=self.doctor.pk).update(latitude=28.7, longitude=77.1,
+                                                        location_updated_at=timezone.now())
+        self.assertEqual(geo.doctor_index().position(self.doctor.pk), (28.5, 77.0))
+        with override_settings(HMS_GEO_INDEX_REFRESH_SECONDS=0):
+            self.assertEqual(geo.doctor_index().position(self.doctor.pk), (28.7, 77.1))
+
+
+# ===============================
+# GEOCODING
+# ===============================
+class GeocodeTests(TestCase):
+    def setUp(self):
+        geocoder.reset()
+
+    def test_typed_locations_resolve(self):
+        cases = {
+            'Flat 4, Lajpat Ngr, New Delhi': ('Lajpat Nagar', 'locality'),
+            'near AIIMS': ('Ansari Nagar', 'locality'),
+            'lajpath nagar': ('Lajpat Nagar', 'locality'),
+            'Sector 9, Rohni': ('Rohini', 'locality'),
+            'H.No. 12, 110 029': ('110029', 'pin'),
+            'Gurgoan': ('Gurugram', 'city'),
+            'Bandra, Delhi': ('Delhi', 'city'),  # the Mumbai locality is not in Delhi
+            'Bandra West, Mumbai': ('Bandra', 'locality'),
+        }
+        for text, (name, precision) in cases.items():
+            with self.subTest(text=text):
+                place = geocoder.geocode(text)
+                self.assertEqual((place.name, place.precision), (name, precision))
+        self.assertEqual(geocoder.normalize('Opp. Sec-4 Mkt, Dwarka'), 'sector 4 market dwarka')
+        self.assertIsNone(geocoder.geocode('somewhere over the rainbow'))
+        self.assertIsNone(geocoder.geocode('   '))
+
+    def test_results_are_memoized_across_processes(self):
+        place = geocoder.geocode('Saket, New Delhi')
+        self.assertEqual(GeocodeMemo.objects.get().place, 'Saket')
+        with self.assertNumQueries(0):
+            self.assertEqual(geocoder.geocode('Saket, New Delhi'), place)
+
+        geocoder.reset()  # a fresh process: one memo read, no matching
+        with mock.patch.object(geocoder.Gazetteer, 'resolve') as resolve, self.assertNumQueries(1):
+            self.assertEqual(geocoder.geocode('saket new delhi'), place)
+        resolve.assert_not_called()
+
+        geocoder.geocode('Atlantis')
+        self.assertIsNone(GeocodeMemo.objects.get(query='atlantis').latitude)
+        geocoder.reset()
+        with self.assertNumQueries(1):
+            self.assertIsNone(geocoder.geocode('Atlantis'))
+
+    def test_edited_gazetteer_ignores_old_memos(self):
+        geocoder.geocode('Saket')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'gazetteer.csv')
+            with open(path, 'w') as f:
+                f.write('name,kind,city,lat,lon,aliases\nSaket,locality,New Delhi,28.5,77.2,\n')
+            with override_settings(HMS_GAZETTEER=path):
+                geocoder.reset()
+                self.assertEqual(geocoder.geocode('Saket')[:2], (28.5, 77.2))
+        geocoder.reset()
+        self.assertEqual(GeocodeMemo.objects.filter(query='saket').count(), 2)
+
+    def test_typed_location_routes_to_nearest_hospital(self):
+        Hospital.objects.create(name='A North', address='Sector 7, Rohini, Delhi', phone='1')
+        south = Hospital.objects.create(name='B South', address='Press Enclave Marg, Saket', phone='2')
+        self.assertEqual((south.latitude, south.longitude), (28.5245, 77.2066))
+        south.address = 'Hauz Khas, New Delhi'
+        south.save()
+        self.assertEqual(south.latitude, 28.5494)
+
+        patient, case = intake.register_emergency('Asha', '9876500051', 'Lajpat Nagar 2', 'chest_pain')
+        self.assertEqual((case.patient_latitude, case.patient_longitude), (28.5677, 77.2433))
+        self.assertEqual(case.assigned_hospital, south)
+        # Device coordinates win over the text
+        _, case = intake.register_emergency('Ravi', '9876500052', 'Lajpat Nagar', 'chest_pain',
+                                            lat=28.75, lon=77.06)
+        self.assertEqual(case.assigned_hospital.name, 'A North')
+
+    def test_backfill_command(self):
+        Patient.objects.create(name='Old', patient_id='PT-G1', phone='9876500053', location='Karol Bagh')
+        Patient.objects.create(name='Lost', patient_id='PT-G2', phone='9876500054', location='Atlantis')
+        out = StringIO()
+        call_command('hms_geocode', stdout=out)
+        self.assertIn('Patient on default: 1 geocoded, 1 not found', out.getvalue())
+        self.assertEqual(Patient.objects.get(phone='9876500053').latitude, 28.6519)
+
+
+# ===============================
+# ADMIN
+# ===============================
+class AdminPerformanceTests(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(self.admin_user)
+        self.doctors = [Doctor.objects.create(name=f'Dr. Admin {i}', doctor_id=f'ADOC{i}') for i in range(2)]
+        Hospital.objects.create(name='Admin Hospital', address='Saket', phone='1')
+        self.rows = 0
+        self.add_rows(3)
+
+    def add_rows(self, n):
+        for i in range(self.rows, self.rows + n):
+            doctor = self.doctors[i % 2]
+            patient = Patient.objects.create(name=f'Admin {i}', patient_id=f'PT-A{i}', phone=f'98765010{i:02d}')
+            EmergencyCase.objects.create(patient=patient, patient_name=patient.name, symptom='fever',
+                                         token=f'AD-{i:04d}', assigned_doctor=doctor)
+            ArchivedEmergencyCase.objects.create(id=10**6 + i, patient_name=patient.name, symptom='fever',
+                                                 token=f'AR-{i:04d}', assigned_doctor=doctor, status='Completed')
+            Appointment.objects.create(patient=patient, patient_name=patient.name, doctor=doctor, reason='check',
+                                       appointment_date=timezone.localdate() + timedelta(days=i),
+                                       appointment_time=time(9))
+            HomeCareRequest.objects.create(patient_name=patient.name, phone=patient.phone, address='Saket',
+                                           issue='weakness', token=f'HA-{i:04d}', assigned_doctor=doctor)
+            DoctorActivityLog.objects.create(doctor=doctor, action='login')
+        self.rows += n
+
+    def admin_pages(self):
+        """(path, large table?) for the changelist, add and change form of every hmsapp model"""
+        pages = []
+        for model, model_admin in admin.site._registry.items():
+            if model._meta.app_label != 'hmsapp':
+                continue
+            base = f'/admin/hmsapp/{model._meta.model_name}/'
+            paths = [base, f'{base}{model.objects.order_by("pk").first().pk}/change/']
+            if model_admin.has_add_permission(mock.Mock(user=self.admin_user)):
+                paths.append(f'{base}add/')
+            pages += [(path, isinstance(model_admin, LargeTableAdmin)) for path in paths]
+        return pages
+
+    def test_statements_do_not_grow_with_rows(self):
+        counts = {}
+        for path, large in self.admin_pages():
+            self.client.get(path)  # content types and other per-process lookups
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(path).status_code, 200, path)
+            counts[path] = len(queries)
+            for query in queries:
+                if large and 'COUNT(' in query['sql']:
+                    self.assertIn('LIMIT', query['sql'], path)  # never a whole-table count
+        self.add_rows(4)
+        for path, count in counts.items():
+            self.client.get(path)  # footer statistics were invalidated by the new rows
+            with self.subTest(path=path), self.assertNumQueries(count):
+                self.client.get(path)
+        self.assertLessEqual(counts['/admin/hmsapp/emergencycase/'], 6)
+        # Foreign keys are autocomplete widgets, not a list of every patient
+        form = self.client.get('/admin/hmsapp/appointment/add/')
+        self.assertContains(form, 'admin-autocomplete')
+        self.assertNotContains(form, 'PT-A2')
+
+    @override_settings(HMS_ADMIN_COUNT_LIMIT=5)
+    def test_counts_stop_at_the_limit(self):
+        self.add_rows(4)
+        logs = DoctorActivityLog.objects.all()
+        self.assertEqual(EstimatedCountPaginator(logs.filter(doctor=self.doctors[0]), 100).count, 4)
+        self.assertEqual(EstimatedCountPaginator(logs.filter(action='login'), 100).count, 5)
+        self.assertEqual(EstimatedCountPaginator(logs, 100).count, 5)  # no statistics yet
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE hmsapp_doctoractivitylog')
+        self.assertEqual(EstimatedCountPaginator(logs, 100).count, 7)
+        self.assertContains(self.client.get('/admin/hmsapp/doctoractivitylog/'), '7 doctor activity logs')
+
+
+# ===============================
+# FULL-TEXT SEARCH
+# ===============================
+class SearchTests(TestCase):
+    def setUp(self):
+        self.asha = Patient.objects.create(name='Asha Verma', patient_id='PT-S1', phone='9876512345',
+                                           email='asha@example.com')
+        Patient.objects.create(name='Ravi Kumar', patient_id='PT-S2', phone='9876598765')
+
+    def names(self, text, model=Patient, field='name'):
+        return [row[field] for row in search.search(model, text, fields=(field,))]
+
+    def test_index_follows_every_kind_of_write(self):
+        self.assertEqual(self.names('51234'), ['Asha Verma'])   # phone fragment
+        self.assertEqual(self.names('verm asha'), ['Asha Verma'])  # every term, any column
+        self.assertEqual(self.names('example.com'), ['Asha Verma'])
+        Patient.objects.filter(pk=self.asha.pk).update(name='Asha Sharma')
+        self.assertEqual(self.names('verma'), [])
+        self.assertEqual(self.names('sharma'), ['Asha Sharma'])
+        Patient.objects.bulk_create([Patient(name='Meera Sharma', patient_id='PT-S3', phone='9876500300')])
+        self.assertEqual(self.names('sharma'), ['Meera Sharma', 'Asha Sharma'])  # newest first
+        self.asha.delete()
+        self.assertEqual(self.names('sharma'), ['Meera Sharma'])
+
+        EmergencyCase.objects.create(patient_name='Ravi Kumar', patient_phone='9876598765', symptom='pain',
+                                     token='EM-4711', symptom_description='crushing chest pain')
+        self.assertEqual(self.names('chest 4711', EmergencyCase, 'token'), ['EM-4711'])
+
+    def test_short_and_common_terms_fall_back_to_like(self):
+        self.assertIsNone(search.filter_queryset(Patient.objects.all(), 'Ra'))
+        self.assertEqual(self.names('Ra'), ['Ravi Kumar'])
+        self.assertEqual(self.names('Ra Kumar'), ['Ravi Kumar'])
+        self.assertIsNotNone(search.filter_queryset(Patient.objects.all(), '98765'))
+        with mock.patch.object(search, 'MAX_INDEX_MATCHES', 1):
+            self.assertIsNone(search.filter_queryset(Patient.objects.all(), '98765'))
+            self.assertEqual(search.filter_queryset(Patient.objects.all(), 'kumar').get().name, 'Ravi Kumar')
+
+    def test_admin_and_api_search_use_the_index(self):
+        staff = User.objects.create_superuser('desk', 'desk@example.com', 'x')
+        self.client.force_login(staff)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/hmsapp/patient/', {'q': '51234'})
+        self.assertContains(response, 'PT-S1')
+        self.assertNotContains(response, 'PT-S2')
+        self.assertTrue(any('hmsapp_patient_fts' in query['sql'] for query in queries))
+        self.assertFalse(any('LIKE' in query['sql'] for query in queries))
+
+        results = self.client.get('/api/search/', {'q': 'kumar'}).json()['results']
+        self.assertEqual(results, [{'id': Patient.objects.get(patient_id='PT-S2').pk, 'patient_id': 'PT-S2',
+                                    'name': 'Ravi Kumar', 'phone': '9876598765'}])
+        self.assertEqual(self.client.get('/api/search/', {'q': 'kumar', 'in': 'doctors'}).status_code, 400)
+        self.assertEqual(Client().get('/api/search/', {'q': 'kumar'}).status_code, 401)
+
+    def test_lost_triggers_are_reinstalled_and_the_index_rebuilt(self):
+        # What a migration that rebuilds the table leaves behind
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER hmsapp_patient_fts_ai')
+        Patient.objects.create(name='Kiran Rao', patient_id='PT-S4', phone='9876500400')
+        self.assertEqual(self.names('kiran'), [])
+        self.assertEqual(search.install(connection), ['hmsapp_patient_fts'])
+        self.assertEqual(self.names('kiran'), ['Kiran Rao'])
+        out = StringIO()
+        call_command('hms_search_index', stdout=out)
+        self.assertIn('hmsapp_patient_fts', out.getvalue())
+
+
+# ===============================
+# BOOKING FORM AUTOCOMPLETE
+# ===============================
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset()
+        Doctor.objects.create(name='Dr. Meera Shah', doctor_id='AC1', specialization='cardiology', status='busy')
+        Doctor.objects.create(name='Dr. Arjun Rao', doctor_id='AC2', specialization='cardiology')
+        Doctor.objects.create(name='Dr. Kiran Shetty', doctor_id='AC3', specialization='pediatrics')
+        Doctor.objects.create(name='Dr. Sunil Card', doctor_id='AC4', specialization='general', status='offline')
+        Hospital.objects.create(name='City Heart Hospital', address='Pune', phone='1')
+        Hospital.objects.create(name='Old Town Clinic', address='Pune', phone='2', is_active=False)
+
+    def names(self, query, kind='doctors', k=10):
+        return [result['name'] for result in autocomplete.complete(kind, query, k)]
+
+    def test_word_prefixes_of_bookable_entries_by_name(self):
+        self.assertEqual(self.names('card'), ['Dr. Arjun Rao', 'Dr. Meera Shah'])  # offline doctor left out
+        self.assertEqual(self.names('Cardio'), ['Dr. Arjun Rao', 'Dr. Meera Shah'])
+        self.assertEqual(self.names('sh'), ['Dr. Kiran Shetty', 'Dr. Meera Shah'])
+        self.assertEqual(self.names('sh card'), ['Dr. Meera Shah'])
+        self.assertEqual(self.names('dr', k=1), ['Dr. Arjun Rao'])
+        self.assertEqual(self.names('shx'), [])
+        self.assertEqual(self.names(''), ['Dr. Arjun Rao', 'Dr. Kiran Shetty', 'Dr. Meera Shah'])
+        self.assertEqual(self.names('hea', 'hospitals'), ['City Heart Hospital'])
+        self.assertEqual(self.names('clinic', 'hospitals'), [])
+        with self.assertNumQueries(0):
+            self.names('ped')
+
+    def test_listing_changes_rebuild_the_trie(self):
+        self.assertEqual(self.names('ped'), ['Dr. Kiran Shetty'])
+        built = autocomplete.autocomplete('doctors')
+        kiran = Doctor.objects.get(doctor_id='AC3')
+        with self.captureOnCommitCallbacks(execute=True):
+            kiran.status = 'busy'
+            kiran.save()
+        self.assertIs(autocomplete.autocomplete('doctors'), built)  # still listed the same
+        with self.captureOnCommitCallbacks(execute=True):
+            Doctor.objects.create(name='Dr. Pedro Alves', doctor_id='AC5', specialization='general')
+        self.assertEqual(self.names('ped'), ['Dr. Kiran Shetty', 'Dr. Pedro Alves'])
+
+        # Another process: seen once its generation bump is checked
+        Doctor.objects.filter(doctor_id='AC3').update(status='offline')
+        bump_generation(autocomplete.generation_name('doctors'))
+        self.assertEqual(self.names('ped'), ['Dr. Kiran Shetty', 'Dr. Pedro Alves'])
+        with override_settings(HMS_AUTOCOMPLETE_REFRESH_SECONDS=0):
+            self.assertEqual(self.names('ped'), ['Dr. Pedro Alves'])
+
+    def test_booking_form_loads_doctors_lazily(self):
+        response = self.client.get('/appointment/')
+        self.assertNotContains(response, 'Arjun Rao')
+        self.assertContains(response, '/api/autocomplete/')
+        data = self.client.get('/api/autocomplete/', {'kind': 'doctors', 'q': 'arj'}).json()
+        self.assertEqual(data['results'], [{'id': Doctor.objects.get(doctor_id='AC2').pk, 'name': 'Dr. Arjun Rao',
+                                            'specialization': 'Cardiology'}])
+        self.assertEqual(self.client.get('/api/autocomplete/', {'kind': 'patients'}).status_code, 400)
+
+
+# ===============================
+# EXPORTS
+# ===============================
+class ExportTests(TestCase):
+    def setUp(self):
+        self.doctor = Doctor.objects.create(name='Dr. Export', doctor_id='EXP1', specialization='general')
+        for day, token, status in [(3, 'EX-3', 'Completed'), (1, 'EX-1', 'Waiting'), (2, 'EX-2', 'Completed')]:
+            case = EmergencyCase.objects.create(patient_name=f'Patient {day}', symptom='fever', token=token,
+                                                status=status, assigned_doctor=self.doctor)
+            EmergencyCase.objects.filter(pk=case.pk).update(
+                created_at=timezone.make_aware(datetime(2026, 3, day, 23, 30)))
+
+    def export(self, kind='cases', fmt='csv', **filters):
+        return ''.join(exports.stream(kind, fmt, **filters))
+
+    def test_rows_in_date_order_with_filters(self):
+        rows = list(csv.DictReader(StringIO(self.export())))
+        self.assertEqual([row['token'] for row in rows], ['EX-1', 'EX-2', 'EX-3'])
+        self.assertEqual(rows[0]['doctor'], 'Dr. Export')
+        self.assertEqual(datetime.fromisoformat(rows[0]['created_at']),
+                         timezone.make_aware(datetime(2026, 3, 1, 23, 30)))
+
+        # Whole local days, both ends included
+        lines = self.export(fmt='jsonl', start=date(2026, 3, 2), end=date(2026, 3, 3),
+                            statuses=['Completed']).splitlines()
+        self.assertEqual([json.loads(line)['token'] for line in lines], ['EX-2', 'EX-3'])
+        self.assertEqual(self.export(end=date(2026, 2, 28)), ','.join(exports.columns('cases')) + '\r\n')
+        # Several statuses: one ordered query each, merged
+        with self.assertNumQueries(2):
+            lines = self.export(fmt='jsonl', statuses=['Completed', 'Waiting']).splitlines()
+        self.assertEqual([json.loads(line)['token'] for line in lines], ['EX-1', 'EX-2', 'EX-3'])
+        with self.assertRaises(exports.ExportError):
+            exports.stream('cases', statuses=['Lost'])
+
+    def test_csv_cells_cannot_be_formulas(self):
+        EmergencyCase.objects.filter(token='EX-1').update(patient_name='=HYPERLINK("http://x.test","y")',
+                                                          patient_phone='-1+2')
+        row = next(csv.DictReader(StringIO(self.export())))
+        self.assertEqual(row['patient_name'], '\'=HYPERLINK("http://x.test","y")')
+        self.assertEqual(row['patient_phone'], "'-1+2")
+        self.assertEqual(row['token'], 'EX-1')
+        # JSON lines carry the text as typed
+        self.assertEqual(json.loads(self.export(fmt='jsonl').splitlines()[0])['patient_name'],
+                         '=HYPERLINK("http://x.test","y")')
+
+    def test_streamed_with_one_query(self):
+        stats = {}
+        with self.assertNumQueries(1):
+            pieces = exports.stream('cases', 'csv', chunk_size=2, stats=stats)
+            self.assertEqual(stats, {})  # nothing read until the response is consumed
+            list(pieces)
+        self.assertEqual(stats['rows'], 3)
+
+    def test_api_and_command(self):
+        self.assertEqual(self.client.get('/api/export/cases/').status_code, 401)
+        staff = User.objects.create_superuser('reports', 'reports@example.com', 'x')
+        self.client.force_login(staff)
+        response = self.client.get('/api/export/cases/', {'format': 'jsonl', 'from': '2026-03-02'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="cases-2026-03-02.jsonl"')
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual([json.loads(line)['token'] for line in body.splitlines()], ['EX-2', 'EX-3'])
+        for params in ({'format': 'xml'}, {'status': 'Lost'}, {'to': '2026-02-30'}):
+            self.assertEqual(self.client.get('/api/export/cases/', params).status_code, 400)
+        self.assertEqual(self.client.get('/api/export/patients/').status_code, 400)
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'cases.csv.gz')
+        err = StringIO()
+        call_command('hms_export', 'cases', '--status', 'Waiting', '--output', path, stderr=err)
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            self.assertEqual([row['token'] for row in csv.DictReader(f)], ['EX-1'])
+        self.assertIn('Exported 1 cases row(s)', err.getvalue())
+        self.assertIn('rows/s', err.getvalue())
+
+
+# ===============================
+# READ REPLICAS
+# ===============================
+@override_settings(HMS_READ_REPLICAS=['replica'], HMS_REPLICA_STICKY_SECONDS=30,
+                   HMS_PASSWORD_HASH_WORKER=False)
+class ReplicaRoutingTests(TransactionTestCase):
+    """The replica is a second SQLite file refreshed with sync_replica()"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmpdir = tempfile.mkdtemp()
+        replica = connections.configure_settings({
+            **connections.settings,
+            'replica': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(cls.tmpdir, 'replica.sqlite3'),
+            },
+        })['replica']
+        # Registered on the handler only, like a connection created at runtime
+        connections['replica'] = load_backend(replica['ENGINE']).DatabaseWrapper(replica, 'replica')
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        shutil.rmtree(cls.tmpdir)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        Doctor.objects.create(name='Dr. Test', doctor_id='TDOC1', specialization='emergency')
+        sync_replica('replica')
+
+    def queue_tokens(self, client):
+        response = client.get('/api/emergency-cases/?fields=token')
+        return [case['token'] for case in response.json()['cases']]
+
+    def test_reads_lag_until_sync_but_writer_reads_primary(self):
+        writer, reader = Client(), Client()
+        response = writer.post('/patient/register/', {
+            'pName': 'Replica Patient', 'pPhone': '9888800001',
+            'pLocation': 'Saket, Delhi', 'pSymptom': 'fever',
+        })
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        token = EmergencyCase.objects.get(patient_phone='9888800001').token
+
+        self.assertIn(token, self.queue_tokens(writer))
+        self.assertNotIn(token, self.queue_tokens(reader))
+
+        sync_replica('replica')
+        self.assertIn(token, self.queue_tokens(reader))
+
+    def test_safe_requests_do_not_pin(self):
+        response = self.client.get('/api/emergency-cases/')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+
+# ===============================
+# SHARDING
+# ===============================
+@override_settings(HMS_SHARDS={'shard1': [], 'shard2': []}, HMS_PASSWORD_HASH_WORKER=False)
+class ShardingTests(SqliteFilesMixin, TransactionTestCase):
+    """Two local SQLite files as shards next to 'default'"""
+
+    file_aliases = ('shard1', 'shard2')
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(name='Dr. Shard', doctor_id='SDOC1', specialization='general')
+        self.hospitals = [
+            Hospital.objects.create(name=f'Hospital {i}', address='Delhi', phone='011')
+            for i in range(3)
+        ]
+        shards = {'shard1': [self.hospitals[1].pk], 'shard2': [self.hospitals[2].pk]}
+        self.enterContext(override_settings(HMS_SHARDS=shards))
+        for alias in shards:
+            reserve_id_block(alias)
+
+    def create_case(self, hospital, symptom='fever'):
+        return EmergencyCase.objects.create(
+            patient_name=f'Patient {hospital.pk}', symptom=symptom,
+            assigned_doctor=self.doctor, assigned_hospital=hospital,
+        )
+
+    def test_rows_live_in_their_hospitals_shard(self):
+        cases = [self.create_case(hospital) for hospital in self.hospitals]
+        for case, alias in zip(cases, ['default', 'shard1', 'shard2']):
+            self.assertEqual(case._state.db, alias)
+            self.assertEqual(shard_for_pk(case.pk), alias)
+            self.assertTrue(EmergencyCase.objects.using(alias).filter(pk=case.pk).exists())
+        self.assertEqual(EmergencyCase.objects.count(), 1)
+        self.assertEqual(sharding.count(EmergencyCase.objects.all()), 3)
+
+    def test_network_views_fan_out(self):
+        self.create_case(self.hospitals[2], 'pain')
+        self.create_case(self.hospitals[0], 'routine')
+        self.create_case(self.hospitals[1], 'fever')
+
+        rows = self.client.get('/api/emergency-cases/?fields=queue_no,priority,doctor').json()['cases']
+        self.assertEqual([row['priority'] for row in rows], ['Critical', 'Medium', 'Low'])
+        self.assertEqual([row['queue_no'] for row in rows], [1, 2, 3])
+        # Doctor names come from the shard's reference copy
+        self.assertEqual({row['doctor'] for row in rows}, {'Dr. Shard'})
+
+    def test_status_update_finds_the_shard_by_id(self):
+        case = self.create_case(self.hospitals[2])
+        self.client.post(f'/doctor/case/{case.pk}/update/', {'status': 'In Progress'})
+        self.assertEqual(EmergencyCase.objects.using('shard2').get(pk=case.pk).status, 'In Progress')
@@ -1,32 +1,45 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
-from django.contrib.auth.hashers import make_password, check_password
-from django.db import IntegrityError
+from django.utils.dateparse import parse_date, parse_time
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, router
 from datetime import datetime, timedelta
 import json
+import uuid
 
 from .models import (
     Doctor, Patient, EmergencyCase, Appointment, 
-    Hospital, HomeCareRequest, DoctorActivityLog
+    Hospital, HomeCareRequest
 )
+from .activity import log_activity
+from .caching import cache_page_by_role
+from .case_status import BulkUpdateError, bulk_set_status
+from .credentials import is_pending
+from . import agenda, autocomplete, availability, exports, geo, intake, locations, search, sharding
+from .archive import TERMINAL_STATUSES, case_history, case_history_page
+from .projections import ApiField, FieldsetError, choice_display, parse_fields, project
+from .sqlite import read_transaction
 
 
 # ===============================
 # HOME / INDEX VIEW
 # ===============================
+@cache_page_by_role('hospital', 'emergencycase', 'doctor')
 def index(request):
     """Home page with emergency registration form"""
     hospitals = Hospital.objects.filter(is_active=True)[:3]
     context = {
         'hospitals': hospitals,
-        'total_cases': EmergencyCase.objects.count(),
-        'active_cases': EmergencyCase.objects.filter(status__in=['Waiting', 'Doctor Assigned']).count(),
+        'total_cases': sharding.count(EmergencyCase.objects.all()),
+        'active_cases': sharding.count(
+            EmergencyCase.objects.filter(status__in=['Waiting', 'Doctor Assigned'])
+        ),
     }
     return render(request, 'index.html', context)
 
@@ -43,8 +56,16 @@ def patient_login(request):
         try:
             patient = Patient.objects.get(phone=phone)
             
+            # First login with a not-yet-hashed initial password (phone number)
+            if is_pending(patient.password) and patient.check_password(password):
+                request.session['patient_id'] = patient.id
+                request.session['patient_name'] = patient.name
+                request.session['patient_phone'] = patient.phone
+                messages.info(request, 'Please change your password for security.')
+                return redirect('patient-dashboard')
+            
             # Check password
-            if patient.password and check_password(password, patient.password):
+            if patient.password and patient.check_password(password):
                 request.session['patient_id'] = patient.id
                 request.session['patient_name'] = patient.name
                 request.session['patient_phone'] = patient.phone
@@ -84,32 +105,31 @@ def patient_dashboard(request):
     
     patient = get_object_or_404(Patient, id=patient_id)
     
-    # Get patient's cases
-    emergency_cases = EmergencyCase.objects.filter(
-        patient=patient
-    ).order_by('-created_at')
+    # Get patient's cases (live + archived history) and appointments, from every shard
+    emergency_cases = case_history(patient=patient)
     
-    # Get patient's appointments
-    appointments = Appointment.objects.filter(
+    appointments = sharding.collect(Appointment.objects.filter(
         patient=patient
-    ).order_by('-appointment_date', '-appointment_time')
+    ).select_related('doctor', 'hospital').order_by('-appointment_date', '-appointment_time'))
     
     # Separate upcoming and past
     today = timezone.now().date()
-    upcoming_cases = emergency_cases.filter(
-        status__in=['Waiting', 'Doctor Assigned', 'In Progress', 'Doctor En Route']
-    )
-    past_cases = emergency_cases.filter(
-        status__in=['Completed', 'Cancelled']
-    )
-    
-    upcoming_appointments = appointments.filter(
-        appointment_date__gte=today,
-        status__in=['Scheduled', 'Confirmed']
-    )
-    past_appointments = appointments.filter(
-        status__in=['Completed', 'Cancelled']
-    ) | appointments.filter(appointment_date__lt=today)
+    upcoming_cases = [
+        case for case in emergency_cases
+        if case.status in ('Waiting', 'Doctor Assigned', 'In Progress', 'Doctor En Route')
+    ]
+    past_cases = [
+        case for case in emergency_cases if case.status in ('Completed', 'Cancelled')
+    ]
+    
+    upcoming_appointments = [
+        appt for appt in appointments
+        if appt.appointment_date >= today and appt.status in ('Scheduled', 'Confirmed')
+    ]
+    past_appointments = [
+        appt for appt in appointments
+        if appt.status in ('Completed', 'Cancelled') or appt.appointment_date < today
+    ]
     
     context = {
         'patient': patient,
@@ -117,8 +137,8 @@ def patient_dashboard(request):
         'past_cases': past_cases,
         'upcoming_appointments': upcoming_appointments,
         'past_appointments': past_appointments,
-        'total_cases': emergency_cases.count(),
-        'total_appointments': appointments.count(),
+        'total_cases': len(emergency_cases),
+        'total_appointments': len(appointments),
     }
     return render(request, 'patient-dashboard.html', context)
 
@@ -139,7 +159,7 @@ def patient_change_password(request):
         
         # Verify current password
         if patient.password:
-            if not check_password(current_password, patient.password):
+            if not patient.check_password(current_password):
                 messages.error(request, 'Current password is incorrect')
                 return redirect('patient-change-password')
         else:
@@ -183,29 +203,12 @@ def patient_register(request):
         care_mode = request.POST.get('careMode', 'hospital')
         
         if name and phone and symptom:
-            # 1. Create or get the Patient
-            patient, created = Patient.objects.get_or_create(
-                phone=phone,
-                defaults={
-                    'name': name,
-                    'patient_id': f'PAT-{timezone.now().strftime("%Y%m%d%H%M%S")}',
-                    'location': location or '',
-                    'password': make_password(phone)
-                }
-            )
-
-            # 2. Create Emergency Case LINKED to the patient
-            case = EmergencyCase.objects.create(
-                patient=patient,  # CRITICAL: This links the case to the patient record
-                patient_name=name,
-                patient_phone=phone,
-                patient_location=location or '',
-                symptom=symptom,
-                mode='Hospital Emergency' if care_mode == 'hospital' else 'Home Assistance',
-                status='Waiting'
+            # 1. Patient + Emergency Case in one transaction (see intake.py)
+            patient, case = intake.register_emergency(
+                name, phone, location, symptom, care_mode, *_coordinates(request.POST)
             )
 
-            # 3. Set Session for Auto-Login
+            # 2. Set Session for Auto-Login
             request.session['patient_id'] = patient.id
             request.session['patient_name'] = patient.name
             request.session['patient_phone'] = patient.phone
@@ -236,15 +239,8 @@ def doctor_logout(request):
     """Doctor logout"""
     doctor_id = request.session.get('doctor_id')
     if doctor_id:
-        try:
-            doctor = Doctor.objects.get(id=doctor_id)
-            DoctorActivityLog.objects.create(
-                doctor=doctor,
-                action='logout',
-                description=f'{doctor.name} logged out'
-            )
-        except Doctor.DoesNotExist:
-            pass
+        doctor_name = request.session.get('doctor_name', 'Doctor')
+        log_activity(doctor_id, 'logout', f'{doctor_name} logged out')
     
     request.session.flush()
     messages.success(request, 'Doctor session ended')
@@ -260,61 +256,142 @@ def doctor_dashboard(request):
     
     doctor = get_object_or_404(Doctor, id=doctor_id)
     
-    # Get assigned cases
-    assigned_cases = EmergencyCase.objects.filter(
-        assigned_doctor=doctor
-    ).order_by('score', 'created_at')
-    
-    # Get today's appointments
-    today = timezone.now().date()
-    appointments = Appointment.objects.filter(
-        doctor=doctor,
-        appointment_date=today
-    ).order_by('appointment_time')
+    # Open cases + today's appointments, cached per doctor and kept up to date by signals
+    today = agenda.agenda_for(doctor.id)
     
     context = {
         'doctor': doctor,
-        'cases': assigned_cases,
-        'appointments': appointments,
-        'total_cases': assigned_cases.count(),
-        'pending_cases': assigned_cases.filter(status='Waiting').count(),
+        'cases': today['cases'],
+        'appointments': today['appointments'],
+        'timeline': today['timeline'],
+        'open_cases': today['open_cases'],
+        'pending_cases': today['waiting_cases'],
     }
     return render(request, 'doctor-dashboard.html', context)
 
 
+HISTORY_PAGE_SIZE = 25
+
+
+def doctor_history(request):
+    """Doctor's closed cases (live and archived), paginated"""
+    doctor_id = request.session.get('doctor_id')
+    
+    if not doctor_id:
+        return redirect('doctor')
+    
+    doctor = get_object_or_404(Doctor, id=doctor_id)
+    page = max(1, _int_param(request.GET.get('page'), 1))
+    cases, has_next = case_history_page(
+        page, HISTORY_PAGE_SIZE, assigned_doctor_id=doctor.id, status__in=TERMINAL_STATUSES
+    )
+    
+    context = {
+        'doctor': doctor,
+        'cases': cases,
+        'page': page,
+        'has_next': has_next,
+    }
+    return render(request, 'doctor-history.html', context)
+
+
 def update_case_status(request, case_id):
-    """Update case status from doctor dashboard"""
+    """Update case status from doctor dashboard (409 for JSON clients on a conflict)"""
     if request.method == 'POST':
-        case = get_object_or_404(EmergencyCase, id=case_id)
+        # The id block tells which shard holds the case
+        case = get_object_or_404(
+            EmergencyCase.objects.using(sharding.shard_for_pk(case_id)), id=case_id
+        )
         new_status = request.POST.get('status')
+        wants_json = 'application/json' in request.headers.get('Accept', '')
         
         if new_status:
-            case.status = new_status
-            case.save()
+            # The version the doctor saw; defaults to the one just read
+            try:
+                version = int(request.POST.get('version', case.version))
+            except ValueError:
+                version = case.version
+            
+            if not case.save_if_current(version, status=new_status):
+                case.refresh_from_db(fields=['status', 'version'])
+                if wants_json:
+                    return JsonResponse({
+                        'error': 'conflict', 'status': case.status, 'version': case.version,
+                    }, status=409)
+                messages.error(
+                    request,
+                    f'Case {case.token} was updated by someone else (now {case.status}). '
+                    f'Please review it and try again.'
+                )
+                return redirect('doctor-dashboard')
             
             # Log activity
             doctor_id = request.session.get('doctor_id')
             if doctor_id:
-                doctor = Doctor.objects.get(id=doctor_id)
-                DoctorActivityLog.objects.create(
-                    doctor=doctor,
-                    action='case_updated',
-                    description=f'Updated case {case.token} to {new_status}'
-                )
+                log_activity(doctor_id, 'case_updated', f'Updated case {case.token} to {new_status}')
             
+            if wants_json:
+                return JsonResponse({'status': case.status, 'version': case.version})
             messages.success(request, 'Case status updated')
     
     return redirect('doctor-dashboard')
 
 
+@require_http_methods(['POST'])
+def api_location(request):
+    """
+    Location ping from the logged-in doctor's device: POST lat, lon (form or
+    JSON). Kept in memory and written behind (see locations.py); 204 on success.
+    """
+    doctor_id = request.session.get('doctor_id')
+    if not doctor_id:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+    
+    data = request.POST
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = {}
+    lat, lon = _coordinates({'latitude': data.get('lat'), 'longitude': data.get('lon')})
+    if lat is None:
+        return JsonResponse({'error': 'lat and lon must be valid coordinates'}, status=400)
+    locations.record_ping(doctor_id, lat, lon)
+    return HttpResponse(status=204)
+
+
+@require_http_methods(['POST'])
+def bulk_update_cases(request):
+    """
+    Several status changes in one request. JSON body:
+    {"updates": [{"id": 12, "status": "Completed", "version": 3}, ...]}
+    (version optional); answers with the updated and rejected cases.
+    """
+    doctor_id = request.session.get('doctor_id')
+    if not doctor_id:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+    
+    try:
+        updates = json.loads(request.body)['updates']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON body {"updates": [...]}'}, status=400)
+    
+    try:
+        result = bulk_set_status(doctor_id, updates)
+    except BulkUpdateError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse(result)
+
+
 # ===============================
 # APPOINTMENT VIEWS
 # ===============================
+@cache_page_by_role('doctor', 'hospital', 'emergencycase')
 def appointment(request):
     """Appointment booking page"""
-    doctors = Doctor.objects.filter(status__in=['available', 'busy'])
-    hospitals = Hospital.objects.filter(is_active=True)
-    
+    # Doctors and hospitals are picked through /api/autocomplete/, not listed here
     if request.method == 'POST':
         name = request.POST.get('pName')
         phone = request.POST.get('pPhone')
@@ -322,8 +399,18 @@ def appointment(request):
         doctor_id = request.POST.get('pDoctor')
         hospital_id = request.POST.get('pHospital')
         symptom = request.POST.get('pSymptom')
-        date = request.POST.get('appointment_date')
-        time = request.POST.get('appointment_time')
+        duration = _int_param(request.POST.get('pDuration'), 15)
+        try:
+            date = parse_date(request.POST.get('appointment_date') or '') or timezone.localdate()
+            time = parse_time(request.POST.get('appointment_time') or '')
+        except ValueError:
+            # Well-formed but impossible, e.g. 2026-02-30 or 25:00
+            messages.error(request, 'Please choose a valid date and time.')
+            return render(request, 'appointment.html')
+        if duration not in availability.DURATIONS:
+            # Checked first: slot searches and holds cost time per minute of visit
+            messages.error(request, f'Visits last {", ".join(map(str, availability.DURATIONS))} minutes.')
+            return render(request, 'appointment.html')
         
         if name and phone and doctor_id:
             doctor = get_object_or_404(Doctor, id=doctor_id)
@@ -331,44 +418,25 @@ def appointment(request):
             if hospital_id:
                 hospital = get_object_or_404(Hospital, id=hospital_id)
             
-            # 1. Handle User and Patient Creation
-            # Create/Get Django User (Required for the Navbar to show 'Logout/Profile')
-            user, u_created = User.objects.get_or_create(
-                username=phone,
-                defaults={
-                    'first_name': name,
-                    'password': make_password(phone)
-                }
-            )
-
-            # Create/Get Patient linked to User
-            patient, created = Patient.objects.get_or_create(
-                phone=phone,
-                defaults={
-                    'user': user,
-                    'name': name,
-                    'patient_id': f'PAT-{timezone.now().strftime("%Y%m%d%H%M%S")}',
-                    'location': location or '',
-                    'password': make_password(phone)
-                }
-            )
-            
-            if not created and location:
-                patient.location = location
-                patient.save()
-            
+            owner = _hold_owner(request)
+            held = False
             try:
-                # 2. Create the actual appointment
-                appointment_obj = Appointment.objects.create(
-                    patient=patient,
-                    patient_name=name,
-                    patient_phone=phone,
-                    patient_location=location or '',
-                    doctor=doctor,
-                    hospital=hospital,
-                    appointment_date=date or timezone.now().date(),
-                    appointment_time=time or timezone.now().time(),
+                # 1. Hold the time (refused at once while another patient holds it),
+                #    then reject taken / overlapping times from the cached day, before any write
+                if time is None:
+                    time = next(iter(availability.slot_board(doctor, date, duration, owner)[0]), None)
+                    if time is None:
+                        raise availability.SlotUnavailable('No free time left on that day')
+                if availability.holds_enabled():
+                    availability.hold_slot(doctor, date, time, duration, owner)
+                    held = True
+                availability.check_slot(doctor, date, time, duration)
+                
+                # 2. User, Patient and Appointment in one transaction
+                user, patient, appointment_obj = intake.book_appointment(
+                    name, phone, location, doctor, hospital,
                     reason=symptom or 'Routine checkup',
+                    date=date, time=time, duration=duration,
                 )
                 
                 # 3. Handle Authentication
@@ -388,33 +456,36 @@ def appointment(request):
                 # 4. Redirect to Patient Dashboard
                 return redirect('patient-dashboard')
                 
+            except availability.SlotUnavailable as error:
+                free = availability.slot_board(doctor, date, duration, owner)[0][:5]
+                suggestion = f' Free times on {date}: {", ".join(slot.strftime("%H:%M") for slot in free)}.' if free else ''
+                messages.error(request, f'{error}. Please choose a different time.{suggestion}')
             except IntegrityError:
-                messages.error(
-                    request,
-                    'This time slot is already booked. Please choose a different time.'
-                )
+                # The phone was registered by a concurrent request; the slot itself is fine
+                messages.error(request, 'This phone number was registered at the same moment by another request. Please submit again.')
+            finally:
+                # Booked (the appointment now blocks the time) or failed: either way let go
+                if held:
+                    availability.release_hold(doctor.pk, date, time, duration, owner)
     
-    context = {
-        'doctors': doctors,
-        'hospitals': hospitals,
-    }
-    return render(request, 'appointment.html', context)
+    return render(request, 'appointment.html')
 
 
 # ===============================
 # EMERGENCY QUEUE VIEWS
 # ===============================
+@cache_page_by_role('emergencycase', 'doctor')
 def emergency_queue(request):
     """Emergency priority queue display"""
-    cases = EmergencyCase.objects.filter(
+    cases = sharding.collect(EmergencyCase.objects.filter(
         status__in=['Waiting', 'Doctor Assigned', 'In Progress', 'Doctor En Route']
-    ).order_by('score', 'created_at')
+    ).select_related('assigned_doctor').order_by('score', 'created_at'))
     
     context = {
         'cases': cases,
-        'total_waiting': cases.filter(status='Waiting').count(),
-        'critical_count': cases.filter(priority='Critical').count(),
-        'high_count': cases.filter(priority='High').count(),
+        'total_waiting': sum(1 for case in cases if case.status == 'Waiting'),
+        'critical_count': sum(1 for case in cases if case.priority == 'Critical'),
+        'high_count': sum(1 for case in cases if case.priority == 'High'),
     }
     return render(request, 'emergency-queue.html', context)
 
@@ -432,48 +503,9 @@ def home_care(request):
         address = request.POST.get('hcAddress', '')
         
         if name and issue and phone:
-            # Map mode
-            mode_map = {
-                'Doctor Home Visit': 'home_visit',
-                'Doctor On Call Assistance': 'call_assist'
-            }
-            
-            # Create home care request
-            request_obj = HomeCareRequest.objects.create(
-                patient_name=name,
-                phone=phone,
-                address=address,
-                issue=issue.lower().replace(' ', '_'),
-                mode=mode_map.get(mode, 'home_visit'),
-            )
-            
-            # Also create emergency case
-            symptom_map = {
-                'Heart Attack Symptoms': 'pain',
-                'Breathing Difficulty': 'pain',
-                'Stroke Symptoms': 'stroke',
-                'Severe Weakness': 'weakness',
-            }
-            
-            # Get or create patient
-            patient, created = Patient.objects.get_or_create(
-                phone=phone,
-                defaults={
-                    'name': name,
-                    'patient_id': f'PAT-{timezone.now().strftime("%Y%m%d%H%M%S")}',
-                    'address': address,
-                    'password': make_password(phone)
-                }
-            )
-            
-            EmergencyCase.objects.create(
-                patient=patient,
-                patient_name=name,
-                patient_phone=phone,
-                patient_location=address,
-                symptom=symptom_map.get(issue, 'pain'),
-                mode='Doctor Home Visit' if 'Home' in mode else 'Doctor On Call',
-                status='Doctor Assigned',
+            # Home care request, patient and emergency case in one transaction
+            patient, request_obj, case = intake.register_home_care(
+                name, phone, address, issue, mode, *_coordinates(request.POST)
             )
             
             # Store session
@@ -490,96 +522,377 @@ def home_care(request):
     return render(request, 'home-care.html')
 
 
-def home_tracking(request):
-    """Track doctor on the way"""
+def _coordinates(data):
+    """(lat, lon) from the latitude/longitude form fields, or (None, None)"""
+    try:
+        lat, lon = float(data['latitude']), float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None, None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, None
+    return lat, lon
+
+
+def _tracked_visit(request):
+    """The session patient's latest home visit case, its doctor and live (distance, ETA)"""
     patient_id = request.session.get('patient_id')
     
     # Get latest case for this patient
     case = None
     if patient_id:
-        case = EmergencyCase.objects.filter(
+        cases = sharding.collect(EmergencyCase.objects.filter(
             patient_id=patient_id,
-            mode__in=['Home Assistance', 'Doctor Home Visit']
-        ).order_by('-created_at').first()
-    
-    # Get latest home care request
-    home_request = HomeCareRequest.objects.filter().order_by('-created_at').first()
-    
-    context = {
+            mode__in=geo.HOME_VISIT_MODES
+        ).select_related('assigned_doctor').order_by('-created_at')[:1])
+        case = cases[0] if cases else None
+    
+    # Live distance and ETA from the doctor's latest ping (locations.py)
+    doctor = case.assigned_doctor if case else None
+    live = None
+    if doctor and case.status not in ('Completed', 'Cancelled'):
+        live = geo.live_eta(doctor, case.patient_latitude, case.patient_longitude)
+    return {
         'case': case,
-        'home_request': home_request,
-        'doctor': case.assigned_doctor if case else None,
+        'doctor': doctor,
+        'distance_km': round(live[0], 1) if live else None,
+        'eta': geo.format_eta(live[1]) if live else (case.eta if case else ''),
     }
+
+
+def home_tracking(request):
+    """Track doctor on the way"""
+    context = _tracked_visit(request)
+    
+    # Latest home care request of this patient
+    context['home_request'] = None
+    phone = request.session.get('patient_phone')
+    if phone:
+        home_requests = sharding.collect(HomeCareRequest.objects.filter(phone=phone).order_by('-created_at')[:1])
+        context['home_request'] = home_requests[0] if home_requests else None
+    
     return render(request, 'home-tracking.html', context)
 
 
+def api_tracking(request):
+    """Live status for home-tracking.html to poll: doctor, distance and ETA"""
+    visit = _tracked_visit(request)
+    if visit['case'] is None:
+        return JsonResponse({'case': None})
+    return JsonResponse({
+        'case': visit['case'].token,
+        'status': visit['case'].status,
+        'doctor': visit['doctor'].name if visit['doctor'] else None,
+        'distance_km': visit['distance_km'],
+        'eta': visit['eta'],
+    })
+
+
 # ===============================
 # API VIEWS (For AJAX)
 # ===============================
-def api_emergency_cases(request):
-    """API endpoint for getting emergency cases"""
+QUEUE_FIELDS = {
+    'queue_no': ApiField(),
+    'token': ApiField('token'),
+    'name': ApiField('patient_name'),
+    'symptom': ApiField('symptom', choice_display(EmergencyCase.SYMPTOM_CHOICES)),
+    'priority': ApiField('priority'),
+    'mode': ApiField('mode'),
+    'status': ApiField('status'),
+    'doctor': ApiField('assigned_doctor__name', lambda name: name or 'Unassigned'),
+}
+
+MY_CASES_FIELDS = {
+    'id': ApiField('id'),
+    'token': ApiField('token'),
+    'name': ApiField('patient_name'),
+    'symptom': ApiField('symptom', choice_display(EmergencyCase.SYMPTOM_CHOICES)),
+    'mode': ApiField('mode'),
+    'status': ApiField('status'),
+    'priority': ApiField('priority'),
+}
+
+HOSPITAL_FIELDS = {
+    'id': ApiField('id'),
+    'name': ApiField('name'),
+    'load': ApiField('emergency_load', choice_display(Hospital.LOAD_CHOICES)),
+    'available_beds': ApiField('available_beds'),
+    'total_beds': ApiField('total_beds'),
+}
+
+
+def _queue_section(request, fields=None):
+    """Active emergency queue rows (shared by api_emergency_cases and api_bootstrap)"""
+    # The cases of the emergency queue page, which polls this section
     cases = EmergencyCase.objects.filter(
-        status__in=['Waiting', 'Doctor Assigned', 'In Progress']
+        status__in=['Waiting', 'Doctor Assigned', 'In Progress', 'Doctor En Route']
     ).order_by('score', 'created_at')
-    
-    data = []
-    for idx, case in enumerate(cases, 1):
-        data.append({
-            'queue_no': idx,
-            'token': case.token,
-            'name': case.patient_name,
-            'symptom': case.get_symptom_display(),
-            'priority': case.priority,
-            'status': case.status,
-            'doctor': case.assigned_doctor.name if case.assigned_doctor else 'Unassigned',
-        })
-    
-    return JsonResponse({'cases': data, 'total': len(data)})
+    return project(cases, QUEUE_FIELDS, parse_fields(fields, QUEUE_FIELDS), sharding.collect)
 
 
-def api_doctor_cases(request):
-    """API endpoint for doctor's assigned cases"""
+def _my_cases_section(request, fields=None):
+    """Cases assigned to the logged-in doctor, or None when not logged in"""
     doctor_id = request.session.get('doctor_id')
-    
     if not doctor_id:
-        return JsonResponse({'error': 'Not authenticated'}, status=401)
+        return None
     
     cases = EmergencyCase.objects.filter(
         assigned_doctor_id=doctor_id
     ).order_by('score', 'created_at')
-    
-    data = []
-    for case in cases:
-        data.append({
-            'id': case.id,
-            'token': case.token,
-            'name': case.patient_name,
-            'symptom': case.get_symptom_display(),
-            'mode': case.mode,
-            'status': case.status,
-            'priority': case.priority,
-        })
+    return project(cases, MY_CASES_FIELDS, parse_fields(fields, MY_CASES_FIELDS), sharding.collect)
+
+
+def _hospitals_section(request, fields=None):
+    """Active hospital network status"""
+    hospitals = Hospital.objects.filter(is_active=True)
+    return project(hospitals, HOSPITAL_FIELDS, parse_fields(fields, HOSPITAL_FIELDS))
+
+
+BOOTSTRAP_SECTIONS = {
+    'queue': _queue_section,
+    'hospitals': _hospitals_section,
+    'my_cases': _my_cases_section,
+}
+
+
+def _fieldset_error(error):
+    return JsonResponse({'error': str(error)}, status=400)
+
+
+def api_emergency_cases(request):
+    """API endpoint for getting emergency cases (supports ?fields=)"""
+    try:
+        data = _queue_section(request, request.GET.get('fields'))
+    except FieldsetError as error:
+        return _fieldset_error(error)
+    return JsonResponse({'cases': data, 'total': len(data)})
+
+
+def api_doctor_cases(request):
+    """API endpoint for doctor's assigned cases (supports ?fields=)"""
+    try:
+        data = _my_cases_section(request, request.GET.get('fields'))
+    except FieldsetError as error:
+        return _fieldset_error(error)
+    if data is None:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
     
     return JsonResponse({'cases': data})
 
 
 def api_hospitals(request):
-    """API endpoint for hospital network status"""
-    hospitals = Hospital.objects.filter(is_active=True)
-    
-    data = []
-    for hospital in hospitals:
-        data.append({
-            'id': hospital.id,
-            'name': hospital.name,
-            'load': hospital.get_emergency_load_display(),
-            'available_beds': hospital.available_beds,
-            'total_beds': hospital.total_beds,
-        })
-    
+    """API endpoint for hospital network status (supports ?fields=)"""
+    try:
+        data = _hospitals_section(request, request.GET.get('fields'))
+    except FieldsetError as error:
+        return _fieldset_error(error)
     return JsonResponse({'hospitals': data})
 
 
+def _int_param(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _slot_params(request):
+    """?duration= (minutes), ?date= (defaults to today)"""
+    duration = _int_param(request.GET.get('duration'), 15)
+    if duration not in availability.DURATIONS:
+        raise ValueError(f'duration must be one of {", ".join(map(str, availability.DURATIONS))}')
+    date = request.GET.get('date')
+    day = parse_date(date) if date else timezone.localdate()
+    if day is None:
+        raise ValueError('date must be YYYY-MM-DD')
+    return day, duration
+
+
+def api_slots(request):
+    """Free start times for one doctor and day: /api/slots/?doctor=<id>&date=YYYY-MM-DD&duration=30"""
+    try:
+        day, duration = _slot_params(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    doctor = get_object_or_404(Doctor, id=_int_param(request.GET.get('doctor'), 0))
+    slots, held = availability.slot_board(doctor, day, duration, request.COOKIES.get(availability.HOLD_COOKIE))
+    return JsonResponse({
+        'doctor': doctor.id,
+        'date': day.isoformat(),
+        'duration': duration,
+        'slots': [slot.strftime('%H:%M') for slot in slots],
+        'held': [slot.strftime('%H:%M') for slot in held],
+    })
+
+
+def _hold_owner(request):
+    """This browser's hold token (HOLD_COOKIE), created on first use"""
+    if not hasattr(request, '_hold_owner'):
+        request._hold_owner = request.COOKIES.get(availability.HOLD_COOKIE) or uuid.uuid4().hex
+    return request._hold_owner
+
+
+@require_http_methods(['POST'])
+def api_hold_slot(request):
+    """
+    Hold a time while the patient fills in the booking form.
+    POST doctor, date, time, duration; 409 lists the times other patients hold.
+    """
+    doctor = get_object_or_404(Doctor, id=_int_param(request.POST.get('doctor'), 0))
+    try:
+        day = parse_date(request.POST.get('date') or '')
+        start = parse_time(request.POST.get('time') or '')
+    except ValueError:  # well-formed but impossible, e.g. 2026-02-30
+        day = start = None
+    duration = _int_param(request.POST.get('duration'), 15)
+    if day is None or start is None or duration not in availability.DURATIONS:
+        return JsonResponse({'error': 'doctor, date (YYYY-MM-DD), time (HH:MM) and duration are required'}, status=400)
+    if not availability.holds_enabled():
+        return JsonResponse({'held': False})
+    
+    owner = _hold_owner(request)
+    try:
+        availability.hold_slot(doctor, day, start, duration, owner)
+        try:
+            availability.check_slot(doctor, day, start, duration)
+        except availability.SlotUnavailable:
+            availability.release_hold(doctor.pk, day, start, duration, owner)
+            raise
+    except availability.SlotUnavailable as error:
+        slots, held = availability.slot_board(doctor, day, duration, owner)
+        return JsonResponse({
+            'error': str(error),
+            'slots': [slot.strftime('%H:%M') for slot in slots],
+            'held': [slot.strftime('%H:%M') for slot in held],
+        }, status=409)
+    
+    response = JsonResponse({'held': True, 'expires_in': availability.hold_seconds()})
+    response.set_cookie(availability.HOLD_COOKIE, owner, httponly=True, samesite='Lax')
+    return response
+
+
+def api_next_slot(request):
+    """Earliest free time for a specialization: /api/slots/next/?specialization=cardiology&duration=15"""
+    try:
+        day, duration = _slot_params(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    found = availability.next_free_slot(request.GET.get('specialization', 'general'), duration, start=day)
+    if found is None:
+        return JsonResponse({'slot': None})
+    doctor, day, start = found
+    return JsonResponse({'slot': {
+        'doctor': doctor.id,
+        'doctor_name': doctor.name,
+        'date': day.isoformat(),
+        'time': start.strftime('%H:%M'),
+        'duration': duration,
+    }})
+
+
+def api_autocomplete(request):
+    """Booking form pickers: /api/autocomplete/?kind=doctors|hospitals&q=card&limit=10"""
+    kind = request.GET.get('kind', 'doctors')
+    if kind not in autocomplete.KINDS:
+        return JsonResponse({'error': f'kind must be one of {", ".join(autocomplete.KINDS)}'}, status=400)
+    limit = min(max(_int_param(request.GET.get('limit'), 10), 1), 50)
+    return JsonResponse({'results': autocomplete.complete(kind, request.GET.get('q', ''), limit)})
+
+
+def api_bootstrap(request):
+    """
+    Dashboard bootstrap: several API sections in one round trip.
+    Usage: /api/bootstrap/?include=queue,hospitals,my_cases&fields[queue]=token,status
+    """
+    include = request.GET.get('include')
+    if include:
+        sections = [name.strip() for name in include.split(',') if name.strip()]
+    else:
+        sections = ['queue', 'hospitals']
+        if request.session.get('doctor_id'):
+            sections.append('my_cases')
+    
+    unknown = [name for name in sections if name not in BOOTSTRAP_SECTIONS]
+    if unknown:
+        return JsonResponse({
+            'error': f'Unknown section(s): {", ".join(unknown)}',
+            'available': sorted(BOOTSTRAP_SECTIONS),
+        }, status=400)
+    
+    data = {}
+    errors = {}
+    # One read transaction: every section reads the same snapshot on one
+    # connection, without taking the write lock (transaction_mode IMMEDIATE)
+    try:
+        with read_transaction(using=router.db_for_read(EmergencyCase)):
+            for name in dict.fromkeys(sections):
+                section = BOOTSTRAP_SECTIONS[name](request, request.GET.get(f'fields[{name}]'))
+                if section is None:
+                    errors[name] = 'Not authenticated'
+                else:
+                    data[name] = section
+    except FieldsetError as error:
+        return _fieldset_error(error)
+    
+    if errors:
+        data['errors'] = errors
+    return JsonResponse(data)
+
+
+SEARCH_TARGETS = {
+    # ?in=: model, fields of each result
+    'patients': (Patient, ('id', 'patient_id', 'name', 'phone')),
+    'cases': (EmergencyCase, ('id', 'token', 'patient_name', 'patient_phone', 'status', 'priority')),
+    'home-care': (HomeCareRequest, ('id', 'token', 'patient_name', 'phone', 'status')),
+}
+
+
+def api_search(request):
+    """Front-desk search (staff only), newest first: ?q=, ?in=patients|cases|home-care, ?limit= (max 100)"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    target = request.GET.get('in', 'patients')
+    if target not in SEARCH_TARGETS:
+        return JsonResponse({'error': f'in must be one of {", ".join(SEARCH_TARGETS)}'}, status=400)
+    text = request.GET.get('q', '').strip()
+    if not text:
+        return JsonResponse({'error': 'q is required'}, status=400)
+    limit = min(max(_int_param(request.GET.get('limit'), 20), 1), 100)
+    model, fields = SEARCH_TARGETS[target]
+    return JsonResponse({'results': search.search(model, text, limit, fields)})
+
+
+def api_export(request, kind):
+    """
+    Streaming export (staff only): /api/export/cases/?format=csv|jsonl&from=2026-01-01&to=2026-01-31&status=Completed
+    kind: cases, archived-cases, appointments, home-care
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    dates = {}
+    for key in ('from', 'to'):
+        value = request.GET.get(key)
+        try:
+            dates[key] = parse_date(value) if value else None
+        except ValueError:  # well formed, not a date (2026-02-30)
+            dates[key] = None
+        if value and dates[key] is None:
+            return JsonResponse({'error': f'{key} must be a date (YYYY-MM-DD)'}, status=400)
+    fmt = request.GET.get('format', 'csv')
+    statuses = [status.strip() for status in request.GET.get('status', '').split(',') if status.strip()]
+    try:
+        pieces = exports.stream(kind, fmt, dates['from'], dates['to'], statuses)
+    except exports.ExportError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    response = StreamingHttpResponse(pieces, content_type=exports.FORMATS[fmt])
+    name = '-'.join([kind] + [day.isoformat() for day in dates.values() if day])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
+
 # ===============================
 # ADMIN DASHBOARD VIEW
 # ===============================
@@ -589,14 +902,14 @@ def admin_dashboard(request):
     context = {
         'total_doctors': Doctor.objects.count(),
         'total_patients': Patient.objects.count(),
-        'total_cases': EmergencyCase.objects.count(),
-        'active_cases': EmergencyCase.objects.filter(
+        'total_cases': sharding.count(EmergencyCase.objects.all()),
+        'active_cases': sharding.count(EmergencyCase.objects.filter(
             status__in=['Waiting', 'Doctor Assigned']
-        ).count(),
-        'today_appointments': Appointment.objects.filter(
+        )),
+        'today_appointments': sharding.count(Appointment.objects.filter(
             appointment_date=timezone.now().date()
-        ).count(),
-        'recent_cases': EmergencyCase.objects.order_by('-created_at')[:10],
+        )),
+        'recent_cases': sharding.collect(EmergencyCase.objects.order_by('-created_at')[:10]),
         'doctors': Doctor.objects.all(),
         'hospitals': Hospital.objects.all(),
     }
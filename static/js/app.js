@@ -126,37 +126,27 @@ function initDynamicContent() {
 /* =========================================
    API FUNCTIONS (For AJAX calls)
 ========================================= */
-async function fetchEmergencyCases() {
+async function fetchBootstrap(sections) {
+  // One round trip for every dashboard section: queue, hospitals, my_cases
   try {
-    const response = await fetch('/api/emergency-cases/');
-    const data = await response.json();
-    return data.cases;
+    const query = sections ? `?include=${sections.join(',')}` : '';
+    const response = await fetch(`/api/bootstrap/${query}`);
+    return await response.json();
   } catch (error) {
-    console.error('Error fetching emergency cases:', error);
-    return [];
+    console.error('Error fetching dashboard data:', error);
+    return {};
   }
 }
 
-async function fetchDoctorCases() {
-  try {
-    const response = await fetch('/api/doctor-cases/');
-    const data = await response.json();
-    return data.cases;
-  } catch (error) {
-    console.error('Error fetching doctor cases:', error);
-    return [];
-  }
-}
-
-async function fetchHospitals() {
-  try {
-    const response = await fetch('/api/hospitals/');
-    const data = await response.json();
-    return data.hospitals;
-  } catch (error) {
-    console.error('Error fetching hospitals:', error);
-    return [];
-  }
+async function loadDashboard() {
+  // Ask only for the sections the current page can display
+  const sections = [];
+  if (document.getElementById("queueTable")) sections.push("queue");
+  if (document.getElementById("hospitalList")) sections.push("hospitals");
+  if (document.getElementById("docPatients")) sections.push("my_cases");
+  if (!sections.length) return {};
+  
+  return await fetchBootstrap(sections);
 }
 
 /* =========================================
@@ -165,45 +155,94 @@ async function fetchHospitals() {
 function initRealTimeUpdates() {
   // This can be extended with WebSocket for real-time updates
   // For now, using polling as fallback
+  if (!document.getElementById("queueTable") && !document.getElementById("hospitalList") &&
+      !document.getElementById("docPatients")) return;
   
   const updateInterval = setInterval(async () => {
-    // Update emergency queue if on that page
-    const queueTable = document.getElementById("queueTable");
-    if (queueTable) {
-      // Optionally refresh data via AJAX
-      // const cases = await fetchEmergencyCases();
-      // renderQueueTable(cases);
-    }
+    // Refresh every dashboard section on this page in one request
+    const data = await loadDashboard();
+    if (data.queue) renderQueueTable(data.queue);
+    if (data.hospitals) renderHospitalStatus(data.hospitals);
+    if (data.my_cases) renderDoctorCases(data.my_cases);
   }, 30000); // Every 30 seconds
 }
 
 /* =========================================
    QUEUE RENDERING
 ========================================= */
+const PRIORITY_ROW = { Critical: "table-danger", High: "table-warning", Medium: "table-info" };
+const PRIORITY_BADGE = { Critical: "danger", High: "warning text-dark", Medium: "info" };
+const STATUS_BADGE = {
+  "Waiting": "secondary", "Doctor Assigned": "primary", "In Progress": "info", "Doctor En Route": "warning"
+};
+
+function escapeHtml(value) {
+  const div = document.createElement("div");
+  div.textContent = value == null ? "" : value;
+  return div.innerHTML;
+}
+
+function setCount(id, value) {
+  const element = document.getElementById(id);
+  if (element) element.textContent = value;
+}
+
 function renderQueueTable(cases) {
   const table = document.getElementById("queueTable");
   if (!table) return;
   
-  table.innerHTML = "";
+  setCount("queueWaiting", cases.filter(p => p.status === "Waiting").length);
+  setCount("queueCritical", cases.filter(p => p.priority === "Critical").length);
+  setCount("queueHigh", cases.filter(p => p.priority === "High").length);
   
-  cases.forEach((p, index) => {
-    const rowClass = p.priority === "Critical" ? "table-danger" : 
-                     p.priority === "High" ? "table-warning" : 
-                     p.priority === "Medium" ? "table-info" : "table-success";
-    
-    table.innerHTML += `
-      <tr class="${rowClass}">
-        <td>${index + 1}</td>
-        <td>${p.token}</td>
-        <td>${p.name}</td>
-        <td>${p.symptom}</td>
-        <td><strong>${p.priority}</strong></td>
-        <td>${p.status}</td>
+  if (!cases.length) {
+    table.innerHTML = `
+      <tr>
+        <td colspan="8" class="text-center text-muted py-5">
+          <i class="bi bi-inbox fs-1"></i>
+          <p class="mb-0">No active emergency cases.</p>
+        </td>
       </tr>
     `;
+    return;
+  }
+  
+  table.innerHTML = cases.map(p => `
+    <tr class="${PRIORITY_ROW[p.priority] || "table-success"}">
+      <td><strong>${p.queue_no}</strong></td>
+      <td><code>${escapeHtml(p.token)}</code></td>
+      <td>${escapeHtml(p.name)}</td>
+      <td>${escapeHtml(p.symptom)}</td>
+      <td><span class="badge bg-${PRIORITY_BADGE[p.priority] || "success"}">${escapeHtml(p.priority)}</span></td>
+      <td>${escapeHtml(p.mode)}</td>
+      <td>${p.doctor === "Unassigned" ? '<span class="text-muted">-</span>' : escapeHtml(p.doctor)}</td>
+      <td><span class="badge bg-${STATUS_BADGE[p.status] || "success"}">${escapeHtml(p.status)}</span></td>
+    </tr>
+  `).join("");
+}
+
+/* =========================================
+   HOSPITAL & DOCTOR PANELS
+========================================= */
+function renderHospitalStatus(hospitals) {
+  // Load and beds change; cards themselves (images, new hospitals) come with the page
+  hospitals.forEach(hospital => {
+    const card = document.querySelector(`.hospital-card[data-hospital-id="${hospital.id}"]`);
+    if (!card) return;
+    card.querySelector(".hospital-load").textContent = hospital.load;
+    card.querySelector(".hospital-beds").textContent = `Beds: ${hospital.available_beds}/${hospital.total_beds}`;
   });
 }
 
+function renderDoctorCases(cases) {
+  // Rows carry forms (CSRF token, case version), so reload the page when the
+  // open cases or their statuses differ from what it shows
+  const shown = Array.from(document.querySelectorAll("#docPatients tr[data-case-id]"),
+                           row => `${row.dataset.caseId}:${row.dataset.status}`);
+  const open = cases.filter(c => c.status in STATUS_BADGE).map(c => `${c.id}:${c.status}`);
+  if (shown.sort().join(",") !== open.sort().join(",")) location.reload();
+}
+
 /* =========================================
    DOCTOR DASHBOARD HELPERS
 ========================================= */
@@ -291,3 +330,18 @@ function showInstructions(symptom) {
 
 // Initialize real-time updates on page load
 document.addEventListener("DOMContentLoaded", initRealTimeUpdates);
+
+/* =========================================
+   DEVICE LOCATION (home visit dispatch)
+========================================= */
+function fillDeviceLocation() {
+  const lat = document.querySelectorAll('input[data-geo="lat"]');
+  const lng = document.querySelectorAll('input[data-geo="lng"]');
+  if (!lat.length || !navigator.geolocation) return;
+  navigator.geolocation.getCurrentPosition(position => {
+    lat.forEach(input => { input.value = position.coords.latitude; });
+    lng.forEach(input => { input.value = position.coords.longitude; });
+  }, () => {}, { maximumAge: 60000, timeout: 10000 });
+}
+
+document.addEventListener("DOMContentLoaded", fillDeviceLocation);